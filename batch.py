@@ -0,0 +1,5 @@
+from online_cognacy_ident.cli import BatchCli
+
+
+if __name__ == '__main__':
+    BatchCli().run()
@@ -0,0 +1,377 @@
+import itertools
+import json
+import multiprocessing
+import os.path
+import random
+import time
+
+import numpy as np
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+from online_cognacy_ident.clustering import METHODS, cluster
+from online_cognacy_ident.dataset import (
+        Dataset, DatasetError, PairsDataset, write_clusters)
+from online_cognacy_ident.evaluation import calc_f_score
+from online_cognacy_ident.model import ModelError, load_model, save_model
+from online_cognacy_ident.phmm import apply_phmm, train_phmm
+from online_cognacy_ident.pmi import apply_pmi, train_pmi
+
+
+
+"""
+The keys of a batch job and their default values. A job applies the model
+file at model on the dataset and clusters the output with the method and the
+threshold; the clusters are written to output, if set, and evaluated against
+the dataset's cognate classes, if evaluate is set. If the model file does not
+exist, it is first trained on the word pairs file at training with the job's
+algorithm and hyperparameters.
+
+The model and output paths can refer to the other keys, e.g.
+'output/{algorithm}/{name}.tsv', as well as to training_name, the file name
+of the training data without its extension. The name defaults to the file
+name of the dataset without its extension.
+"""
+JOB_DEFAULTS = {
+    'name': None,
+    'dataset': None,
+    'dialect': None,
+    'ipa': False,
+    'algorithm': 'pmi',
+    'model': 'models/{algorithm}/{training_name}_m={batch_size},α={alpha}.{algorithm}',
+    'training': None,
+    'initial_cutoff': 0.5,
+    'alpha': 0.75,
+    'batch_size': 256,
+    'random_seed': 42,
+    'method': 'infomap',
+    'threshold': 0.5,
+    'output': None,
+    'evaluate': True}
+
+
+"""
+The keys of the result dicts returned by run_batch, i.e. the columns of the
+consolidated results table.
+"""
+RESULT_COLUMNS = ['name', 'algorithm', 'batch_size', 'alpha', 'method',
+        'threshold', 'train_sec', 'score_sec', 'cluster_sec', 'f_score']
+
+
+
+class BatchError(ValueError):
+    """
+    Raised when something goes wrong with reading or running a batch of jobs.
+    """
+    pass
+
+
+
+def read_spec(path):
+    """
+    Read a batch file into a {defaults, matrix, jobs} dict, see expand_jobs.
+    The file should be in JSON or, if its extension is .yaml or .yml and
+    PyYAML is installed, in YAML. Raise a BatchError if the file cannot be
+    opened or read.
+    """
+    is_yaml = path.endswith(('.yaml', '.yml'))
+
+    if is_yaml and yaml is None:
+        raise BatchError('PyYAML is needed to read batch file: {}'.format(path))
+
+    errors = (ValueError, yaml.YAMLError) if is_yaml else ValueError
+
+    try:
+        with open(path, encoding='utf-8') as f:
+            spec = yaml.safe_load(f) if is_yaml else json.load(f)
+    except OSError:
+        raise BatchError('Could not open batch file: {}'.format(path))
+    except errors:
+        raise BatchError('Could not read batch file: {}'.format(path))
+
+    if not isinstance(spec, dict):
+        raise BatchError('Could not read batch file: {}'.format(path))
+
+    return spec
+
+
+
+def expand_jobs(spec):
+    """
+    Return the [] of job dicts, with all the keys of JOB_DEFAULTS, that a
+    {defaults, matrix, jobs} dict describes. All three keys are optional:
+    defaults is a dict overriding JOB_DEFAULTS for all the jobs, matrix is a
+    {key: [values]} dict that yields a job for each combination of values,
+    and jobs is a [] of dicts each of which yields a job of its own. Raise a
+    BatchError if a key or a value is invalid.
+    """
+    for key in spec:
+        if key not in ['defaults', 'matrix', 'jobs']:
+            raise BatchError('Unknown batch file key: {}'.format(key))
+
+    entries = []
+
+    matrix = spec.get('matrix') or {}
+    if matrix:
+        keys = list(matrix.keys())
+        values = [value if isinstance(value, list) else [value]
+                for value in matrix.values()]
+        entries.extend([dict(zip(keys, combination))
+                for combination in itertools.product(*values)])
+
+    entries.extend(spec.get('jobs') or [])
+
+    defaults = spec.get('defaults') or {}
+    jobs = []
+
+    for entry in [defaults] + entries:
+        for key in entry:
+            if key not in JOB_DEFAULTS:
+                raise BatchError('Unknown job key: {}'.format(key))
+
+    for entry in entries:
+        job = dict(JOB_DEFAULTS, **defaults)
+        job.update(entry)
+
+        if job['dataset'] is None:
+            raise BatchError('No dataset given for job: {}'.format(entry))
+
+        if job['algorithm'] not in ['pmi', 'phmm']:
+            raise BatchError('Unknown algorithm: {}'.format(job['algorithm']))
+
+        if job['method'] not in METHODS:
+            raise BatchError('Unknown clustering method: {}'.format(job['method']))
+
+        if job['name'] is None:
+            job['name'] = os.path.splitext(os.path.basename(job['dataset']))[0]
+
+        fields = dict(job, training_name=os.path.splitext(
+                os.path.basename(job['training'] or ''))[0])
+
+        try:
+            for key in ['model', 'output']:
+                if job[key] is not None:
+                    job[key] = job[key].format(**fields)
+        except (KeyError, IndexError, ValueError):
+            raise BatchError('Invalid path template: {}'.format(job[key]))
+
+        jobs.append(job)
+
+    return jobs
+
+
+
+def read_dataset(path, dialect=None, is_ipa=False, cog_sets=False):
+    """
+    Read a dataset file into a WordsDataset, so that it can be shared by
+    several jobs without being read again. The latter has the same words,
+    alphabet and equilibrium counts as the file's Dataset; if cog_sets is
+    set, it also provides get_clusters. Raise a DatasetError if there is a
+    problem reading the file.
+    """
+    dataset = Dataset(path, dialect, is_ipa)
+    return dataset.get_subset(set(dataset.get_concept_sizes()), cog_sets=cog_sets)
+
+
+
+_shared = None  # the {key: dataset or model} dict of the batch worker processes
+
+
+
+def _init_worker(shared):
+    """
+    Store the datasets and the models in the (worker) process, so that these
+    are only read once rather than once per job.
+
+    Helper for run_batch.
+    """
+    global _shared
+    _shared = shared
+
+
+
+def _train_model(job):
+    """
+    Train the model of a job on the training data stored by _init_worker and
+    save it to the job's model path. Both the random module and NumPy's are
+    seeded with the job's random_seed. Return a (training time, error
+    message) tuple, one of which is None.
+
+    Helper for run_batch.
+    """
+    start_time = time.perf_counter()
+
+    random.seed(job['random_seed'])
+    np.random.seed(job['random_seed'])
+
+    dataset = _shared[('training', job['training'])]
+    train_func = train_phmm if job['algorithm'] == 'phmm' else train_pmi
+
+    try:
+        *model, state = train_func(dataset, initial_cutoff=job['initial_cutoff'],
+                alpha=job['alpha'], batch_size=job['batch_size'], return_state=True)
+
+        if job['algorithm'] == 'phmm':
+            model.append(dataset.get_alphabet())
+        else:
+            model = model[0]
+
+        hyperparams = {
+            'initial_cutoff': job['initial_cutoff'],
+            'alpha': job['alpha'],
+            'batch_size': job['batch_size'],
+            'random_seed': job['random_seed'],
+            'dataset': os.path.basename(job['training']),
+            'num_updates': state['num_updates']}
+
+        os.makedirs(os.path.dirname(job['model']) or '.', exist_ok=True)
+        save_model(job['model'], job['algorithm'], model, hyperparams)
+    except (DatasetError, ModelError, OSError, ValueError) as err:
+        return None, str(err)
+
+    return time.perf_counter() - start_time, None
+
+
+
+def _run_job(job):
+    """
+    Score, cluster, write and evaluate the dataset of a job with its model,
+    both as stored by _init_worker. Return a (result dict, error message)
+    tuple, one of which is None; the result's timings are in seconds.
+
+    Helper for run_batch.
+    """
+    dataset = _shared[('dataset', job['dataset'], job['dialect'], job['ipa'])]
+    algorithm, params = _shared[('model', job['model'])]
+
+    try:
+        start_time = time.perf_counter()
+
+        if algorithm == 'phmm':
+            scores = apply_phmm(dataset, *params)
+        else:
+            scores = apply_pmi(dataset, params)
+
+        score_time = time.perf_counter()
+
+        clusters = cluster(dataset, scores,
+                threshold=job['threshold'], method=job['method'])
+
+        cluster_time = time.perf_counter()
+
+        if job['output']:
+            os.makedirs(os.path.dirname(job['output']) or '.', exist_ok=True)
+            write_clusters(clusters, job['output'])
+
+        if job['evaluate']:
+            f_score = calc_f_score(dataset.get_clusters(), clusters)
+        else:
+            f_score = None
+    except (DatasetError, OSError) as err:
+        return None, str(err)
+
+    return {
+        'name': job['name'],
+        'algorithm': job['algorithm'],
+        'batch_size': job['batch_size'],
+        'alpha': job['alpha'],
+        'method': job['method'],
+        'threshold': job['threshold'],
+        'train_sec': None,
+        'score_sec': score_time - start_time,
+        'cluster_sec': cluster_time - score_time,
+        'f_score': f_score}, None
+
+
+
+def _map(func, tasks, shared, num_workers=1):
+    """
+    Call func on each of the tasks, in that many worker processes if
+    num_workers is more than 1, with the shared dict stored by _init_worker.
+    Return the [] of results in the order of the tasks. Raise a BatchError
+    with the first error message returned.
+
+    Helper for run_batch.
+    """
+    try:
+        if num_workers > 1 and len(tasks) > 1:
+            with multiprocessing.Pool(min(num_workers, len(tasks)),
+                    _init_worker, (shared,)) as pool:
+                results = pool.map(func, tasks, chunksize=1)
+        else:
+            _init_worker(shared)
+            results = [func(task) for task in tasks]
+    finally:
+        _init_worker(None)
+
+    for _, error in results:
+        if error is not None:
+            raise BatchError(error)
+
+    return [result for result, _ in results]
+
+
+
+def run_batch(jobs, num_workers=1, allow_pickle=False):
+    """
+    Run the jobs returned by expand_jobs in that many worker processes and
+    return the [] of their result dicts, in the same order; the keys are
+    those of RESULT_COLUMNS. Raise a BatchError, a DatasetError or a
+    ModelError if something goes wrong.
+
+    The jobs' missing models are trained first, each training data file being
+    read once for all of them. Then each model and each dataset is read once
+    and shared by all the jobs that use it, the jobs on the largest datasets
+    being started first. The train_sec of a result is the time it took to
+    train the job's model, if it was trained by this batch.
+    """
+    train_jobs = {}  # {model path: job}
+
+    for job in jobs:
+        if os.path.exists(job['model']) or job['model'] in train_jobs:
+            continue
+
+        if job['training'] is None:
+            raise BatchError('Could not find model file: {}'.format(job['model']))
+
+        train_jobs[job['model']] = job
+
+    shared = {}
+    for job in train_jobs.values():
+        if ('training', job['training']) not in shared:
+            shared[('training', job['training'])] = PairsDataset(job['training']).preload()
+
+    train_times = dict(zip(train_jobs.keys(),
+            _map(_train_model, list(train_jobs.values()), shared, num_workers)))
+
+    dataset_keys = [('dataset', job['dataset'], job['dialect'], job['ipa'])
+            for job in jobs]
+    evaluated = set([key for key, job in zip(dataset_keys, jobs) if job['evaluate']])
+
+    shared = {}
+    for job, dataset_key in zip(jobs, dataset_keys):
+        model_key = ('model', job['model'])
+        if model_key not in shared:
+            shared[model_key] = load_model(job['model'], allow_pickle=allow_pickle)
+
+        if shared[model_key][0] != job['algorithm']:
+            raise BatchError('Not a {} model: {}'.format(job['algorithm'], job['model']))
+
+        if dataset_key not in shared:
+            shared[dataset_key] = read_dataset(*dataset_key[1:],
+                    cog_sets=dataset_key in evaluated)
+
+    order = sorted(range(len(jobs)),
+            key=lambda index: -len(shared[dataset_keys[index]].words))
+
+    results = [None] * len(jobs)
+
+    for index, result in zip(order, _map(_run_job,
+                [jobs[index] for index in order], shared, num_workers)):
+        result['train_sec'] = train_times.get(jobs[index]['model'])
+        results[index] = result
+
+    return results
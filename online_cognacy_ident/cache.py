@@ -0,0 +1,321 @@
+import collections
+import os.path
+import sqlite3
+
+
+
+"""
+The SQL statements creating the tables of a score cache file. Models are
+stored once and referred to by their row id, so that each score only costs
+two transcriptions and two numbers.
+"""
+CACHE_SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS models ('
+        'id INTEGER PRIMARY KEY, fingerprint TEXT NOT NULL UNIQUE)',
+    'CREATE TABLE IF NOT EXISTS scores ('
+        'model INTEGER NOT NULL, a TEXT NOT NULL, b TEXT NOT NULL, '
+        'distance REAL NOT NULL, used INTEGER NOT NULL, '
+        'PRIMARY KEY (model, a, b)) WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS scores_used ON scores (used)']
+
+
+
+class CacheError(ValueError):
+    """
+    Raised when something goes wrong with opening or using a score cache.
+    """
+    pass
+
+
+
+class ScoreCache:
+    """
+    Persistent cache of the distances between pairs of ASJP transcriptions,
+    keyed by the fingerprint of the model (see the get_fingerprint methods of
+    the scorers) and the transcription pair, and stored in an SQLite file so
+    that it can be shared by runs and processes.
+
+    An in-process LRU dict of up to memory_size scores sits in front of the
+    file. New scores are written in batches; once the file holds more than
+    max_size scores, the least recently used ones are evicted. Scores read
+    from the file are marked as used when the cache is flushed.
+
+    Usage:
+
+        with ScoreCache(path) as cache:
+            scores = apply_pmi(dataset, pmi, cache=cache)
+            print(cache.get_stats()['hit_rate'])
+    """
+
+    def __init__(self, path, max_size=10000000, memory_size=262144, write_every=10000):
+        """
+        Open the cache file, creating it if it does not exist. Raise a
+        CacheError if it cannot be opened or is not a cache file.
+        """
+        self.path = path
+        self.max_size = max_size
+        self.memory_size = memory_size
+        self.write_every = write_every
+
+        self.memory = collections.OrderedDict()  # {(model id, a, b): distance}
+        self.pending = {}  # {(model id, a, b): distance} not yet written
+        self.touched = set()  # {(model id, a, b)} read from the file
+        self.model_ids = {}  # {fingerprint: model id}
+
+        self.stats = {'lookups': 0, 'hits': 0, 'misses': 0,
+                'reads': 0, 'writes': 0, 'evicted': 0}
+
+        try:
+            self.conn = sqlite3.connect(path, timeout=60)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            for statement in CACHE_SCHEMA:
+                self.conn.execute(statement)
+            self.conn.commit()
+        except sqlite3.Error:
+            raise CacheError('Could not open cache file: {}'.format(path))
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    def get_model_id(self, fingerprint):
+        """
+        Return the row id of a model fingerprint, adding it if it is new.
+        """
+        if fingerprint not in self.model_ids:
+            try:
+                self.conn.execute(
+                    'INSERT OR IGNORE INTO models (fingerprint) VALUES (?)', (fingerprint,))
+                row = self.conn.execute(
+                    'SELECT id FROM models WHERE fingerprint = ?', (fingerprint,)).fetchone()
+                self.conn.commit()
+            except sqlite3.Error:
+                raise CacheError('Could not use cache file: {}'.format(self.path))
+
+            self.model_ids[fingerprint] = row[0]
+
+        return self.model_ids[fingerprint]
+
+
+    def _remember(self, key, distance):
+        """
+        Add a score to the in-process LRU dict, dropping the least recently
+        used one if the dict is full.
+
+        Helper for the get, prefetch and put methods.
+        """
+        self.memory[key] = distance
+        self.memory.move_to_end(key)
+
+        if len(self.memory) > self.memory_size:
+            self.memory.popitem(last=False)
+
+
+    def prefetch(self, model_id, pairs):
+        """
+        Read the scores of the given (a, b) pairs that are in the file but not
+        in memory into the latter, with a single query rather than one per
+        pair. Prefetching does not count as lookups.
+        """
+        pairs = [pair for pair in set(pairs) if (model_id,) + pair not in self.memory]
+        if not pairs:
+            return
+
+        try:
+            self.conn.execute('CREATE TEMP TABLE IF NOT EXISTS wanted (a TEXT, b TEXT)')
+            self.conn.execute('DELETE FROM wanted')
+            self.conn.executemany('INSERT INTO wanted VALUES (?, ?)', pairs)
+            rows = self.conn.execute(
+                'SELECT scores.a, scores.b, scores.distance FROM wanted '
+                'JOIN scores ON scores.model = ? AND scores.a = wanted.a '
+                'AND scores.b = wanted.b', (model_id,)).fetchall()
+        except sqlite3.Error:
+            raise CacheError('Could not read cache file: {}'.format(self.path))
+
+        for a, b, distance in rows:
+            self._remember((model_id, a, b), distance)
+            self.touched.add((model_id, a, b))
+
+        self.stats['reads'] += len(rows)
+
+
+    def get(self, model_id, a, b):
+        """
+        Return the cached distance of the (a, b) pair under the model, or None
+        if it is not cached. The pair is not normalised; see CachedScorer.
+        """
+        key = (model_id, a, b)
+        self.stats['lookups'] += 1
+
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.stats['hits'] += 1
+            return self.memory[key]
+
+        if key in self.pending:
+            self.stats['hits'] += 1
+            return self.pending[key]
+
+        try:
+            row = self.conn.execute(
+                'SELECT distance FROM scores WHERE model = ? AND a = ? AND b = ?',
+                key).fetchone()
+        except sqlite3.Error:
+            raise CacheError('Could not read cache file: {}'.format(self.path))
+
+        if row is None:
+            self.stats['misses'] += 1
+            return None
+
+        self._remember(key, row[0])
+        self.touched.add(key)
+
+        self.stats['reads'] += 1
+        self.stats['hits'] += 1
+
+        return row[0]
+
+
+    def put(self, model_id, a, b, distance):
+        """
+        Cache the distance of the (a, b) pair under the model. The file is
+        only written to every write_every new scores and on flush.
+        """
+        key = (model_id, a, b)
+
+        self._remember(key, distance)
+        self.pending[key] = distance
+
+        if len(self.pending) >= self.write_every:
+            self.flush()
+
+
+    def flush(self):
+        """
+        Write the new scores to the file, mark the ones read from it as used,
+        and evict the least recently used scores if the file holds more than
+        max_size of them.
+        """
+        try:
+            # each score written or read gets its own tick of a counter kept
+            # in the file, so that exactly the oldest ones can be evicted
+            last_used = self.conn.execute(
+                    'SELECT COALESCE(MAX(used), 0) FROM scores').fetchone()[0]
+            touched = list(self.touched - self.pending.keys())
+
+            self.conn.executemany(
+                'UPDATE scores SET used = ? WHERE model = ? AND a = ? AND b = ?',
+                [(last_used + i,) + key for i, key in enumerate(touched, 1)])
+            last_used += len(touched)
+
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?, ?)',
+                [key + (distance, last_used + i)
+                    for i, (key, distance) in enumerate(self.pending.items(), 1)])
+
+            self.stats['writes'] += len(self.pending)
+            self.pending = {}
+            self.touched = set()
+
+            num_scores = self.conn.execute('SELECT COUNT(*) FROM scores').fetchone()[0]
+            if num_scores > self.max_size:
+                cursor = self.conn.execute(
+                    'DELETE FROM scores WHERE used <= ('
+                    'SELECT used FROM scores ORDER BY used LIMIT 1 OFFSET ?)',
+                    (num_scores - self.max_size - 1,))
+                self.stats['evicted'] += cursor.rowcount
+
+            self.conn.commit()
+        except sqlite3.Error:
+            raise CacheError('Could not write cache file: {}'.format(self.path))
+
+
+    def get_stats(self):
+        """
+        Return a dict with the number of lookups, hits and misses, the hit
+        rate, the numbers of scores read from, written to and evicted from the
+        file, and the number of scores in the file and its size in bytes.
+        """
+        stats = dict(self.stats)
+        stats['hit_rate'] = stats['hits'] / stats['lookups'] if stats['lookups'] else 0.0
+
+        try:
+            stats['size'] = self.conn.execute('SELECT COUNT(*) FROM scores').fetchone()[0]
+        except sqlite3.Error:
+            raise CacheError('Could not read cache file: {}'.format(self.path))
+
+        stats['bytes'] = sum([os.path.getsize(path) for path in [self.path, self.path + '-wal']
+                if os.path.exists(path)])
+
+        return stats
+
+
+    def close(self):
+        """
+        Flush the cache and close the file.
+        """
+        if self.conn is not None:
+            self.flush()
+            self.conn.close()
+            self.conn = None
+
+
+
+class CachedScorer:
+    """
+    Wraps a scorer, as returned by model.get_scorer, so that its distances
+    are looked up in and added to a ScoreCache. The transcription pairs are
+    sorted before the lookup if the scorer is symmetric, so that (a, b) and
+    (b, a) share one entry; phmm scorers are not, as their gap probabilities
+    need not be.
+
+    Usage:
+
+        scorer = CachedScorer(get_scorer(algorithm, params, dataset), cache)
+        distance = scorer('mano', 'manu')
+    """
+
+    def __init__(self, scorer, cache):
+        """
+        The scorer should provide the get_fingerprint method and the
+        symmetric and similarity attributes.
+        """
+        self.scorer = scorer
+        self.cache = cache
+        self.symmetric = scorer.symmetric
+        self.similarity = scorer.similarity
+        self.model_id = cache.get_model_id(scorer.get_fingerprint())
+
+
+    def get_key(self, asjp1, asjp2):
+        """
+        Return the (a, b) cache key of a transcription pair.
+        """
+        if self.symmetric and asjp2 < asjp1:
+            return asjp2, asjp1
+
+        return asjp1, asjp2
+
+
+    def prefetch(self, pairs):
+        """
+        Read the cached scores of the given transcription pairs, if any, into
+        memory; see ScoreCache.prefetch.
+        """
+        self.cache.prefetch(self.model_id, [self.get_key(a, b) for a, b in pairs])
+
+
+    def __call__(self, asjp1, asjp2):
+        a, b = self.get_key(asjp1, asjp2)
+
+        distance = self.cache.get(self.model_id, a, b)
+        if distance is None:
+            distance = self.scorer(asjp1, asjp2)
+            self.cache.put(self.model_id, a, b, distance)
+
+        return distance
@@ -0,0 +1,261 @@
+import json
+import sys
+import time
+
+from tqdm import tqdm
+
+
+
+class Callback:
+    """
+    Base class of the training callbacks that train_pmi and train_phmm accept.
+    Subclasses override the hooks they need; each hook receives an info dict
+    with the following keys, where applicable:
+
+        epoch: the zero-based number of the pass over the word pairs
+        batch: the number of batches trained on, including those of a resumed
+            or warm-started training
+        batch_pairs: the number of word pairs in the batch
+        epoch_pairs: the number of word pairs of the epoch
+        pairs: the number of word pairs trained on since the training started
+            (or was resumed)
+        pruned: the number of word pairs kept for the next epoch so far (pmi
+            only, as phmm does not prune)
+        ll: the model's log-likelihood of the word pairs (phmm only)
+        delta: the log-likelihood's change since the previous epoch (phmm) or
+            the largest change of a PMI score during the epoch (pmi)
+        converged: whether the training stops after the check
+        elapsed_sec: the seconds since the training started (or was resumed)
+        epoch_sec: the seconds the epoch's batches took
+        pairs_per_sec: pairs divided by elapsed_sec
+
+    Usage:
+
+        class Printer(Callback):
+            def on_epoch_end(self, info):
+                print(info['epoch'], info['pairs_per_sec'])
+
+        train_pmi(dataset, callbacks=[Printer()])
+    """
+
+    def on_batch_end(self, info):
+        """
+        Called after each batch with the epoch, batch, batch_pairs,
+        epoch_pairs, pairs, pruned, elapsed_sec and pairs_per_sec keys.
+        """
+        pass
+
+
+    def on_epoch_end(self, info):
+        """
+        Called after the last batch of each epoch with the epoch, batch,
+        epoch_pairs, pairs, pruned, elapsed_sec, epoch_sec and pairs_per_sec
+        keys.
+        """
+        pass
+
+
+    def on_convergence_check(self, info):
+        """
+        Called after each epoch's convergence check with the epoch, ll, delta,
+        converged and elapsed_sec keys. The pmi training always runs for a
+        fixed number of epochs, so it is only converged after the last one.
+        """
+        pass
+
+
+    def on_train_end(self, info):
+        """
+        Called once the training is over with the batch, pairs, elapsed_sec
+        and pairs_per_sec keys.
+        """
+        pass
+
+
+
+class CallbackList(Callback):
+    """
+    Calls the hooks of a list of callbacks, in order, and keeps track of the
+    counts and timings that the trainers pass on to them.
+
+    Usage:
+
+        callbacks = CallbackList(callbacks)
+        callbacks.start()
+        callbacks.on_batch_end(callbacks.get_info(epoch=0, batch_pairs=256))
+    """
+
+    def __init__(self, callbacks=None):
+        """
+        Init the list. The arg can also be a single Callback or None.
+        """
+        if callbacks is None:
+            callbacks = []
+        elif isinstance(callbacks, Callback):
+            callbacks = [callbacks]
+
+        self.callbacks = list(callbacks)
+        self.start_time = None
+        self.pairs = 0
+
+
+    def __bool__(self):
+        return len(self.callbacks) > 0
+
+
+    def start(self):
+        """
+        Start the clock and the count of processed pairs.
+        """
+        self.start_time = time.perf_counter()
+        self.pairs = 0
+
+
+    def get_info(self, **info):
+        """
+        Return the given info dict with the pairs, elapsed_sec and
+        pairs_per_sec keys added. The batch_pairs key, if given, is added to
+        the count of processed pairs first.
+        """
+        self.pairs += info.get('batch_pairs', 0)
+        elapsed = time.perf_counter() - self.start_time
+
+        info.update(pairs=self.pairs, elapsed_sec=elapsed,
+                pairs_per_sec=self.pairs / elapsed if elapsed > 0 else 0.0)
+
+        return info
+
+
+    def on_batch_end(self, info):
+        for callback in self.callbacks:
+            callback.on_batch_end(info)
+
+
+    def on_epoch_end(self, info):
+        for callback in self.callbacks:
+            callback.on_epoch_end(info)
+
+
+    def on_convergence_check(self, info):
+        for callback in self.callbacks:
+            callback.on_convergence_check(info)
+
+
+    def on_train_end(self, info):
+        for callback in self.callbacks:
+            callback.on_train_end(info)
+
+
+
+class ProgressReporter(Callback):
+    """
+    Shows a tqdm progress bar of each epoch's word pairs, along with the
+    throughput and, for pmi, the number of pairs kept for the next epoch; the
+    convergence checks are printed below the bars.
+    """
+
+    def __init__(self, file=sys.stderr):
+        """
+        Set the stream to show the progress bars on.
+        """
+        self.file = file
+        self.bar = None
+
+
+    def on_batch_end(self, info):
+        if self.bar is None:
+            self.bar = tqdm(total=info['epoch_pairs'], unit='pairs', file=self.file,
+                    desc='epoch {}'.format(info['epoch'] + 1))
+
+        self.bar.update(info['batch_pairs'])
+
+        postfix = {'pairs/s': '{:.0f}'.format(info['pairs_per_sec'])}
+        if info['pruned'] is not None:
+            postfix['kept'] = info['pruned']
+        self.bar.set_postfix(**postfix)
+
+
+    def on_epoch_end(self, info):
+        if self.bar is not None:
+            self.bar.close()
+            self.bar = None
+
+
+    def on_convergence_check(self, info):
+        message = 'epoch {}: '.format(info['epoch'] + 1)
+
+        if info['ll'] is not None:
+            message += 'log-likelihood {:.6g}, '.format(info['ll'])
+
+        if info['delta'] is not None:
+            message += 'delta {:.6g}, '.format(info['delta'])
+
+        message += 'converged' if info['converged'] else 'not converged'
+
+        tqdm.write(message, file=self.file)
+
+
+    def on_train_end(self, info):
+        self.on_epoch_end(info)
+
+
+
+class MetricsWriter(Callback):
+    """
+    Writes each hook call as a line of JSON with the event name, the time and
+    the info dict, e.g. in order to monitor the throughput of a training or
+    to compare runs. The file is line-buffered, so that it can be followed
+    while the training is running.
+
+    Usage:
+
+        with MetricsWriter(path) as writer:
+            train_phmm(dataset, callbacks=[writer])
+    """
+
+    def __init__(self, path, batch_every=1):
+        """
+        Open the file for writing. Only every batch_every-th batch is written.
+        Raise an OSError if the file cannot be opened.
+        """
+        self.batch_every = batch_every
+        self.f = open(path, 'w', encoding='utf-8', buffering=1)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    def write(self, event, info):
+        """
+        Write an event's line.
+        """
+        self.f.write(json.dumps(dict(info, event=event, time=time.time())) + '\n')
+
+
+    def on_batch_end(self, info):
+        if info['batch'] % self.batch_every == 0:
+            self.write('batch_end', info)
+
+
+    def on_epoch_end(self, info):
+        self.write('epoch_end', info)
+
+
+    def on_convergence_check(self, info):
+        self.write('convergence_check', info)
+
+
+    def on_train_end(self, info):
+        self.write('train_end', info)
+
+
+    def close(self):
+        """
+        Close the file.
+        """
+        self.f.close()
@@ -1,15 +1,40 @@
 import argparse
 import csv
+import glob
+import json
+import multiprocessing
+import os.path
 import random
+import sys
 import time
 
-from online_cognacy_ident.clustering import cluster
+import numpy as np
+
+from online_cognacy_ident.batch import (
+        RESULT_COLUMNS, BatchError, expand_jobs, read_dataset, read_spec, run_batch)
+from online_cognacy_ident.cache import CacheError, CachedScorer, ScoreCache
+from online_cognacy_ident.callbacks import MetricsWriter, ProgressReporter
+from online_cognacy_ident.clustering import (
+        METHODS, cluster, knn_cluster, sweep, update_clusters)
 from online_cognacy_ident.dataset import (
-        Dataset, PairsDataset, DatasetError, write_clusters)
-from online_cognacy_ident.evaluation import calc_f_score
-from online_cognacy_ident.model import save_model, load_model, ModelError
+        Dataset, PairsDataset, DatasetError, ClusterWriter,
+        assign_shards, clean_transcription, merge_clusters, write_clusters)
+from online_cognacy_ident.evaluation import (
+        METRICS, bootstrap, calc_concept_f_scores, calc_f_score,
+        evaluate, paired_bootstrap, summarise)
+from online_cognacy_ident.model import (
+        save_model, load_model, load_model_header, get_scorer, ModelError,
+        Checkpointer, load_checkpoint)
 from online_cognacy_ident.phmm import train_phmm, apply_phmm
 from online_cognacy_ident.pmi import train_pmi, apply_pmi
+from online_cognacy_ident.profiling import CAN_TRACE_MEMORY, Profiler, stage
+from online_cognacy_ident.scores import (
+        Scores, ScoresError, get_dataset_hash, get_file_hash, load_scores,
+        load_scores_header, save_scores, update_scores)
+from online_cognacy_ident.search import NUM_CANDIDATES, QueryError, WordIndex
+from online_cognacy_ident.server import (
+        SERVER_METHODS, ScoringService, TCPServer, UnixServer)
+from online_cognacy_ident.tune import TUNE_COLUMNS, get_configs, get_model, tune
 
 
 
@@ -34,6 +59,107 @@ def number_in_interval(number, type, interval):
 
 
 
+def shard_spec(spec):
+    """
+    Parse a K/N shard spec into a (zero-based shard index, number of shards)
+    tuple. Raise an ArgumentTypeError if the spec is invalid.
+
+    Helper for RunCli's ArgumentParser instance.
+    """
+    try:
+        index, num_shards = [int(part) for part in spec.split('/')]
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid shard value: {!r}'.format(spec))
+
+    if not 1 <= index <= num_shards:
+        raise argparse.ArgumentTypeError(
+                'shard {} not in interval [1; {}]'.format(index, num_shards))
+
+    return index - 1, num_shards
+
+
+
+def add_profiling_args(parser):
+    """
+    Add the profiling options to an ArgumentParser instance.
+
+    Helper for TrainCli and RunCli.
+    """
+    profile_args = parser.add_argument_group('optional arguments - profiling')
+    profile_args.add_argument(
+        '--profile',
+        action='store_true',
+        help=(
+            'print the time and number of calls of each stage (reading, ipa '
+            'conversion, pair generation, training, scoring, clustering, '
+            'writing, evaluation) and the per-epoch and per-batch training '
+            'times to stderr at the end'))
+    profile_args.add_argument(
+        '--profile-json',
+        help='path where to write the profiling report as json')
+    profile_args.add_argument(
+        '--profile-memory',
+        action='store_true',
+        help=(
+            'also report the peak memory of each stage, as traced by '
+            'tracemalloc; this makes the programme considerably slower '
+            'and requires Python 3.9 or later'))
+    profile_args.add_argument(
+        '--cprofile',
+        help=(
+            'path where to dump the cProfile stats of the whole run, '
+            'e.g. for use with pstats or snakeviz'))
+
+
+
+def start_profiler(parser, args):
+    """
+    Start and return a Profiler if any of the profiling options is set;
+    otherwise return None. Exit with an error if --profile-memory is set but
+    the Python version cannot trace the memory of the stages.
+
+    Helper for TrainCli and RunCli.
+    """
+    if not (args.profile or args.profile_json or args.profile_memory or args.cprofile):
+        return None
+
+    if args.profile_memory and not CAN_TRACE_MEMORY:
+        parser.error('--profile-memory requires Python 3.9 or later')
+
+    profiler = Profiler(args.profile_memory, args.cprofile)
+    profiler.start()
+
+    return profiler
+
+
+
+def stop_profiler(parser, profiler, args):
+    """
+    Stop the profiler returned by start_profiler, if any, and print and/or
+    write its report as asked for.
+
+    Helper for TrainCli and RunCli.
+    """
+    if profiler is None:
+        return
+
+    try:
+        profiler.stop()
+    except OSError:
+        parser.error('Could not write file: {}'.format(args.cprofile))
+
+    if args.profile or args.profile_memory:
+        print(profiler.format_table(), file=sys.stderr)
+
+    if args.profile_json:
+        try:
+            with open(args.profile_json, 'w', encoding='utf-8') as f:
+                json.dump(profiler.get_report(), f, indent=2)
+        except OSError:
+            parser.error('Could not write file: {}'.format(args.profile_json))
+
+
+
 class TrainCli:
     """
     Handles the user input, invokes the necessary functions, and takes care of
@@ -122,6 +248,60 @@ class TrainCli:
                 'convert input transcriptions from IPA to ASJP; '
                 'by default these are assumed to be ASJP'))
 
+        state_args = self.parser.add_argument_group('optional arguments - checkpoints')
+        state_args.add_argument(
+            '--checkpoint',
+            help=(
+                'path where to periodically save the training state, so that '
+                'an interrupted training can be continued with --resume'))
+        state_args.add_argument(
+            '--checkpoint-every',
+            type=lambda x: number_in_interval(x, int, [1, float('inf')]),
+            help='save the training state every this many batches')
+        state_args.add_argument(
+            '--checkpoint-interval',
+            type=lambda x: number_in_interval(x, float, [0, float('inf')]),
+            help=(
+                'save the training state every this many seconds; the default '
+                'is 600 unless --checkpoint-every is set'))
+        state_args.add_argument(
+            '--resume',
+            help=(
+                'path to a checkpoint to continue the training from; the '
+                'result is the same as that of an uninterrupted training, '
+                'provided that the same dataset and hyperparameters are used'))
+        state_args.add_argument(
+            '--init-model',
+            help=(
+                'path to a trained model to warm-start the training from, '
+                'e.g. in order to continue training it on new data'))
+        state_args.add_argument(
+            '--allow-pickle',
+            action='store_true',
+            help=(
+                'allow the --init-model to be a pickle file saved by an older '
+                'version; only use this for files from a trusted source'))
+
+        monitor_args = self.parser.add_argument_group('optional arguments - monitoring')
+        monitor_args.add_argument(
+            '--progress',
+            action='store_true',
+            help=(
+                'show a progress bar of each epoch with the throughput, and '
+                'the log-likelihood or change of the model after each epoch'))
+        monitor_args.add_argument(
+            '--metrics',
+            help=(
+                'path where to write the training metrics as JSON lines, one '
+                'per batch, epoch and convergence check'))
+        monitor_args.add_argument(
+            '--metrics-every',
+            type=lambda x: number_in_interval(x, int, [1, float('inf')]),
+            default=1,
+            help='only write the metrics of every this many batches; the default is 1')
+
+        add_profiling_args(self.parser)
+
         other_args = self.parser.add_argument_group('optional arguments - other')
         other_args.add_argument(
             '-h', '--help',
@@ -142,6 +322,7 @@ class TrainCli:
 
         random.seed(args.random_seed)
         start_time = time.time()
+        profiler = start_profiler(self.parser, args)
 
         try:
             if args.dataset_type == 'pairs':
@@ -155,18 +336,115 @@ class TrainCli:
                     args.algorithm.upper(), args.dataset,
                     'yes' if args.ipa else 'no', args.batch_size, args.alpha))
 
+        state = self.get_initial_state(args)
+
+        hyperparams = {
+            'initial_cutoff': args.initial_cutoff,
+            'alpha': args.alpha,
+            'batch_size': args.batch_size,
+            'random_seed': args.random_seed,
+            'dataset': os.path.basename(args.dataset)}
+
+        if args.checkpoint:
+            interval = args.checkpoint_interval
+            if interval is None and args.checkpoint_every is None:
+                interval = 600
+            checkpoint = Checkpointer(args.checkpoint, args.algorithm,
+                    args.checkpoint_every, interval, hyperparams)
+        else:
+            checkpoint = None
+
+        callbacks = []
+        if args.progress:
+            callbacks.append(ProgressReporter())
+        if args.metrics:
+            try:
+                callbacks.append(MetricsWriter(args.metrics, args.metrics_every))
+            except OSError as err:
+                self.parser.error('Could not write metrics file: {}'.format(err))
+
         train_func = train_phmm if args.algorithm == 'phmm' else train_pmi
-        model = train_func(
-                    dataset, initial_cutoff=args.initial_cutoff,
-                    alpha=args.alpha, batch_size=args.batch_size)
+
+        try:
+            *model, final_state = train_func(
+                        dataset, initial_cutoff=args.initial_cutoff,
+                        alpha=args.alpha, batch_size=args.batch_size,
+                        state=state, checkpoint=checkpoint, return_state=True,
+                        callbacks=callbacks)
+        except (ModelError, ValueError) as err:
+            self.parser.error(str(err))
+        finally:
+            for callback in callbacks:
+                if isinstance(callback, MetricsWriter):
+                    callback.close()
+
+        if args.algorithm == 'phmm':
+            model.append(dataset.get_alphabet())
+        else:
+            model = model[0]
+
+        hyperparams['num_updates'] = final_state['num_updates']
+
         try:
-            save_model(args.output, args.algorithm, model)
+            with stage('writing'):
+                save_model(args.output, args.algorithm, model, hyperparams)
         except ModelError as err:
             self.parser.error(str(err))
 
         if args.time:
             print('training time: {:.2f} sec'.format(time.time() - start_time))
 
+        stop_profiler(self.parser, profiler, args)
+
+
+    def get_initial_state(self, args):
+        """
+        Return the training state to pass to the train func, as loaded from the
+        --resume checkpoint or built from the --init-model; None if neither of
+        these is given. Exit with an error if the checkpoint was saved with
+        other training hyperparameters than the given ones.
+        """
+        if args.resume and args.init_model:
+            self.parser.error('--resume and --init-model cannot be used together')
+
+        if args.resume:
+            try:
+                algorithm, state, hyperparams = load_checkpoint(args.resume)
+            except ModelError as err:
+                self.parser.error(str(err))
+
+            if algorithm != args.algorithm:
+                self.parser.error('The checkpoint is of a {} model'.format(algorithm))
+
+            for key in ['initial_cutoff', 'alpha', 'batch_size']:
+                if key in hyperparams and hyperparams[key] != getattr(args, key):
+                    self.parser.error('The checkpoint was saved with --{} {}'.format(
+                            key.replace('_', '-'), hyperparams[key]))
+
+            return state
+
+        if args.init_model:
+            try:
+                algorithm, params = load_model(args.init_model, allow_pickle=args.allow_pickle)
+            except ModelError as err:
+                self.parser.error(str(err))
+
+            if algorithm != args.algorithm:
+                self.parser.error('The initial model is a {} model'.format(algorithm))
+
+            try:
+                num_updates = load_model_header(args.init_model)['hyperparams'].get('num_updates', 0)
+            except ModelError:  # pickle models do not have a header
+                num_updates = 0
+
+            if algorithm == 'pmi':
+                return {'pmi': params, 'num_updates': num_updates}
+            else:
+                return dict(zip(['em', 'gx', 'gy', 'trans', 'alphabet'], params),
+                        num_updates=num_updates)
+
+        return None
+
 
 
 class RunCli:
@@ -185,6 +463,10 @@ class RunCli:
         """
         Init the argparse parser.
         """
+        self.cache = None  # the ScoreCache of the --cache option
+        self.num_scored = 0  # distinct transcription pairs scored by apply_model
+        self.num_pairs = 0  # word pairs scored by apply_model
+
         self.parser = argparse.ArgumentParser(add_help=False, description=(
             'run the pmi or phmm online cognacy identification algorithm '
             'on a dataset'))
@@ -221,6 +503,12 @@ class RunCli:
             help=(
                 'convert input transcriptions from IPA to ASJP; '
                 'by default these are assumed to be ASJP'))
+        io_args.add_argument(
+            '--allow-pickle',
+            action='store_true',
+            help=(
+                'allow loading models saved as pickle files by older versions; '
+                'only use this for files from a trusted source'))
         io_args.add_argument(
             '-e', '--evaluate',
             action='store_true',
@@ -228,6 +516,97 @@ class RunCli:
                 'evaluate the output against the input dataset and '
                 'print the resulting F-score; this will fail '
                 'if the input dataset does not include cognate classes'))
+        io_args.add_argument(
+            '--bootstrap',
+            type=lambda x: number_in_interval(x, int, [1, float('inf')]),
+            help=(
+                'with --evaluate, also print a bootstrap confidence interval '
+                'of the F-score, resampling the concepts this many times'))
+        io_args.add_argument(
+            '--confidence',
+            type=lambda x: number_in_interval(x, float, [0, 1]),
+            default=0.95,
+            help=(
+                'the confidence level of the bootstrap interval; '
+                'the default is 0.95'))
+        io_args.add_argument(
+            '-s', '--stream',
+            choices=['grouped', 'sort'],
+            help=(
+                'process the dataset one concept at a time, so that memory '
+                'use is bounded by the largest concept; grouped expects the '
+                'words of each concept to be listed in a contiguous block, '
+                'sort first sorts the input by concept using temporary files; '
+                'the output concepts follow the input order'))
+        io_args.add_argument(
+            '--shard',
+            type=shard_spec,
+            help=(
+                'only process the K-th of N shards of the dataset\'s concepts, '
+                'given as K/N; the shards are balanced by number of word pairs '
+                'and only depend on the dataset; use merge.py to combine the '
+                'outputs of all shards'))
+        io_args.add_argument(
+            '--save-scores',
+            help=(
+                'path where to write the distance scores of the word pairs, '
+                'so that later runs with another clustering method or '
+                'threshold can use --load-scores instead of the model'))
+        io_args.add_argument(
+            '--load-scores',
+            help=(
+                'path to a scores file written by --save-scores to use instead '
+                'of applying the model; the model file is not loaded, but it '
+                'and the dataset must be the same as when the file was written'))
+        io_args.add_argument(
+            '--cache',
+            help=(
+                'path to a score cache file, created if it does not exist, '
+                'to look the scores of transcription pairs up in and add new '
+                'ones to; it can be shared by runs, models and datasets'))
+        io_args.add_argument(
+            '--cache-size',
+            type=lambda x: number_in_interval(x, int, [1, float('inf')]),
+            default=10000000,
+            help=(
+                'the most scores to keep in the --cache file, the least '
+                'recently used ones being evicted; the default is 10000000'))
+
+        algo_args = self.parser.add_argument_group('optional arguments - clustering')
+        algo_args.add_argument(
+            '-m', '--method',
+            choices=METHODS,
+            default='infomap',
+            help=(
+                'the clustering method; components, upgma and labelprop-np '
+                'do not use igraph and are much faster on small concepts; '
+                'auto uses upgma for concepts of up to 200 words and infomap '
+                'for the rest; the default is infomap'))
+        algo_args.add_argument(
+            '--threshold',
+            type=lambda x: number_in_interval(x, float, [0, 1]),
+            default=0.5,
+            help=(
+                'distance threshold for linking two words; should be within '
+                'the interval [0.0; 1.0]; the default value is 0.5'))
+        algo_args.add_argument(
+            '-k', '--knn',
+            type=lambda x: number_in_interval(x, int, [1, float('inf')]),
+            help=(
+                'cluster on a sparse graph linking each word only to its k '
+                'nearest neighbours; the neighbours are looked for among the '
+                'words sharing most sound bigrams, so that most word pairs '
+                'are never scored; useful for concepts with very many words'))
+        algo_args.add_argument(
+            '-j', '--jobs',
+            type=lambda x: number_in_interval(x, int, [1, float('inf')]),
+            default=1,
+            help=(
+                'number of worker processes to cluster the concepts in, '
+                'largest concepts first; the output does not depend on it; '
+                'the default is 1'))
+
+        add_profiling_args(self.parser)
 
         other_args = self.parser.add_argument_group('optional arguments - other')
         other_args.add_argument(
@@ -247,43 +626,216 @@ class RunCli:
         """
         args = self.parser.parse_args(raw_args)
 
+        if args.knn and args.method in ['upgma', 'auto']:
+            self.parser.error('--knn cannot be used with the {} method'.format(args.method))
+
+        if (args.save_scores or args.load_scores) and (args.knn or args.stream):
+            self.parser.error('--save-scores and --load-scores cannot be used with --knn or --stream')
+
         start_time = time.time()
+        profiler = start_profiler(self.parser, args)
 
         try:
             dataset = Dataset(args.dataset, args.dialect_input, args.ipa)
-            algorithm, model = load_model(args.model)
+            if args.load_scores:
+                algorithm, model = None, None
+            else:
+                with stage('read'):
+                    algorithm, model = load_model(args.model, allow_pickle=args.allow_pickle)
         except (DatasetError, ModelError) as err:
             self.parser.error(str(err))
 
+        if args.cache and not args.load_scores:
+            try:
+                self.cache = ScoreCache(args.cache, max_size=args.cache_size)
+            except CacheError as err:
+                self.parser.error(str(err))
+        else:
+            self.cache = None
+
+        scores, meta = None, None
+
+        if args.save_scores or args.load_scores:
+            try:
+                meta = {'model_hash': get_file_hash(args.model),
+                        'dataset_hash': get_dataset_hash(dataset)}
+                if args.load_scores:
+                    scores = self.load_scores(args.load_scores, meta)
+            except (DatasetError, ScoresError) as err:
+                self.parser.error(str(err))
+
         print('running {} on {}, ipa→asjp={}'.format(
                     args.model, args.dataset, 'yes' if args.ipa else 'no'))
 
+        try:
+            if args.shard:
+                index, num_shards = args.shard
+                concepts = assign_shards(dataset.get_concept_sizes(), num_shards)[index]
+            else:
+                concepts = None
+
+            if args.stream:
+                f_scores = self.run_stream(dataset, algorithm, model, args, concepts)
+            else:
+                f_scores = self.run_whole(dataset, algorithm, model, args, concepts,
+                        scores, meta)
+        except (CacheError, DatasetError, ScoresError) as err:
+            self.parser.error(str(err))
+
+        if self.cache is not None:
+            try:
+                self.cache.flush()
+                stats = self.cache.get_stats()
+                self.cache.close()
+            except CacheError as err:
+                self.parser.error(str(err))
+
+            print('score cache: {} of {} lookups hit ({:.1%}), {} scores in {}'.format(
+                    stats['hits'], stats['lookups'], stats['hit_rate'],
+                    stats['size'], args.cache))
+
+        if args.time:
+            if self.num_pairs:
+                print('scored {} distinct transcription pairs for {} word pairs ({:.1%})'.format(
+                        self.num_scored, self.num_pairs, self.num_scored / self.num_pairs))
+            print('running time: {:.2f} sec'.format(time.time() - start_time))
+
+        if args.evaluate:
+            f_scores = list(f_scores.values())
+            print('f-score: {:.4f}'.format(np.mean(f_scores)))
+
+            if args.bootstrap:
+                low, high = bootstrap(f_scores, args.bootstrap, args.confidence)
+                print('{:.0%} confidence interval: [{:.4f}; {:.4f}]'.format(
+                        args.confidence, low, high))
+
+        stop_profiler(self.parser, profiler, args)
+
+
+    def apply_model(self, dataset, algorithm, model):
+        """
+        Return the {(word1, word2): distance} dict of the dataset's synonymous
+        word pairs according to the given model, using the --cache if given.
+        """
         if algorithm == 'phmm':
-            scores = apply_phmm(dataset, *model)
+            scores = apply_phmm(dataset, *model, cache=self.cache)
         else:
-            scores = apply_pmi(dataset, model)
+            scores = apply_pmi(dataset, model, cache=self.cache)
+
+        self.num_scored += scores.num_scored
+        self.num_pairs += len(scores)
+
+        return scores
+
+
+    def load_scores(self, path, meta):
+        """
+        Load the scores file written by --save-scores, checking first that its
+        model and dataset hashes are those in the given meta dict. Raise a
+        ScoresError if they are not or if the file cannot be read.
+        """
+        header = load_scores_header(path)
+
+        for key, name in [('model_hash', 'model'), ('dataset_hash', 'dataset')]:
+            if header['meta'].get(key) != meta[key]:
+                raise ScoresError((
+                    'The scores file was written with another {} '
+                    'and would need to be re-computed: {}').format(name, path))
+
+        with stage('read'):
+            return load_scores(path)
+
+
+    def cluster_dataset(self, dataset, algorithm, model, args, scores=None):
+        """
+        Return the {concept: cog_sets} clusters of the dataset according to the
+        given model, either on the full distance matrices or on the sparse
+        nearest neighbours graphs. If scores is given, these are clustered
+        instead of applying the model.
+        """
+        if args.knn:
+            scorer = get_scorer(algorithm, model, dataset)
+            if self.cache is not None:
+                scorer = CachedScorer(scorer, self.cache)
+            return knn_cluster(dataset, scorer, k=args.knn,
+                    threshold=args.threshold, method=args.method)
+
+        if scores is None:
+            scores = self.apply_model(dataset, algorithm, model)
+
+        return cluster(dataset, scores, threshold=args.threshold,
+                method=args.method, jobs=args.jobs)
+
+
+    def run_whole(self, dataset, algorithm, model, args, concepts=None,
+            scores=None, meta=None):
+        """
+        Score, cluster and write the whole dataset at once. Return the
+        {concept: F-score} dict if evaluation is requested.
+
+        If concepts is not None, only the words of these concepts are used. If
+        scores is not None, these are used instead of the model; with the
+        --save-scores option the scores are written along with the meta dict.
+        """
+        if concepts is not None:
+            dataset = dataset.get_subset(concepts, cog_sets=args.evaluate)
 
-        clusters = cluster(dataset, scores)
+        if scores is not None:
+            missing = [concept for concept, words in dataset.get_concepts().items()
+                    if len(words) > 1 and concept not in scores.words]
+            if missing:
+                raise ScoresError('The scores file lacks concepts, e.g.: {}'.format(missing[0]))
+        elif args.save_scores:
+            scores = self.apply_model(dataset, algorithm, model)
+
+        clusters = self.cluster_dataset(dataset, algorithm, model, args, scores)
         write_clusters(clusters, args.output, args.dialect_output)
 
-        if args.time:
-            print('running time: {:.2f} sec'.format(time.time() - start_time))
+        if args.save_scores:
+            with stage('writing'):
+                save_scores(args.save_scores, scores, meta)
 
         if args.evaluate:
-            score = calc_f_score(dataset.get_clusters(), clusters)
-            print('f-score: {:.4f}'.format(score))
+            return calc_concept_f_scores(dataset.get_clusters(), clusters)
 
 
+    def run_stream(self, dataset, algorithm, model, args, concepts=None):
+        """
+        Score, cluster and write the dataset one concept at a time. Return the
+        {concept: F-score} dict if evaluation is requested.
 
-class EvalCli:
+        If concepts is not None, the other concepts are skipped.
+        """
+        f_scores = {}
+
+        blocks = dataset.iter_concepts(
+                    presorted=args.stream == 'grouped', cog_sets=args.evaluate)
+
+        with ClusterWriter(args.output, args.dialect_output) as writer:
+            for concept, block in blocks:
+                if concepts is not None and concept not in concepts:
+                    continue
+
+                clusters = self.cluster_dataset(block, algorithm, model, args)
+                writer.write(clusters)
+
+                if args.evaluate:
+                    f_scores.update(calc_concept_f_scores(block.get_clusters(), clusters))
+
+        if args.evaluate:
+            return f_scores
+
+
+
+class UpdateCli:
     """
     Handles the user input, invokes the corresponding code, and takes care of
-    exiting the programme for evaluating the output of cognacy identification
-    algorithms.
+    exiting the programme for updating the output of a previous run after new
+    words (e.g. new doculects) have been added to the dataset.
 
     Usage:
         if __name__ == '__main__':
-            cli = EvalCli()
+            cli = UpdateCli()
             cli.run()
     """
 
@@ -292,46 +844,1598 @@ class EvalCli:
         Init the argparse parser.
         """
         self.parser = argparse.ArgumentParser(add_help=False, description=(
-            'evaluate the cognates clustering of a dataset '
-            'against the same data\'s gold-standard cognate classes'))
+            'update the cognate classes identified in a previous run on a '
+            'dataset that has since been extended, only scoring the word '
+            'pairs that involve the new words'))
 
-        self.parser.add_argument('dataset_true', help=(
-            'path to the dataset containing the gold-standard cognate classes'))
-        self.parser.add_argument('dataset_pred', help=(
-            'path to the dataset containing the predicted cognate classes'))
+        self.parser.add_argument(
+            'model',
+            help='path to a trained model file')
+        self.parser.add_argument(
+            'dataset',
+            help='path to the extended dataset, including the old words')
 
-        csv_args = self.parser.add_argument_group('optional arguments - csv')
-        csv_args.add_argument('--dialect-true',
-            choices=csv.list_dialects(), help=(
-                'the csv dialect to use for reading the dataset '
-                'that contains the gold-standard cognate classes; '
-                'the default is to look at the file extension '
-                'and use excel for .csv and excel-tab for .tsv'))
-        csv_args.add_argument('--dialect-pred',
-            choices=csv.list_dialects(), help=(
-                'the csv dialect to use for reading the dataset '
-                'that contains the predicted cognate classes; '
-                'the default is to look at the file extension '
-                'and use excel for .csv and excel-tab for .tsv'))
+        prev_args = self.parser.add_argument_group('optional arguments - previous run')
+        prev_args.add_argument(
+            '--prev-scores',
+            help=(
+                'path to the scores file of the previous run, as written by '
+                'the --save-scores option with the same model; if omitted, '
+                'all pairs are scored'))
+        prev_args.add_argument(
+            '--prev-clusters',
+            help=(
+                'path to the cognate classes identified in the previous run; '
+                'if omitted, all concepts are clustered anew'))
 
-        other_args = self.parser.add_argument_group('optional arguments - other')
-        other_args.add_argument('-h', '--help', action='help', help=(
-            'show this help message and exit'))
+        algo_args = self.parser.add_argument_group('optional arguments - clustering')
+        algo_args.add_argument(
+            '-m', '--method',
+            choices=METHODS,
+            default='infomap',
+            help=(
+                'the clustering method for the concepts that are clustered '
+                'anew; the default is infomap'))
+        algo_args.add_argument(
+            '--threshold',
+            type=lambda x: number_in_interval(x, float, [0, 1]),
+            default=0.5,
+            help=(
+                'distance threshold for linking two words or adding a word to '
+                'a cognate class; the default value is 0.5'))
+        algo_args.add_argument(
+            '--recluster-ratio',
+            type=lambda x: number_in_interval(x, float, [0, 1]),
+            default=0.2,
+            help=(
+                'concepts where the new words make up more than this share of '
+                'all words are clustered anew; in the others, each new word '
+                'is added to the nearest cognate class; the default is 0.2'))
 
+        io_args = self.parser.add_argument_group('optional arguments - input/output')
+        io_args.add_argument(
+            '--dialect-input',
+            choices=csv.list_dialects(),
+            help=(
+                'the csv dialect to use for reading the dataset and the '
+                'previous cognate classes; the default is to look at the file '
+                'extension and use excel for .csv and excel-tab for .tsv'))
+        io_args.add_argument(
+            '--dialect-output',
+            choices=csv.list_dialects(), default='excel-tab',
+            help=(
+                'the csv dialect to use for writing the output; '
+                'the default is excel-tab'))
+        io_args.add_argument(
+            '-o', '--output',
+            help=(
+                'path where to write the updated cognate classes; '
+                'defaults to stdout'))
+        io_args.add_argument(
+            '--save-scores',
+            help=(
+                'path where to write the updated scores, to be used as '
+                '--prev-scores in the next update'))
+        io_args.add_argument(
+            '--cache',
+            help=(
+                'path to a score cache file, created if it does not exist, '
+                'to look the scores of the new transcription pairs up in and '
+                'add them to; it can be shared with run.py'))
+        io_args.add_argument(
+            '--cache-size',
+            type=lambda x: number_in_interval(x, int, [1, float('inf')]),
+            default=10000000,
+            help=(
+                'the most scores to keep in the --cache file, the least '
+                'recently used ones being evicted; the default is 10000000'))
+        io_args.add_argument(
+            '-i', '--ipa',
+            action='store_true',
+            help=(
+                'convert input transcriptions from IPA to ASJP; '
+                'by default these are assumed to be ASJP'))
+        io_args.add_argument(
+            '--allow-pickle',
+            action='store_true',
+            help=(
+                'allow loading models saved as pickle files by older versions; '
+                'only use this for files from a trusted source'))
+        io_args.add_argument(
+            '-e', '--evaluate',
+            action='store_true',
+            help=(
+                'evaluate the output against the input dataset and '
+                'print the resulting F-score'))
 
-    def run(self, raw_args=None):
-        """
-        Parse the given args (if these are None, default to parsing sys.argv,
-        which is what you would want unless you are unit testing), invoke the
-        evaluation function and print its output.
-        """
+        other_args = self.parser.add_argument_group('optional arguments - other')
+        other_args.add_argument(
+            '-h', '--help',
+            action='help',
+            help='show this help message and exit')
+        other_args.add_argument(
+            '-t', '--time',
+            action='store_true',
+            help='show total running time at the end')
+
+
+    def run(self, raw_args=None):
+        """
+        Parse the given args (if these are None, default to parsing sys.argv,
+        which is what you would want unless you are unit testing), update the
+        scores and the clusters, and write these.
+        """
+        args = self.parser.parse_args(raw_args)
+
+        start_time = time.time()
+
+        try:
+            dataset = Dataset(args.dataset, args.dialect_input, args.ipa)
+            algorithm, model = load_model(args.model, allow_pickle=args.allow_pickle)
+
+            model_hash = get_file_hash(args.model)
+
+            if args.prev_scores:
+                header = load_scores_header(args.prev_scores)
+                if header['meta'].get('model_hash') != model_hash:
+                    raise ScoresError((
+                        'The previous scores file was written with another '
+                        'model and cannot be reused: {}').format(args.prev_scores))
+                prev_scores = load_scores(args.prev_scores)
+            else:
+                prev_scores = Scores()
+
+            if args.prev_clusters:
+                prev_clusters = Dataset(args.prev_clusters, args.dialect_input).get_clusters()
+            else:
+                prev_clusters = {}
+        except (DatasetError, ModelError, ScoresError) as err:
+            self.parser.error(str(err))
+
+        scorer = get_scorer(algorithm, model, dataset)
+
+        try:
+            cache = ScoreCache(args.cache, max_size=args.cache_size) if args.cache else None
+        except CacheError as err:
+            self.parser.error(str(err))
+
+        try:
+            scores = update_scores(prev_scores, dataset, scorer, cache)
+            clusters = update_clusters(scores, prev_clusters,
+                    threshold=args.threshold, method=args.method,
+                    recluster_ratio=args.recluster_ratio)
+
+            write_clusters(clusters, args.output, args.dialect_output)
+
+            if args.save_scores:
+                save_scores(args.save_scores, scores, {
+                        'model_hash': model_hash,
+                        'dataset_hash': get_dataset_hash(dataset)})
+
+            if cache is not None:
+                cache.close()
+        except (CacheError, DatasetError, ScoresError) as err:
+            self.parser.error(str(err))
+
+        print('scored {} distinct transcription pairs for {} word pairs'.format(
+                scores.num_scored, len(scores)))
+
+        if args.time:
+            print('running time: {:.2f} sec'.format(time.time() - start_time))
+
+        if args.evaluate:
+            score = calc_f_score(dataset.get_clusters(), clusters)
+            print('f-score: {:.4f}'.format(score))
+
+
+
+class SweepCli:
+    """
+    Handles the user input, invokes the corresponding code, and takes care of
+    exiting the programme for clustering a dataset at several thresholds and
+    with several methods while running the alignment step only once.
+
+    Usage:
+        if __name__ == '__main__':
+            cli = SweepCli()
+            cli.run()
+    """
+
+    def __init__(self):
+        """
+        Init the argparse parser.
+        """
+        self.parser = argparse.ArgumentParser(add_help=False, description=(
+            'apply a pmi or phmm model on a dataset once and cluster the '
+            'output at a range of thresholds and with a range of methods'))
+
+        self.parser.add_argument(
+            'model',
+            help='path to a trained model file')
+        self.parser.add_argument(
+            'dataset',
+            help='path to a dataset to run cognacy identification on')
+
+        algo_args = self.parser.add_argument_group('optional arguments - clustering')
+        algo_args.add_argument(
+            '--thresholds',
+            nargs='+',
+            type=lambda x: number_in_interval(x, float, [0, 1]),
+            default=[round(0.05 * i, 2) for i in range(1, 21)],
+            help=(
+                'the distance thresholds to cluster at; the default is '
+                '0.05, 0.1, .., 1.0'))
+        algo_args.add_argument(
+            '--methods',
+            nargs='+',
+            choices=METHODS,
+            default=['infomap'],
+            help='the clustering methods to use; the default is infomap')
+        algo_args.add_argument(
+            '-j', '--jobs',
+            type=lambda x: number_in_interval(x, int, [1, float('inf')]),
+            default=1,
+            help=(
+                'number of worker processes to cluster the concepts in; '
+                'the default is 1'))
+
+        io_args = self.parser.add_argument_group('optional arguments - input/output')
+        io_args.add_argument(
+            '--dialect-input',
+            choices=csv.list_dialects(),
+            help=(
+                'the csv dialect to use for reading the dataset; '
+                'the default is to look at the file extension '
+                'and use excel for .csv and excel-tab for .tsv'))
+        io_args.add_argument(
+            '-i', '--ipa',
+            action='store_true',
+            help=(
+                'convert input transcriptions from IPA to ASJP; '
+                'by default these are assumed to be ASJP'))
+        io_args.add_argument(
+            '--allow-pickle',
+            action='store_true',
+            help=(
+                'allow loading models saved as pickle files by older versions; '
+                'only use this for files from a trusted source'))
+        io_args.add_argument(
+            '-o', '--output',
+            help=(
+                'path where to write the results table as csv; '
+                'by default it is printed to stdout'))
+        io_args.add_argument(
+            '--output-dir',
+            help=(
+                'directory where to write the identified cognate classes '
+                'for each method and threshold, as method_threshold.tsv'))
+
+        other_args = self.parser.add_argument_group('optional arguments - other')
+        other_args.add_argument(
+            '-h', '--help',
+            action='help',
+            help='show this help message and exit')
+
+
+    def run(self, raw_args=None):
+        """
+        Parse the given args (if these are None, default to parsing sys.argv,
+        which is what you would want unless you are unit testing), score and
+        cluster the dataset, and print or write the results table. The table
+        includes the F-scores if the dataset has cognate classes.
+        """
+        args = self.parser.parse_args(raw_args)
+
+        try:
+            dataset = Dataset(args.dataset, args.dialect_input, args.ipa)
+            algorithm, model = load_model(args.model, allow_pickle=args.allow_pickle)
+        except (DatasetError, ModelError) as err:
+            self.parser.error(str(err))
+
+        try:
+            if algorithm == 'phmm':
+                scores = apply_phmm(dataset, *model)
+            else:
+                scores = apply_pmi(dataset, model)
+
+            sweeps = sweep(dataset, scores, args.thresholds, args.methods, jobs=args.jobs)
+
+            try:
+                true_clusters = dataset.get_clusters()
+            except DatasetError:
+                true_clusters = None
+
+            rows = []
+            for method in args.methods:
+                for threshold in sorted(args.thresholds):
+                    clusters = sweeps[(method, threshold)]
+
+                    if args.output_dir:
+                        write_clusters(clusters, os.path.join(args.output_dir,
+                                '{}_{}.tsv'.format(method, threshold)))
+
+                    score = None
+                    if true_clusters is not None:
+                        score = calc_f_score(true_clusters, clusters)
+
+                    rows.append([method, threshold, score])
+        except DatasetError as err:
+            self.parser.error(str(err))
+
+        if args.output:
+            try:
+                with open(args.output, 'w', encoding='utf-8', newline='') as f:
+                    writer = csv.writer(f)
+                    writer.writerow(['method', 'threshold', 'f_score'])
+                    writer.writerows([[method, threshold, '' if score is None else score]
+                            for method, threshold, score in rows])
+            except OSError:
+                self.parser.error('Could not write file: {}'.format(args.output))
+        else:
+            for method, threshold, score in rows:
+                print('{}\t{:.2f}\t{}'.format(method, threshold,
+                        '-' if score is None else '{:.4f}'.format(score)))
+
+
+
+_true_clusters = None  # the gold standard of the eval worker processes
+
+
+
+def _init_eval_worker(true_clusters):
+    """
+    Store the gold-standard cognate classes in the (worker) process, so that
+    these are only sent once rather than along with each prediction file.
+
+    Helper for EvalCli.
+    """
+    global _true_clusters
+    _true_clusters = true_clusters
+
+
+
+def _evaluate_file(task):
+    """
+    Read the predicted cognate classes from a (path, dialect) task and evaluate
+    them against the gold standard stored by _init_eval_worker. Return a
+    (concept metrics, error message) tuple, one of which is None.
+
+    Helper for EvalCli.
+    """
+    path, dialect = task
+
+    try:
+        return evaluate(_true_clusters, Dataset(path, dialect).get_clusters()), None
+    except DatasetError as err:
+        return None, str(err)
+    except AssertionError:
+        return None, 'Dataset does not match the gold standard: {}'.format(path)
+
+
+
+def expand_paths(patterns):
+    """
+    Return the [] of paths matched by the given glob patterns, each pattern's
+    matches sorted. Patterns without wildcards are taken as they are. Raise an
+    ArgumentTypeError if a pattern does not match anything.
+
+    Helper for EvalCli.
+    """
+    paths = []
+
+    for pattern in patterns:
+        if glob.escape(pattern) == pattern:
+            paths.append(pattern)
+            continue
+
+        matches = sorted(glob.glob(pattern))
+        if not matches:
+            raise argparse.ArgumentTypeError('No files match: {}'.format(pattern))
+
+        paths.extend(matches)
+
+    return paths
+
+
+
+class EvalCli:
+    """
+    Handles the user input, invokes the corresponding code, and takes care of
+    exiting the programme for evaluating the output of cognacy identification
+    algorithms.
+
+    Usage:
+        if __name__ == '__main__':
+            cli = EvalCli()
+            cli.run()
+    """
+
+    def __init__(self):
+        """
+        Init the argparse parser.
+        """
+        self.parser = argparse.ArgumentParser(add_help=False, description=(
+            'evaluate the cognates clustering of one or more datasets '
+            'against the same data\'s gold-standard cognate classes'))
+
+        self.parser.add_argument('dataset_true', help=(
+            'path to the dataset containing the gold-standard cognate classes'))
+        self.parser.add_argument('dataset_pred', nargs='+', help=(
+            'path to the dataset containing the predicted cognate classes; '
+            'several paths or glob patterns (e.g. "output/*.tsv") can be given, '
+            'in which case a table with a row per dataset is printed'))
+
+        csv_args = self.parser.add_argument_group('optional arguments - csv')
+        csv_args.add_argument('--dialect-true',
+            choices=csv.list_dialects(), help=(
+                'the csv dialect to use for reading the dataset '
+                'that contains the gold-standard cognate classes; '
+                'the default is to look at the file extension '
+                'and use excel for .csv and excel-tab for .tsv'))
+        csv_args.add_argument('--dialect-pred',
+            choices=csv.list_dialects(), help=(
+                'the csv dialect to use for reading the datasets '
+                'that contain the predicted cognate classes; '
+                'the default is to look at the file extension '
+                'and use excel for .csv and excel-tab for .tsv'))
+
+        eval_args = self.parser.add_argument_group('optional arguments - metrics')
+        eval_args.add_argument('--metrics', nargs='*', choices=METRICS, help=(
+            'print these metrics, one per line, instead of the B-cubed F-score '
+            'alone; all of them if no names are given'))
+        eval_args.add_argument('--per-concept', action='store_true', help=(
+            'also print a table with the metrics of each concept'))
+        eval_args.add_argument('--json', help=(
+            'path where to write the mean and the per-concept metrics as json'))
+        eval_args.add_argument('--bootstrap',
+            type=lambda x: number_in_interval(x, int, [1, float('inf')]), help=(
+                'also print bootstrap confidence intervals of the means, '
+                'resampling the concepts this many times'))
+        eval_args.add_argument('--confidence',
+            type=lambda x: number_in_interval(x, float, [0, 1]),
+            default=0.95, help=(
+                'the confidence level of the bootstrap intervals; '
+                'the default is 0.95'))
+        eval_args.add_argument('--paired', action='store_true', help=(
+            'compare each predicted dataset to the first one with a paired '
+            'bootstrap test over the concepts; requires --bootstrap and '
+            'at least two predicted datasets'))
+
+        io_args = self.parser.add_argument_group('optional arguments - input/output')
+        io_args.add_argument('-o', '--output', help=(
+            'path where to write the results table as csv, '
+            'with a row per predicted dataset; by default it is printed'))
+        io_args.add_argument('-j', '--jobs',
+            type=lambda x: number_in_interval(x, int, [1, float('inf')]),
+            default=1, help=(
+                'number of worker processes to evaluate the predicted '
+                'datasets in; the default is 1'))
+
+        other_args = self.parser.add_argument_group('optional arguments - other')
+        other_args.add_argument('-h', '--help', action='help', help=(
+            'show this help message and exit'))
+
+
+    def evaluate_files(self, true_clusters, paths, dialect=None, jobs=1):
+        """
+        Evaluate the datasets at the given paths against the gold-standard
+        clusters, in that many worker processes if jobs is more than 1. Return
+        the [] of the per-concept metrics of each dataset, in the same order.
+        """
+        tasks = [(path, dialect) for path in paths]
+
+        if jobs > 1 and len(tasks) > 1:
+            with multiprocessing.Pool(min(jobs, len(tasks)), _init_eval_worker,
+                    (true_clusters,)) as pool:
+                results = pool.map(_evaluate_file, tasks, chunksize=1)
+        else:
+            _init_eval_worker(true_clusters)
+            results = [_evaluate_file(task) for task in tasks]
+
+        for concept_metrics, error in results:
+            if error is not None:
+                self.parser.error(error)
+
+        return [concept_metrics for concept_metrics, _ in results]
+
+
+    def format_metric(self, values, metric, args):
+        """
+        Return the tab-separated mean of a metric over the concepts of the
+        {concept: {metric: value}} dict, followed by the bounds of its
+        bootstrap confidence interval if these are requested.
+        """
+        scores = [metrics[metric] for metrics in values.values()]
+        fields = [np.mean(scores)]
+
+        if args.bootstrap:
+            fields.extend(bootstrap(scores, args.bootstrap, args.confidence))
+
+        return '\t'.join(['{:.4f}'.format(field) for field in fields])
+
+
+    def get_header(self, names, args):
+        """
+        Return the [] of column names for the given metrics, including the
+        bounds of the bootstrap confidence intervals if these are requested.
+        """
+        if not args.bootstrap:
+            return list(names)
+
+        return [column for name in names
+                for column in [name, name + '_low', name + '_high']]
+
+
+    def run(self, raw_args=None):
+        """
+        Parse the given args (if these are None, default to parsing sys.argv,
+        which is what you would want unless you are unit testing), invoke the
+        evaluation function and print its output.
+        """
+        args = self.parser.parse_args(raw_args)
+
+        try:
+            paths = expand_paths(args.dataset_pred)
+            true_clusters = Dataset(args.dataset_true, args.dialect_true).get_clusters()
+        except (argparse.ArgumentTypeError, DatasetError) as err:
+            self.parser.error(str(err))
+
+        if args.paired and (not args.bootstrap or len(paths) < 2):
+            self.parser.error(
+                    '--paired requires --bootstrap and at least two predicted datasets')
+
+        results = self.evaluate_files(true_clusters, paths, args.dialect_pred, args.jobs)
+        names = args.metrics or METRICS
+
+        if len(paths) == 1:
+            concept_metrics = results[0]
+
+            if args.metrics is None:
+                print(self.format_metric(concept_metrics, 'b_cubed_f_score', args))
+            else:
+                for metric in names:
+                    print('{}\t{}'.format(metric,
+                            self.format_metric(concept_metrics, metric, args)))
+
+            if args.per_concept:
+                print('\t'.join(['concept'] + names))
+                for concept, values in concept_metrics.items():
+                    print('\t'.join([concept] + [
+                        '{:.4f}'.format(values[metric]) for metric in names]))
+
+        else:
+            if args.metrics is None:
+                names = ['b_cubed_f_score']
+
+            print('\t'.join(['dataset'] + self.get_header(names, args)))
+            for path, concept_metrics in zip(paths, results):
+                print('\t'.join([path] + [self.format_metric(concept_metrics, metric, args)
+                        for metric in names]))
+
+            if args.per_concept:
+                print('\t'.join(['dataset', 'concept'] + names))
+                for path, concept_metrics in zip(paths, results):
+                    for concept, values in concept_metrics.items():
+                        print('\t'.join([path, concept] + [
+                            '{:.4f}'.format(values[metric]) for metric in names]))
+
+        if args.paired:
+            print('\t'.join(['dataset', 'baseline', 'metric',
+                    'difference', 'low', 'high', 'p']))
+            for path, concept_metrics in zip(paths[1:], results[1:]):
+                for metric in names:
+                    test = paired_bootstrap(
+                            [concept_metrics[concept][metric] for concept in true_clusters],
+                            [results[0][concept][metric] for concept in true_clusters],
+                            args.bootstrap, args.confidence)
+                    print('\t'.join([path, paths[0], metric] + [
+                        '{:.4f}'.format(field) for field in test]))
+
+        if args.output:
+            self.write_table(args.output, names, paths, results, args)
+
+        if args.json:
+            self.write_json(args.json, names, paths, results, args)
+
+
+    def get_summary(self, concept_metrics, names, args):
+        """
+        Return the {metric: mean} dict of a predicted dataset, along with the
+        {metric: [low, high]} dict of the confidence intervals if these are
+        requested (None otherwise).
+        """
+        metrics = summarise(concept_metrics)
+
+        if not args.bootstrap:
+            return metrics, None
+
+        intervals = {}
+        for name in names:
+            scores = [values[name] for values in concept_metrics.values()]
+            intervals[name] = list(bootstrap(scores, args.bootstrap, args.confidence))
+
+        return metrics, intervals
+
+
+    def write_table(self, path, names, paths, results, args):
+        """
+        Write the mean metrics of each predicted dataset as csv.
+        """
+        try:
+            with open(path, 'w', encoding='utf-8', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['dataset'] + self.get_header(names, args))
+                for pred_path, concept_metrics in zip(paths, results):
+                    metrics, intervals = self.get_summary(concept_metrics, names, args)
+                    row = [pred_path]
+                    for name in names:
+                        row.append(metrics[name])
+                        if intervals:
+                            row.extend(intervals[name])
+                    writer.writerow(row)
+        except OSError:
+            self.parser.error('Could not write file: {}'.format(path))
+
+
+    def write_json(self, path, names, paths, results, args):
+        """
+        Write the mean and the per-concept metrics of the predicted datasets,
+        and the confidence intervals if requested, as json. If there is only
+        one predicted dataset, its dict is the top-level object; otherwise the
+        top-level object maps the datasets' paths to their dicts.
+        """
+        data = {}
+
+        for pred_path, concept_metrics in zip(paths, results):
+            metrics, intervals = self.get_summary(concept_metrics, names, args)
+            data[pred_path] = {'metrics': metrics, 'concepts': concept_metrics}
+            if intervals:
+                data[pred_path]['intervals'] = intervals
+
+        if len(paths) == 1:
+            data = data[paths[0]]
+
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=4)
+        except OSError:
+            self.parser.error('Could not write file: {}'.format(path))
+
+
+
+class MergeCli:
+    """
+    Handles the user input, invokes the corresponding code, and takes care of
+    exiting the programme for merging the outputs of sharded runs.
+
+    Usage:
+        if __name__ == '__main__':
+            cli = MergeCli()
+            cli.run()
+    """
+
+    def __init__(self):
+        """
+        Init the argparse parser.
+        """
+        self.parser = argparse.ArgumentParser(add_help=False, description=(
+            'merge the cognate classes identified by the shards of a run '
+            '(see the --shard option of run.py) into a single file'))
+
+        self.parser.add_argument('shards', nargs='+', help=(
+            'paths to the outputs of the shards'))
+
+        io_args = self.parser.add_argument_group('optional arguments - input/output')
+        io_args.add_argument('--dialect-input',
+            choices=csv.list_dialects(), help=(
+                'the csv dialect to use for reading the shard outputs '
+                'and the gold-standard dataset; '
+                'the default is to look at the file extension '
+                'and use excel for .csv and excel-tab for .tsv'))
+        io_args.add_argument('--dialect-output',
+            choices=csv.list_dialects(), default='excel-tab', help=(
+                'the csv dialect to use for writing the output; '
+                'the default is excel-tab'))
+        io_args.add_argument('-o', '--output', help=(
+                'path where to write the merged cognate classes; '
+                'defaults to stdout'))
+        io_args.add_argument('-e', '--evaluate', metavar='DATASET', help=(
+                'evaluate the merged output against this dataset and '
+                'print the resulting F-score'))
+        io_args.add_argument('-i', '--ipa', action='store_true', help=(
+                'convert the transcriptions of the dataset to evaluate '
+                'against from IPA to ASJP'))
+
+        other_args = self.parser.add_argument_group('optional arguments - other')
+        other_args.add_argument('-h', '--help', action='help', help=(
+            'show this help message and exit'))
+
+
+    def run(self, raw_args=None):
+        """
+        Parse the given args (if these are None, default to parsing sys.argv,
+        which is what you would want unless you are unit testing), merge the
+        shards and, if requested, print the F-score of the merged output.
+        """
+        args = self.parser.parse_args(raw_args)
+
+        try:
+            clusters = merge_clusters([
+                Dataset(path, args.dialect_input).get_clusters()
+                for path in args.shards])
+
+            if args.evaluate:
+                dataset = Dataset(args.evaluate, args.dialect_input, args.ipa)
+                true_clusters = dataset.get_clusters()
+
+            write_clusters(clusters, args.output, args.dialect_output)
+        except DatasetError as err:
+            self.parser.error(str(err))
+
+        if args.evaluate:
+            missing = set(true_clusters.keys()) - set(clusters.keys())
+            if missing:
+                self.parser.error('Concepts missing from the shards: {}'.format(
+                    ', '.join(sorted(missing))))
+
+            score = calc_f_score(true_clusters, clusters)
+            print('f-score: {:.4f}'.format(score))
+
+
+
+def model_spec(spec):
+    """
+    Parse a NAME=PATH model spec into a (name, path) tuple; if there is no
+    name, the file name without its extension is used.
+
+    Helper for ServeCli's ArgumentParser instance.
+    """
+    if '=' in spec:
+        name, path = spec.split('=', 1)
+    else:
+        name, path = os.path.splitext(os.path.basename(spec))[0], spec
+
+    if not name or not path:
+        raise argparse.ArgumentTypeError('invalid model: {!r}'.format(spec))
+
+    return name, path
+
+
+
+class ServeCli:
+    """
+    Handles the user input, invokes the corresponding code, and takes care of
+    exiting the programme for running the scoring server.
+
+    Usage:
+        if __name__ == '__main__':
+            cli = ServeCli()
+            cli.run()
+    """
+
+    def __init__(self):
+        """
+        Init the argparse parser.
+        """
+        self.parser = argparse.ArgumentParser(add_help=False, description=(
+            'load one or more models once and serve distance and clustering '
+            'requests over local http, either on a localhost port or on a '
+            'unix socket; GET /models and /metrics, POST /distances and '
+            '/cluster with a json body'))
+
+        self.parser.add_argument(
+            'models',
+            nargs='+',
+            type=model_spec,
+            help=(
+                'paths to trained model files, optionally given as NAME=PATH; '
+                'requests refer to the models by these names, which default '
+                'to the file names without their extensions'))
+
+        server_args = self.parser.add_argument_group('optional arguments - server')
+        server_args.add_argument(
+            '--host',
+            default='127.0.0.1',
+            help='the address to listen on; the default is 127.0.0.1')
+        server_args.add_argument(
+            '--port',
+            type=lambda x: number_in_interval(x, int, [0, 65535]),
+            default=8000,
+            help='the port to listen on; the default is 8000')
+        server_args.add_argument(
+            '--socket',
+            help='listen on this unix socket instead of a port')
+        server_args.add_argument(
+            '--allow-pickle',
+            action='store_true',
+            help=(
+                'allow loading models saved as pickle files by older versions; '
+                'only use this for files from a trusted source'))
+
+        algo_args = self.parser.add_argument_group('optional arguments - clustering')
+        algo_args.add_argument(
+            '-m', '--method',
+            choices=SERVER_METHODS,
+            default='infomap',
+            help=(
+                'the clustering method for requests that do not specify one; '
+                'the default is infomap'))
+        algo_args.add_argument(
+            '--threshold',
+            type=lambda x: number_in_interval(x, float, [0, 1]),
+            default=0.5,
+            help=(
+                'the distance threshold for requests that do not specify one; '
+                'the default is 0.5'))
+
+        other_args = self.parser.add_argument_group('optional arguments - other')
+        other_args.add_argument(
+            '-h', '--help',
+            action='help',
+            help='show this help message and exit')
+        other_args.add_argument(
+            '-v', '--verbose',
+            action='store_true',
+            help='log each request to stderr')
+
+
+    def run(self, raw_args=None):
+        """
+        Parse the given args (if these are None, default to parsing sys.argv,
+        which is what you would want unless you are unit testing), load the
+        models and serve requests until interrupted.
+        """
+        args = self.parser.parse_args(raw_args)
+
+        models = {}
+        for name, path in args.models:
+            if name in models:
+                self.parser.error('Model name used more than once: {}'.format(name))
+            try:
+                models[name] = load_model(path, allow_pickle=args.allow_pickle)
+            except ModelError as err:
+                self.parser.error(str(err))
+
+        service = ScoringService(models, args.threshold, args.method)
+
+        try:
+            if args.socket:
+                server = UnixServer(args.socket, service, args.verbose)
+                address = args.socket
+            else:
+                server = TCPServer((args.host, args.port), service, args.verbose)
+                address = 'http://{}:{}'.format(*server.server_address[:2])
+        except OSError as err:
+            self.parser.error('Could not listen on {}: {}'.format(
+                    args.socket or '{}:{}'.format(args.host, args.port), err.strerror))
+
+        print('serving {} on {}'.format(', '.join(models.keys()), address), flush=True)
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            if args.socket and os.path.exists(args.socket):
+                os.remove(args.socket)
+
+
+
+class BatchCli:
+    """
+    Handles the user input, invokes the corresponding code, and takes care of
+    exiting the programme for running a batch of train+run+eval jobs, e.g. the
+    whole grid of datasets and hyperparameters of an experiment.
+
+    Usage:
+        if __name__ == '__main__':
+            cli = BatchCli()
+            cli.run()
+    """
+
+    def __init__(self):
+        """
+        Init the argparse parser.
+        """
+        self.parser = argparse.ArgumentParser(add_help=False, description=(
+            'run many jobs, each applying a model on a dataset and evaluating '
+            'the output, in a single process pool; models that do not exist '
+            'yet are trained first; each model and dataset is only read once'))
+
+        self.parser.add_argument(
+            'batch_file',
+            nargs='?',
+            help=(
+                'path to a json (or, if PyYAML is installed, yaml) file '
+                'with the defaults, matrix and/or jobs keys; '
+                'see scripts/reproduce.json for an example'))
+
+        job_args = self.parser.add_argument_group('optional arguments - jobs')
+        job_args.add_argument(
+            '--datasets',
+            nargs='+',
+            help='run a job for each of these datasets')
+        job_args.add_argument(
+            '--algorithms',
+            nargs='+',
+            choices=['pmi', 'phmm'],
+            help='run a job for each of these algorithms')
+        job_args.add_argument(
+            '--batch-sizes',
+            nargs='+',
+            type=lambda x: number_in_interval(x, int, [1, float('inf')]),
+            help='run a job for each of these values of m')
+        job_args.add_argument(
+            '--alphas',
+            nargs='+',
+            type=lambda x: number_in_interval(x, float, [0.5, 1]),
+            help='run a job for each of these values of α')
+        job_args.add_argument(
+            '--thresholds',
+            nargs='+',
+            type=lambda x: number_in_interval(x, float, [0, 1]),
+            help='run a job for each of these clustering thresholds')
+        job_args.add_argument(
+            '--methods',
+            nargs='+',
+            choices=METHODS,
+            help='run a job for each of these clustering methods')
+        job_args.add_argument(
+            '--training',
+            help=(
+                'path to a word pairs file (as in the training_data dir) to '
+                'train the models that do not exist yet on'))
+        job_args.add_argument(
+            '--model-path',
+            help=(
+                'the path of the jobs\' models, which can refer to the job '
+                'keys, e.g. "models/{algorithm}/m={batch_size},α={alpha}.'
+                '{algorithm}"'))
+        job_args.add_argument(
+            '-i', '--ipa',
+            action='store_true',
+            help=(
+                'convert input transcriptions from IPA to ASJP; '
+                'by default these are assumed to be ASJP'))
+
+        io_args = self.parser.add_argument_group('optional arguments - input/output')
+        io_args.add_argument(
+            '-o', '--output',
+            help=(
+                'path where to write the results table as csv; '
+                'by default it is printed to stdout'))
+        io_args.add_argument(
+            '--output-dir',
+            help=(
+                'directory where to write the identified cognate classes '
+                'of each job, as algorithm/name.tsv'))
+        io_args.add_argument(
+            '--allow-pickle',
+            action='store_true',
+            help=(
+                'allow loading models saved as pickle files by older versions; '
+                'only use this for files from a trusted source'))
+        io_args.add_argument(
+            '-j', '--jobs',
+            type=lambda x: number_in_interval(x, int, [1, float('inf')]),
+            default=1,
+            help=(
+                'number of worker processes to train the models and run the '
+                'jobs in; the results do not depend on it; the default is 1'))
+
+        other_args = self.parser.add_argument_group('optional arguments - other')
+        other_args.add_argument(
+            '-h', '--help',
+            action='help',
+            help='show this help message and exit')
+        other_args.add_argument(
+            '-t', '--time',
+            action='store_true',
+            help='show total running time at the end')
+
+
+    def get_spec(self, args):
+        """
+        Return the {defaults, matrix, jobs} dict of the batch file, if given,
+        with the command-line options added: the lists go to the matrix and
+        the rest to the defaults, overriding those of the file.
+        """
+        if args.batch_file:
+            try:
+                spec = read_spec(args.batch_file)
+            except BatchError as err:
+                self.parser.error(str(err))
+        else:
+            spec = {}
+
+        matrix = {
+            'dataset': args.datasets,
+            'algorithm': args.algorithms,
+            'batch_size': args.batch_sizes,
+            'alpha': args.alphas,
+            'threshold': args.thresholds,
+            'method': args.methods}
+
+        defaults = {
+            'training': args.training,
+            'model': args.model_path,
+            'ipa': args.ipa or None}
+
+        if args.output_dir:
+            defaults['output'] = os.path.join(args.output_dir, '{algorithm}', '{name}.tsv')
+
+        if args.datasets:
+            spec['matrix'] = dict(spec.get('matrix') or {}, **{
+                key: value for key, value in matrix.items() if value})
+        elif any(matrix.values()):
+            self.parser.error('--datasets is needed with the other job lists')
+
+        spec['defaults'] = dict(spec.get('defaults') or {}, **{
+            key: value for key, value in defaults.items() if value is not None})
+
+        return spec
+
+
+    def run(self, raw_args=None):
+        """
+        Parse the given args (if these are None, default to parsing sys.argv,
+        which is what you would want unless you are unit testing), run the
+        jobs, and print or write the consolidated results table.
+        """
+        args = self.parser.parse_args(raw_args)
+
+        if not args.batch_file and not args.datasets:
+            self.parser.error('either a batch file or --datasets is needed')
+
+        start_time = time.time()
+
+        try:
+            jobs = expand_jobs(self.get_spec(args))
+            results = run_batch(jobs, args.jobs, args.allow_pickle)
+        except (BatchError, DatasetError, ModelError) as err:
+            self.parser.error(str(err))
+
+        if args.output:
+            try:
+                with open(args.output, 'w', encoding='utf-8', newline='') as f:
+                    writer = csv.writer(f)
+                    writer.writerow(RESULT_COLUMNS)
+                    writer.writerows([['' if result[column] is None else result[column]
+                            for column in RESULT_COLUMNS] for result in results])
+            except OSError:
+                self.parser.error('Could not write file: {}'.format(args.output))
+        else:
+            print('\t'.join(RESULT_COLUMNS))
+            for result in results:
+                print('\t'.join([self.format_value(column, result[column])
+                        for column in RESULT_COLUMNS]))
+
+        if args.time:
+            print('running time: {:.2f} sec'.format(time.time() - start_time))
+
+
+    def format_value(self, column, value):
+        """
+        Format a results table cell for printing.
+        """
+        if value is None:
+            return '-'
+        elif column == 'f_score':
+            return '{:.4f}'.format(value)
+        elif column.endswith('_sec'):
+            return '{:.2f}'.format(value)
+
+        return str(value)
+
+
+
+class TuneCli:
+    """
+    Handles the user input, invokes the corresponding code, and takes care of
+    exiting the programme for searching a grid of training hyperparameters.
+
+    Usage:
+        if __name__ == '__main__':
+            cli = TuneCli()
+            cli.run()
+    """
+
+    def __init__(self):
+        """
+        Init the argparse parser.
+        """
+        self.parser = argparse.ArgumentParser(add_help=False, description=(
+            'train a pmi or phmm model for each combination of the given '
+            'hyperparameter values and evaluate it on one or more datasets; '
+            'the training data is read once and shared by the worker '
+            'processes'))
+
+        self.parser.add_argument(
+            'algorithm',
+            choices=['pmi', 'phmm'],
+            help='which of the two algorithms to use')
+        self.parser.add_argument(
+            'dataset',
+            help=(
+                'path to a word pairs file (as in the training_data dir) '
+                'to train on'))
+        self.parser.add_argument(
+            'eval_datasets',
+            nargs='+',
+            help=(
+                'paths to datasets with cognate classes to evaluate the models '
+                'on; a model\'s score is the mean of their F-scores'))
+
+        grid_args = self.parser.add_argument_group('optional arguments - grid')
+        grid_args.add_argument(
+            '-a', '--alphas',
+            nargs='+',
+            type=lambda x: number_in_interval(x, float, [0.5, 1]),
+            default=[0.75],
+            help='the values of α to try; the default is 0.75')
+        grid_args.add_argument(
+            '-m', '--batch-sizes',
+            nargs='+',
+            type=lambda x: number_in_interval(x, int, [1, float('inf')]),
+            default=[256],
+            help='the values of m to try; the default is 256')
+        grid_args.add_argument(
+            '-c', '--initial-cutoffs',
+            nargs='+',
+            type=lambda x: number_in_interval(x, float, [0, 1]),
+            default=[0.5],
+            help='the initial Levenshtein distance cutoffs to try; the default is 0.5')
+        grid_args.add_argument(
+            '-r', '--random-seed',
+            type=int,
+            default=42,
+            help=(
+                'integer to seed python\'s and numpy\'s random modules with '
+                'for each config; the default value is 42'))
+
+        stop_args = self.parser.add_argument_group('optional arguments - early stopping')
+        stop_args.add_argument(
+            '--early-stop',
+            action='store_true',
+            help=(
+                'use successive halving: evaluate all configs after '
+                '--min-epochs, keep training the best 1/--eta of them for '
+                '--eta times as long, and so on, until one is left, which is '
+                'trained until convergence'))
+        stop_args.add_argument(
+            '--eta',
+            type=lambda x: number_in_interval(x, int, [2, float('inf')]),
+            default=3,
+            help='the reduction factor of --early-stop; the default is 3')
+        stop_args.add_argument(
+            '--min-epochs',
+            type=lambda x: number_in_interval(x, float, [0, float('inf')]),
+            default=1.0,
+            help=(
+                'the passes over the word pairs that all configs are trained '
+                'for before the first evaluation; should be greater than 0; '
+                'the default is 1'))
+
+        eval_args = self.parser.add_argument_group('optional arguments - evaluation')
+        eval_args.add_argument(
+            '-i', '--ipa',
+            action='store_true',
+            help=(
+                'convert the evaluation datasets\' transcriptions from IPA to '
+                'ASJP; by default these are assumed to be ASJP'))
+        eval_args.add_argument(
+            '--dialect-input',
+            choices=csv.list_dialects(),
+            help=(
+                'the csv dialect to use for reading the evaluation datasets; '
+                'the default is to look at the file extension '
+                'and use excel for .csv and excel-tab for .tsv'))
+        eval_args.add_argument(
+            '--method',
+            choices=METHODS,
+            default='infomap',
+            help='the clustering method; the default is infomap')
+        eval_args.add_argument(
+            '--threshold',
+            type=lambda x: number_in_interval(x, float, [0, 1]),
+            default=0.5,
+            help='the clustering distance threshold; the default is 0.5')
+
+        io_args = self.parser.add_argument_group('optional arguments - input/output')
+        io_args.add_argument(
+            '-o', '--output',
+            help=(
+                'path where to write the results table as csv; '
+                'by default it is printed to stdout'))
+        io_args.add_argument(
+            '--model-dir',
+            help=(
+                'directory where to save the models of the configs trained '
+                'until convergence, as algorithm_m=M,α=A,c=C.algorithm'))
+        io_args.add_argument(
+            '-j', '--jobs',
+            type=lambda x: number_in_interval(x, int, [1, float('inf')]),
+            default=1,
+            help=(
+                'number of worker processes to train the configs in; '
+                'the results do not depend on it; the default is 1'))
+
+        other_args = self.parser.add_argument_group('optional arguments - other')
+        other_args.add_argument(
+            '-h', '--help',
+            action='help',
+            help='show this help message and exit')
+        other_args.add_argument(
+            '-t', '--time',
+            action='store_true',
+            help='show total running time at the end')
+
+
+    def run(self, raw_args=None):
+        """
+        Parse the given args (if these are None, default to parsing sys.argv,
+        which is what you would want unless you are unit testing), tune, and
+        print or write the results table, best configs first.
+        """
         args = self.parser.parse_args(raw_args)
 
+        if args.min_epochs <= 0:
+            self.parser.error('--min-epochs should be greater than 0')
+
+        start_time = time.time()
+
         try:
-            dataset_true = Dataset(args.dataset_true, args.dialect_true)
-            dataset_pred = Dataset(args.dataset_pred, args.dialect_pred)
+            dataset = PairsDataset(args.dataset)
+            eval_datasets = [read_dataset(path, args.dialect_input, args.ipa, cog_sets=True)
+                    for path in args.eval_datasets]
+
+            results = tune(args.algorithm, dataset, eval_datasets,
+                    get_configs(args.alphas, args.batch_sizes, args.initial_cutoffs),
+                    num_workers=args.jobs, eta=args.eta if args.early_stop else None,
+                    min_epochs=args.min_epochs, random_seed=args.random_seed,
+                    threshold=args.threshold, method=args.method)
         except DatasetError as err:
             self.parser.error(str(err))
 
-        score = calc_f_score(dataset_true.get_clusters(), dataset_pred.get_clusters())
-        print('{:.4f}'.format(score))
+        results.sort(key=lambda result: -result['f_score'])
+
+        if args.model_dir:
+            self.save_models(args, results)
+
+        if args.output:
+            try:
+                with open(args.output, 'w', encoding='utf-8', newline='') as f:
+                    writer = csv.writer(f)
+                    writer.writerow(TUNE_COLUMNS)
+                    writer.writerows([[result[column] for column in TUNE_COLUMNS]
+                            for result in results])
+            except OSError:
+                self.parser.error('Could not write file: {}'.format(args.output))
+        else:
+            print('\t'.join(TUNE_COLUMNS))
+            for result in results:
+                print('{alpha}\t{batch_size}\t{initial_cutoff}\t{epochs:.2f}\t'
+                        '{status}\t{f_score:.4f}\t{train_sec:.2f}'.format(**result))
+
+        if args.time:
+            print('running time: {:.2f} sec'.format(time.time() - start_time))
+
+
+    def save_models(self, args, results):
+        """
+        Save the models of the configs that were trained until convergence
+        into the --model-dir.
+        """
+        for result in results:
+            if result['status'] != 'done':
+                continue
+
+            path = os.path.join(args.model_dir, '{0}_m={1},α={2},c={3}.{0}'.format(
+                    args.algorithm, result['batch_size'], result['alpha'],
+                    result['initial_cutoff']))
+
+            hyperparams = {
+                'initial_cutoff': result['initial_cutoff'],
+                'alpha': result['alpha'],
+                'batch_size': result['batch_size'],
+                'random_seed': args.random_seed,
+                'dataset': os.path.basename(args.dataset),
+                'num_updates': result['state']['num_updates']}
+
+            try:
+                save_model(path, args.algorithm,
+                        get_model(args.algorithm, result['state']), hyperparams)
+            except ModelError as err:
+                self.parser.error(str(err))
+
+
+
+class QueryCli:
+    """
+    Handles the user input, invokes the corresponding code, and takes care of
+    exiting the programme for looking up the words of a dataset that are most
+    similar to given transcriptions.
+
+    Usage:
+        if __name__ == '__main__':
+            cli = QueryCli()
+            cli.run()
+    """
+
+    def __init__(self):
+        """
+        Init the argparse parser.
+        """
+        self.parser = argparse.ArgumentParser(add_help=False, description=(
+            'index the words of a dataset and output the ones most similar '
+            'to the given transcriptions under a pmi or phmm model; only the '
+            'words sharing most sound bigrams with a transcription are scored '
+            'with the model'))
+
+        self.parser.add_argument(
+            'model',
+            help='path to a trained model file')
+        self.parser.add_argument(
+            'dataset',
+            help='path to a dataset to look the words up in')
+        self.parser.add_argument(
+            'queries',
+            nargs='*',
+            help=(
+                'transcriptions to look up; if none are given, these are read '
+                'from stdin, one per line, and answered as they come'))
+
+        query_args = self.parser.add_argument_group('optional arguments - query')
+        query_args.add_argument(
+            '-k',
+            type=lambda x: number_in_interval(x, int, [1, float('inf')]),
+            default=10,
+            help='the number of words to output per query; the default is 10')
+        query_args.add_argument(
+            '-c', '--candidates',
+            type=lambda x: number_in_interval(x, int, [1, float('inf')]),
+            default=NUM_CANDIDATES,
+            help=(
+                'the number of candidate transcriptions to score with the '
+                'model per query; more candidates are slower but less likely '
+                'to miss similar words; the default is {}'.format(NUM_CANDIDATES)))
+        query_args.add_argument(
+            '--concept',
+            help='only look up the words of this concept')
+
+        io_args = self.parser.add_argument_group('optional arguments - input/output')
+        io_args.add_argument(
+            '--dialect-input',
+            choices=csv.list_dialects(),
+            help=(
+                'the csv dialect to use for reading the dataset; '
+                'the default is to look at the file extension '
+                'and use excel for .csv and excel-tab for .tsv'))
+        io_args.add_argument(
+            '-i', '--ipa',
+            action='store_true',
+            help=(
+                'convert the dataset\'s and the queries\' transcriptions from '
+                'IPA to ASJP; by default these are assumed to be ASJP'))
+        io_args.add_argument(
+            '--allow-pickle',
+            action='store_true',
+            help=(
+                'allow loading models saved as pickle files by older versions; '
+                'only use this for files from a trusted source'))
+
+        other_args = self.parser.add_argument_group('optional arguments - other')
+        other_args.add_argument(
+            '-h', '--help',
+            action='help',
+            help='show this help message and exit')
+        other_args.add_argument(
+            '-t', '--time',
+            action='store_true',
+            help='show the time it took to build the index and to answer each query')
+
+
+    def run(self, raw_args=None):
+        """
+        Parse the given args (if these are None, default to parsing sys.argv,
+        which is what you would want unless you are unit testing), build the
+        index and answer the queries, writing a tab-separated line per word
+        found with the query, the rank, the distance, and the word's doculect,
+        concept and transcription.
+        """
+        args = self.parser.parse_args(raw_args)
+
+        start_time = time.time()
+
+        try:
+            dataset = Dataset(args.dataset, args.dialect_input, args.ipa)
+            algorithm, params = load_model(args.model, allow_pickle=args.allow_pickle)
+            index = WordIndex(dataset, algorithm, params)
+        except (DatasetError, ModelError) as err:
+            self.parser.error(str(err))
+
+        if args.time:
+            print('index time: {:.2f} sec'.format(time.time() - start_time),
+                    file=sys.stderr)
+
+        if args.concept is not None and args.concept not in index.concept_positions:
+            self.parser.error('Unknown concept: {}'.format(args.concept))
+
+        queries = args.queries if args.queries else (line.strip() for line in sys.stdin)
+        writer = csv.writer(sys.stdout, dialect='excel-tab')
+
+        for query in queries:
+            if not query:
+                continue
+
+            start_time = time.time()
+
+            try:
+                results = index.query(clean_transcription(query, args.ipa),
+                        args.k, args.candidates, args.concept)
+            except QueryError as err:
+                print('{}: {}'.format(query, err), file=sys.stderr)
+                continue
+
+            for rank, (word, distance) in enumerate(results, 1):
+                writer.writerow([query, rank, '{:.4f}'.format(distance),
+                        word.doculect, word.concept, word.asjp])
+
+            sys.stdout.flush()
+
+            if args.time:
+                print('query time: {:.1f} ms'.format(1000 * (time.time() - start_time)),
+                        file=sys.stderr)
+
+
+
+class DiscoverCli:
+    """
+    Handles the user input, invokes the corresponding code, and takes care of
+    exiting the programme for finding similar words of different concepts.
+
+    Usage:
+        if __name__ == '__main__':
+            cli = DiscoverCli()
+            cli.run()
+    """
+
+    def __init__(self):
+        """
+        Init the argparse parser.
+        """
+        self.parser = argparse.ArgumentParser(add_help=False, description=(
+            'find the pairs of words of different concepts in a dataset that '
+            'are within a distance threshold under a pmi or phmm model, e.g. '
+            'cognates with shifted meanings; only the pairs of transcriptions '
+            'that locality-sensitive hashing of their sound bigrams finds '
+            'likely to be similar are scored with the model'))
+
+        self.parser.add_argument(
+            'model',
+            help='path to a trained model file')
+        self.parser.add_argument(
+            'dataset',
+            help='path to a dataset to look for the word pairs in')
+
+        algo_args = self.parser.add_argument_group('optional arguments - discovery')
+        algo_args.add_argument(
+            '--threshold',
+            type=lambda x: number_in_interval(x, float, [0, 1]),
+            default=0.5,
+            help=(
+                'the distance threshold for outputting a pair; should be '
+                'within the interval [0.0; 1.0]; the default value is 0.5; '
+                'phmm distances are 1 - score and lie within [0.0; 0.5), '
+                'so these need a lower threshold'))
+        algo_args.add_argument(
+            '--bands',
+            type=lambda x: number_in_interval(x, int, [1, float('inf')]),
+            default=32,
+            help=(
+                'the number of hash bands; more bands find more pairs of '
+                'dissimilar transcriptions; the default is 32'))
+        algo_args.add_argument(
+            '--band-size',
+            type=lambda x: number_in_interval(x, int, [1, float('inf')]),
+            default=4,
+            help=(
+                'the number of hashes per band; larger bands only find pairs '
+                'of more similar transcriptions; the default is 4'))
+        algo_args.add_argument(
+            '--max-bucket',
+            type=lambda x: number_in_interval(x, int, [2, float('inf')]),
+            default=200,
+            help=(
+                'skip the hash buckets of more transcriptions than this, as '
+                'these mostly make pairs of dissimilar ones; the default is 200'))
+
+        io_args = self.parser.add_argument_group('optional arguments - input/output')
+        io_args.add_argument(
+            '--dialect-input',
+            choices=csv.list_dialects(),
+            help=(
+                'the csv dialect to use for reading the dataset; '
+                'the default is to look at the file extension '
+                'and use excel for .csv and excel-tab for .tsv'))
+        io_args.add_argument(
+            '--dialect-output',
+            choices=csv.list_dialects(), default='excel-tab',
+            help=(
+                'the csv dialect to use for writing the output; '
+                'the default is excel-tab'))
+        io_args.add_argument(
+            '-o', '--output',
+            help=(
+                'path where to write the word pairs, least distant first; '
+                'defaults to stdout'))
+        io_args.add_argument(
+            '-i', '--ipa',
+            action='store_true',
+            help=(
+                'convert input transcriptions from IPA to ASJP; '
+                'by default these are assumed to be ASJP'))
+        io_args.add_argument(
+            '--allow-pickle',
+            action='store_true',
+            help=(
+                'allow loading models saved as pickle files by older versions; '
+                'only use this for files from a trusted source'))
+
+        other_args = self.parser.add_argument_group('optional arguments - other')
+        other_args.add_argument(
+            '-h', '--help',
+            action='help',
+            help='show this help message and exit')
+        other_args.add_argument(
+            '-t', '--time',
+            action='store_true',
+            help=(
+                'show the number of candidate pairs scored and the total '
+                'running time at the end'))
+
+
+    def run(self, raw_args=None):
+        """
+        Parse the given args (if these are None, default to parsing sys.argv,
+        which is what you would want unless you are unit testing).
+        """
+        args = self.parser.parse_args(raw_args)
+
+        start_time = time.time()
+
+        try:
+            dataset = Dataset(args.dataset, args.dialect_input, args.ipa)
+            algorithm, params = load_model(args.model, allow_pickle=args.allow_pickle)
+            index = WordIndex(dataset, algorithm, params)
+
+            candidates = index.get_cross_concept_candidates(
+                    args.bands, args.band_size, args.max_bucket)
+            pairs = index.find_cross_concept_pairs(candidates, args.threshold)
+        except (DatasetError, ModelError, QueryError) as err:
+            self.parser.error(str(err))
+
+        try:
+            f = open(args.output, 'w', encoding='utf-8', newline='') \
+                    if args.output else sys.stdout
+        except OSError:
+            self.parser.error('Could not write output file: {}'.format(args.output))
+
+        try:
+            writer = csv.writer(f, dialect=args.dialect_output)
+            writer.writerow(['doculect1', 'concept1', 'asjp1',
+                    'doculect2', 'concept2', 'asjp2', 'distance'])
+
+            for word1, word2, distance in pairs:
+                writer.writerow(list(word1) + list(word2) + ['{:.4f}'.format(distance)])
+        finally:
+            if f is not sys.stdout:
+                f.close()
+
+        if args.time:
+            num_forms = len(index.forms)
+            print('scored {} of {} pairs of distinct transcriptions, found {} word pairs'.format(
+                    len(candidates), num_forms * (num_forms + 1) // 2, len(pairs)),
+                    file=sys.stderr)
+            print('running time: {:.2f} sec'.format(time.time() - start_time), file=sys.stderr)
@@ -1,9 +1,30 @@
 import collections
+import contextlib
 import itertools
+import multiprocessing
+import random
 
 import igraph
 import numpy as np
 
+from online_cognacy_ident.index import QGramIndex
+from online_cognacy_ident.profiling import profiled
+from online_cognacy_ident.scores import get_condensed
+
+
+
+"""
+The clustering methods that the cluster func accepts. The first five are run
+by igraph, the next three are implemented with NumPy and avoid building a
+graph. Auto uses AUTO_METHOD for concepts of up to AUTO_MAX_SIZE words and
+infomap for the larger ones.
+"""
+METHODS = ['infomap', 'labelprop', 'ebet', 'multilevel', 'spinglass',
+        'components', 'upgma', 'labelprop-np', 'auto']
+
+AUTO_METHOD = 'upgma'
+AUTO_MAX_SIZE = 200
+
 
 
 def igraph_clustering(matrix, threshold, method='infomap'):
@@ -14,21 +35,331 @@ def igraph_clustering(matrix, threshold, method='infomap'):
     This is originally taken from and builds on LingPy's infomap_clustering
     function.
     """
-    G = igraph.Graph()
-    vertex_weights = []
-    for i in range(len(matrix)):
-        G.add_vertex(i)
-        vertex_weights += [0]
-
-    # variable stores edge weights, if they are not there, the network is
-    # already separated by the threshold
-    weights = None
-    for i,row in enumerate(matrix):
-        for j,cell in enumerate(row):
-            if i < j:
-                if cell <= threshold:
-                    G.add_edge(i, j, weight=1-cell, distance=cell)
-                    weights = 'weight'
+    matrix = np.asarray(matrix)
+    rows, cols = np.triu_indices(len(matrix), k=1)
+
+    return condensed_clustering(matrix[rows, cols], len(matrix), threshold, method)
+
+
+
+def condensed_clustering(condensed, size, threshold, method='infomap'):
+    """
+    Same as igraph_clustering but takes a condensed distance matrix, i.e. the
+    distances of the (i, j) pairs with i < j in row-major order, which is also
+    the order of itertools.combinations, along with the number of vertices.
+
+    Besides igraph's algorithms, the method can be one of the NumPy-based
+    components, upgma and labelprop-np, or auto (see AUTO_METHOD).
+    """
+    condensed = np.asarray(condensed, dtype=float)
+
+    if method == 'auto':
+        method = AUTO_METHOD if size <= AUTO_MAX_SIZE else 'infomap'
+
+    if method == 'upgma':
+        return upgma_clustering(condensed, size, threshold)
+
+    rows, cols = np.triu_indices(size, k=1)
+
+    # only the pairs within the threshold are connected
+    mask = condensed <= threshold
+    edges = list(zip(rows[mask].tolist(), cols[mask].tolist()))
+
+    return graph_clustering(size, edges, condensed[mask], method)
+
+
+
+def components_clustering(size, edges, labels=None):
+    """
+    Return a {vertex: label} dict assigning the vertices of each connected
+    component of the graph the same label, the graph having the given number
+    of vertices and [] of (i, j) edges.
+
+    The labels are propagated along the edges with NumPy, each vertex taking
+    the smallest label among its neighbours', until nothing changes. The
+    labels of the components of a subgraph can be given as an array to start
+    from, in which case only the edges that are not in the subgraph need to
+    be given.
+    """
+    labels = np.arange(size) if labels is None else np.asarray(labels)
+    rows, cols = np.array(edges, dtype=int).reshape(-1, 2).T
+
+    # each component's label is its smallest vertex, so the new edges can be
+    # moved onto these and the components merged as vertices
+    rows, cols = labels[rows], labels[cols]
+    roots = np.arange(size)
+
+    while True:
+        new_roots = roots.copy()
+        np.minimum.at(new_roots, rows, roots[cols])
+        np.minimum.at(new_roots, cols, roots[rows])
+        new_roots = new_roots[new_roots]
+
+        if np.array_equal(new_roots, roots):
+            break
+
+        roots = new_roots
+
+    return dict(enumerate(roots[labels].tolist()))
+
+
+
+def upgma_merges(condensed, size, threshold):
+    """
+    Generate the (distance, i, j) merges of UPGMA, i.e. average linkage, on a
+    condensed distance matrix: the two closest clusters, represented by their
+    smallest vertices i < j, are merged, and their distance to the rest is the
+    average over their members, for as long as the closest clusters are
+    within the threshold. The distances are non-decreasing.
+
+    Helper for the upgma_clustering and sweep_concept funcs.
+    """
+    matrix = np.full((size, size), np.inf)
+    rows, cols = np.triu_indices(size, k=1)
+    matrix[rows, cols] = matrix[cols, rows] = condensed
+
+    sizes = np.ones(size)
+
+    for _ in range(size - 1):
+        i, j = divmod(int(np.argmin(matrix)), size)
+        if matrix[i, j] > threshold:
+            break
+
+        yield matrix[i, j], i, j
+
+        merged = (sizes[i] * matrix[i] + sizes[j] * matrix[j]) / (sizes[i] + sizes[j])
+        matrix[i, :] = matrix[:, i] = merged
+        matrix[j, :] = matrix[:, j] = np.inf
+        matrix[i, i] = np.inf
+
+        sizes[i] += sizes[j]
+
+
+
+def upgma_clustering(condensed, size, threshold):
+    """
+    Return a {vertex: label} dict clustering the vertices by UPGMA, i.e.
+    average linkage, stopping once the closest clusters are further apart
+    than the threshold. The first arg should be a condensed distance matrix.
+    """
+    labels = np.arange(size)
+
+    for _, i, j in upgma_merges(condensed, size, threshold):
+        labels[labels == j] = i
+
+    return dict(enumerate(labels.tolist()))
+
+
+
+def labelprop_clustering(size, edges, distances, max_iter=100):
+    """
+    Return a {vertex: label} dict clustering the vertices by label propagation
+    on the graph with the given number of vertices and [] of (i, j) edges, the
+    latter weighted by 1 - distance.
+
+    Unlike igraph's version, this one is deterministic: the vertices are
+    visited in order, each taking the label with the largest total weight
+    among its neighbours (keeping its own label or else the smallest one on
+    ties), until no label changes or max_iter rounds have been done.
+    """
+    weights = np.zeros((size, size))
+    if edges:
+        rows, cols = np.array(edges, dtype=int).T
+        weights[rows, cols] = weights[cols, rows] = 1 - np.asarray(distances)
+
+    labels = np.arange(size)
+
+    for _ in range(max_iter):
+        changed = False
+
+        for i in range(size):
+            votes = np.bincount(labels, weights=weights[i], minlength=size)
+            if votes.max() == 0 or votes[labels[i]] == votes.max():
+                continue
+
+            labels[i] = np.argmax(votes)
+            changed = True
+
+        if not changed:
+            break
+
+    return dict(enumerate(labels.tolist()))
+
+
+
+def sweep_concept(condensed, size, thresholds, method='infomap', seed=42):
+    """
+    Cluster a single concept, given as a condensed distance matrix and the
+    number of words, at each of the given thresholds. Return a list of
+    {vertex: label} dicts, one per threshold.
+
+    As edges only appear as the threshold rises, the thresholds are visited in
+    increasing order and no graph is built from scratch for each: components
+    only merges the components that the new edges connect, upgma cuts a
+    single merge sequence, and the igraph methods take the edge-induced
+    subgraphs of one Graph built for the largest threshold. The subgraphs keep
+    the edges in the same order as igraph_clustering, as InfoMap's output can
+    depend on the order of equally weighted edges; so the output is the same
+    as that of condensed_clustering at each threshold.
+    """
+    condensed = np.asarray(condensed, dtype=float)
+    order = sorted(range(len(thresholds)), key=lambda i: thresholds[i])
+
+    results = [None] * len(thresholds)
+
+    if method == 'auto':
+        method = AUTO_METHOD if size <= AUTO_MAX_SIZE else 'infomap'
+
+    if method == 'upgma':
+        merges = list(upgma_merges(condensed, size, max(thresholds)))
+        labels = np.arange(size)
+        done = 0
+
+        for i in order:
+            while done < len(merges) and merges[done][0] <= thresholds[i]:
+                _, a, b = merges[done]
+                labels[labels == b] = a
+                done += 1
+
+            results[i] = dict(enumerate(labels.tolist()))
+
+        return results
+
+    rows, cols = np.triu_indices(size, k=1)
+    edge_order = np.argsort(condensed, kind='mergesort')
+    sorted_distances = condensed[edge_order]
+
+    if method not in ['components', 'labelprop-np']:
+        mask = condensed <= max(thresholds)
+        G = igraph.Graph(n=size, edges=list(zip(rows[mask].tolist(), cols[mask].tolist())))
+        G.vs['name'] = list(range(size))
+        G.es['weight'] = (1 - condensed[mask]).tolist()
+        G.es['distance'] = condensed[mask].tolist()
+
+        # the ids of the graph's edges, sorted by distance
+        edge_ids = np.argsort(condensed[mask], kind='mergesort')
+
+    labels = np.arange(size)
+    done = 0
+
+    for i in order:
+        cut = int(np.searchsorted(sorted_distances, thresholds[i], side='right'))
+
+        if method == 'components':
+            new = edge_order[done:cut]
+            labels = components_clustering(size,
+                    list(zip(rows[new].tolist(), cols[new].tolist())), labels)
+            labels = np.array([labels[index] for index in range(size)])
+            results[i] = dict(enumerate(labels.tolist()))
+
+        elif method == 'labelprop-np':
+            within = np.sort(edge_order[:cut])
+            results[i] = labelprop_clustering(size,
+                    list(zip(rows[within].tolist(), cols[within].tolist())),
+                    condensed[within])
+
+        else:
+            subgraph = G.subgraph_edges(
+                    np.sort(edge_ids[:cut]).tolist(), delete_vertices=False)
+
+            with seeded_random(seed):
+                results[i] = community_labels(subgraph, method)
+
+        done = cut
+
+    return results
+
+
+
+def _sweep_concept(task):
+    """
+    Run sweep_concept on a (condensed distance matrix, number of words,
+    thresholds, methods, seed) tuple for each of the methods. Return a
+    {method: [labels per threshold]} dict, where the labels are lists.
+
+    Helper for the sweep func; this is what the worker processes run.
+    """
+    condensed, size, thresholds, methods, seed = task
+
+    return {method: [
+        [index_labels[index] for index in range(size)]
+        for index_labels in sweep_concept(condensed, size, thresholds, method, seed)]
+        for method in methods}
+
+
+
+@contextlib.contextmanager
+def seeded_random(seed):
+    """
+    Context manager seeding the random module, which igraph draws from, with
+    the given seed and restoring its previous state on exit, so that seeding
+    the clustering does not affect the caller's random numbers.
+    """
+    state = random.getstate()
+    random.seed(seed)
+    try:
+        yield
+    finally:
+        random.setstate(state)
+
+
+
+def _cluster_concept(task):
+    """
+    Cluster a single concept given as a (condensed distance matrix, number of
+    words, threshold, method, seed) tuple. Return the list of the words'
+    cluster labels.
+
+    Helper for the cluster func; this is what the worker processes run. The
+    random module, which igraph draws from, is seeded anew for each concept
+    so that the output does not depend on which process handles what; its
+    state is restored afterwards.
+    """
+    condensed, size, threshold, method, seed = task
+
+    with seeded_random(seed):
+        index_labels = condensed_clustering(condensed, size, threshold, method)
+
+    return [index_labels[index] for index in range(size)]
+
+
+
+def graph_clustering(size, edges, distances, method='infomap'):
+    """
+    Run one of igraph's community structure finding algorithms on the graph
+    with the given number of vertices and [] of (i, j) edges, the latter
+    weighted by their distances. Return a {vertex: label} dict. The method can
+    also be components or labelprop-np, which are run without igraph.
+
+    Helper for the condensed_clustering and knn_cluster funcs.
+    """
+    distances = np.asarray(distances, dtype=float)
+
+    if method == 'components':
+        return components_clustering(size, edges)
+    elif method == 'labelprop-np':
+        return labelprop_clustering(size, edges, distances)
+
+    G = igraph.Graph(n=size, edges=edges)
+    G.vs['name'] = list(range(size))
+    G.es['weight'] = (1 - distances).tolist()
+    G.es['distance'] = distances.tolist()
+
+    return community_labels(G, method)
+
+
+
+def community_labels(G, method='infomap'):
+    """
+    Run one of igraph's community structure finding algorithms on an igraph
+    Graph whose vertices are named by their indices and whose edges have
+    weight attributes. Return a {vertex: label} dict.
+
+    Helper for the graph_clustering and sweep_concept funcs.
+    """
+    # if there are no edges, the network is already separated by the
+    # threshold and there are no edge weights to pass on
+    weights = 'weight' if G.ecount() else None
 
     if method == 'infomap':
         comps = G.community_infomap(edge_weights=weights,
@@ -41,21 +372,22 @@ def igraph_clustering(matrix, threshold, method='infomap'):
     elif method == 'ebet':
         dg = G.community_edge_betweenness(weights=weights)
         oc = dg.optimal_count
-        comps = False
-        while oc <= len(G.vs):
+        comps = None
+        while oc <= G.vcount():
             try:
-                comps = dg.as_clustering(dg.optimal_count)
+                comps = dg.as_clustering(oc)
                 break
-            except:
+            except Exception:
                 oc += 1
-        if not comps:
-            print('Failed...')
-            comps = list(range(len(G.sv)))
-            input()
+        if comps is None:
+            # no cut of the dendrogram works, put each vertex on its own
+            return {v['name']: i for i, v in enumerate(G.vs)}
     elif method == 'multilevel':
         comps = G.community_multilevel(return_levels=False)
     elif method == 'spinglass':
         comps = G.community_spinglass()
+    else:
+        raise ValueError('Unknown clustering method: {}'.format(method))
 
     D = {}
     for i, comp in enumerate(comps.subgraphs()):
@@ -67,28 +399,107 @@ def igraph_clustering(matrix, threshold, method='infomap'):
 
 
 
-def cluster(dataset, scores, threshold=0.5, method='infomap'):
+@profiled('clustering')
+def cluster(dataset, scores, threshold=0.5, method='infomap', jobs=1, seed=42):
     """
     Cluster the dataset's synonymous words into cognate sets based on distance
     scores between each pair of words. Return a dict mapping concepts to frozen
     sets of frozen sets of Word tuples.
 
-    The second arg should be a {(word1, word2): distance} dict where the keys
-    are sorted Word named tuples tuples. The keyword args are passed on to the
-    InfoMap algorithm.
+    The second arg should be a Scores instance, as returned by the apply_*
+    funcs, or a {(word1, word2): distance} dict where the keys are sorted Word
+    named tuples. The threshold and method args are passed on to the InfoMap
+    algorithm.
+
+    If jobs is more than 1, the concepts are clustered in that many worker
+    processes, largest concepts first; each worker only receives the
+    concept's condensed distance matrix. The output is the same regardless of
+    the number of jobs as igraph's random number generator is seeded with the
+    given seed before clustering each concept.
     """
+    concepts = []
+    tasks = []
+
+    for concept, words in dataset.get_concepts().items():
+        if len(words) <= 1: continue
+
+        condensed = get_condensed(scores, concept, words)
+
+        concepts.append((concept, words))
+        tasks.append((condensed, len(words), threshold, method, seed))
+
+    order = sorted(range(len(tasks)), key=lambda i: (-tasks[i][1], concepts[i][0]))
+
+    if jobs > 1:
+        with multiprocessing.Pool(jobs) as pool:
+            results = pool.map(_cluster_concept, [tasks[i] for i in order], chunksize=1)
+    else:
+        results = [_cluster_concept(tasks[i]) for i in order]
+
+    results = dict(zip(order, results))
+    clusters = {}
+
+    for i, (concept, words) in enumerate(concepts):
+        labels = results[i]
+
+        cog_sets = collections.defaultdict(set)
+        for index, label in enumerate(labels):
+            cog_sets[label].add(words[index])
+
+        clusters[concept] = frozenset([frozenset(s) for s in cog_sets.values()])
+
+    return clusters
+
+
+
+@profiled('clustering')
+def knn_cluster(dataset, scorer, k=10, threshold=0.5, method='infomap',
+        num_candidates=None, seed=42):
+    """
+    Cluster the dataset's synonymous words into cognate sets on a sparse graph
+    that only links each word to its k nearest neighbours within the
+    threshold. Return a dict mapping concepts to frozen sets of frozen sets of
+    Word tuples, same as the cluster func.
+
+    The scorer should be a callable returning the distance between two ASJP
+    transcriptions. Rather than scoring all pairs, each word is only scored
+    against the num_candidates words (3k by default) that share most q-grams
+    with it, as found by a QGramIndex; so that most pairs of a large concept
+    are never scored. As in the cluster func, igraph's random number generator
+    is seeded with the given seed before clustering each concept.
+    """
+    if method in ['upgma', 'auto']:
+        raise ValueError('The {} method needs the full distance matrix'.format(method))
+
+    if num_candidates is None:
+        num_candidates = 3 * k
+
     clusters = {}
 
     for concept, words in dataset.get_concepts().items():
         if len(words) <= 1: continue
 
-        matrix = np.zeros((len(words), len(words),))
+        qgram_index = QGramIndex([word.asjp for word in words])
+        distances = {}  # (i, j): distance, with i < j
+        edges = set()
+
+        for i, word in enumerate(words):
+            neighbours = []
 
-        for (i, word1), (j, word2) in itertools.combinations(enumerate(words), 2):
-            key = (word1, word2) if word1 < word2 else (word2, word1)
-            matrix[j, i] = matrix[i, j] = scores[key]
+            for j in qgram_index.get_candidates(word.asjp, num_candidates, exclude=i):
+                key = (i, j) if i < j else (j, i)
+                if key not in distances:
+                    distances[key] = scorer(words[key[0]].asjp, words[key[1]].asjp)
+                if distances[key] <= threshold:
+                    neighbours.append((distances[key], key))
 
-        index_labels = igraph_clustering(matrix, threshold, method)
+            edges.update([key for _, key in sorted(neighbours)[:k]])
+
+        edges = sorted(edges)
+
+        with seeded_random(seed):
+            index_labels = graph_clustering(len(words), edges,
+                    [distances[edge] for edge in edges], method)
 
         cog_sets = collections.defaultdict(set)
         for index, label in index_labels.items():
@@ -97,3 +508,109 @@ def cluster(dataset, scores, threshold=0.5, method='infomap'):
         clusters[concept] = frozenset([frozenset(s) for s in cog_sets.values()])
 
     return clusters
+
+
+
+@profiled('clustering')
+def sweep(dataset, scores, thresholds, methods=['infomap'], jobs=1, seed=42):
+    """
+    Cluster the dataset's synonymous words into cognate sets at each of the
+    given thresholds with each of the given methods, re-using the same scores.
+    Return a {(method, threshold): clusters} dict, where the clusters are as
+    returned by the cluster func.
+
+    The graphs are built incrementally as the threshold rises (see the
+    sweep_concept func); the other args are as in the cluster func.
+    """
+    concepts = []
+    tasks = []
+
+    for concept, words in dataset.get_concepts().items():
+        if len(words) <= 1: continue
+
+        condensed = get_condensed(scores, concept, words)
+
+        concepts.append((concept, words))
+        tasks.append((condensed, len(words), list(thresholds), list(methods), seed))
+
+    order = sorted(range(len(tasks)), key=lambda i: (-tasks[i][1], concepts[i][0]))
+
+    if jobs > 1:
+        with multiprocessing.Pool(jobs) as pool:
+            results = pool.map(_sweep_concept, [tasks[i] for i in order], chunksize=1)
+    else:
+        results = [_sweep_concept(tasks[i]) for i in order]
+
+    results = dict(zip(order, results))
+    sweeps = {(method, threshold): {} for method in methods for threshold in thresholds}
+
+    for i, (concept, words) in enumerate(concepts):
+        for method in methods:
+            for threshold, labels in zip(thresholds, results[i][method]):
+                cog_sets = collections.defaultdict(set)
+                for index, label in enumerate(labels):
+                    cog_sets[label].add(words[index])
+
+                sweeps[(method, threshold)][concept] = frozenset([
+                    frozenset(s) for s in cog_sets.values()])
+
+    return sweeps
+
+
+
+@profiled('clustering')
+def update_clusters(scores, prev_clusters, threshold=0.5, method='infomap',
+        recluster_ratio=0.2, seed=42):
+    """
+    Update a previous clustering to take into account the words that are in
+    the Scores instance but not in the {concept: cog_sets} prev_clusters, e.g.
+    the words of newly added doculects. Return a dict mapping concepts to
+    frozen sets of frozen sets of Word tuples.
+
+    The new words of a concept are assigned one by one to the cluster with
+    the smallest average distance to them, if that is within the threshold,
+    or else start a new cluster. If the new words make up more than
+    recluster_ratio of the concept's words (or the concept is new), the whole
+    concept is re-clustered with the given method instead. Words that are not
+    in the scores any more are left out.
+    """
+    clusters = {}
+
+    for concept in scores.get_concepts():
+        words, condensed = scores.get_condensed(concept)
+        if len(words) <= 1: continue
+
+        index = {word: i for i, word in enumerate(words)}
+        old_sets = [[index[word] for word in cog_set if word in index]
+                for cog_set in prev_clusters.get(concept, [])]
+        old_sets = [cog_set for cog_set in old_sets if cog_set]
+
+        new_words = set(range(len(words))) - set(itertools.chain(*old_sets))
+
+        if not old_sets or len(new_words) > recluster_ratio * len(words):
+            labels = _cluster_concept((condensed, len(words), threshold, method, seed))
+
+            cog_sets = collections.defaultdict(set)
+            for i, label in enumerate(labels):
+                cog_sets[label].add(words[i])
+
+            clusters[concept] = frozenset([frozenset(s) for s in cog_sets.values()])
+            continue
+
+        matrix = np.zeros((len(words), len(words)))
+        rows, cols = np.triu_indices(len(words), k=1)
+        matrix[rows, cols] = matrix[cols, rows] = condensed
+
+        for i in sorted(new_words):
+            distances = [matrix[i, cog_set].mean() for cog_set in old_sets]
+            nearest = int(np.argmin(distances))
+
+            if distances[nearest] <= threshold:
+                old_sets[nearest].append(i)
+            else:
+                old_sets.append([i])
+
+        clusters[concept] = frozenset([
+            frozenset([words[i] for i in cog_set]) for cog_set in old_sets])
+
+    return clusters
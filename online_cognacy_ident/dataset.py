@@ -1,13 +1,16 @@
 from collections import defaultdict, namedtuple
 
 import csv
+import heapq
 import itertools
 import os.path
 import sys
+import tempfile
 
 from lingpy.sequence.sound_classes import ipa2tokens, tokens2class
 
 from online_cognacy_ident.align import normalized_levenshtein
+from online_cognacy_ident.profiling import profiled, stage
 
 
 
@@ -32,6 +35,32 @@ Word = namedtuple('Word', 'doculect, concept, asjp')
 
 
 
+def clean_transcription(raw_trans, is_ipa=False):
+    """
+    Process a raw transcription value into an ASJP transcription:
+    (1) if the input string consists of multiple comma-separated entries,
+    remove all but the first one;
+    (2) remove whitespace chars (the symbols +, - and _ are also considered
+    whitespace and removed);
+    (3) if is_ipa is set, convert the string to ASJP;
+    (4) remove some common non-ASJP offender symbols.
+    """
+    trans = raw_trans.strip().split(',')[0].strip()
+
+    for char in '+-_ ':
+        trans = trans.replace(char, '')
+
+    if is_ipa:
+        with stage('ipa'):
+            trans = ''.join(tokens2class(ipa2tokens(trans), 'asjp'))
+
+    for char in '"$%*~':
+        trans = trans.replace(char, '')
+
+    return trans
+
+
+
 class DatasetError(ValueError):
     """
     Raised when something goes wrong with reading a dataset.
@@ -82,6 +111,7 @@ class Dataset:
         self.is_ipa = is_ipa
 
         self.alphabet = None
+        self.equilibrium = None
 
 
     def _read_header(self, line, exclude=['cog_class']):
@@ -113,28 +143,12 @@ class Dataset:
 
     def _read_asjp(self, raw_trans):
         """
-        Process a raw transcription value into an ASJP transcription:
-        (1) if the input string consists of multiple comma-separated entries,
-        remove all but the first one;
-        (2) remove whitespace chars (the symbols +, - and _ are also considered
-        whitespace and removed);
-        (3) if this is an IPA dataset, convert the string to ASJP;
-        (4) remove some common non-ASJP offender symbols.
+        Process a raw transcription value into an ASJP transcription, as
+        described in clean_transcription.
 
         Helper for the _read_words method.
         """
-        trans = raw_trans.strip().split(',')[0].strip()
-
-        for char in '+-_ ':
-            trans = trans.replace(char, '')
-
-        if self.is_ipa:
-            trans = ''.join(tokens2class(ipa2tokens(trans), 'asjp'))
-
-        for char in '"$%*~':
-            trans = trans.replace(char, '')
-
-        return trans
+        return clean_transcription(raw_trans, self.is_ipa)
 
 
     def _read_words(self, cog_sets=False):
@@ -186,6 +200,7 @@ class Dataset:
         return self.equilibrium
 
 
+    @profiled('read')
     def get_alphabet(self):
         """
         Return a sorted list of all characters found throughout transcriptions
@@ -196,7 +211,7 @@ class Dataset:
 
         self.alphabet = set()
 
-        for word in self.get_words():
+        for word in self._read_unique_words():
             self.alphabet |= set(word.asjp)
 
         self.alphabet = sorted(self.alphabet)
@@ -204,24 +219,32 @@ class Dataset:
         return self.alphabet
 
 
-    def get_words(self):
+    def _read_unique_words(self):
         """
-        Return the [] of Word named tuples comprising the dataset, excluding
-        in-doculect synonyms; i.e. the output should include at most one word
-        per doculect per concept.
+        Generate the dataset's Word entries, skipping in-doculect synonyms.
+        Unlike get_words, this does not keep the words themselves in memory.
 
-        Raise a DatasetError if there is an error reading the file.
+        Helper for the get_words and get_alphabet methods.
         """
-        words = []
         seen = set()
 
         for word in self._read_words():
             key = (word.doculect, word.concept,)
             if key not in seen:
                 seen.add(key)
-                words.append(word)
+                yield word
+
+
+    @profiled('read')
+    def get_words(self):
+        """
+        Return the [] of Word named tuples comprising the dataset, excluding
+        in-doculect synonyms; i.e. the output should include at most one word
+        per doculect per concept.
 
-        return words
+        Raise a DatasetError if there is an error reading the file.
+        """
+        return list(self._read_unique_words())
 
 
     def get_concepts(self):
@@ -240,6 +263,142 @@ class Dataset:
         return d
 
 
+    @profiled('read')
+    def get_concept_sizes(self):
+        """
+        Return a {concept: number of words} dict, excluding in-doculect
+        synonyms. Unlike get_concepts, this does not keep the words in memory.
+
+        Raise a DatasetError if there is an error reading the dataset file.
+        """
+        d = defaultdict(int)
+
+        for word in self._read_unique_words():
+            d[word.concept] += 1
+
+        return dict(d)
+
+
+    @profiled('read')
+    def get_subset(self, concepts, cog_sets=False):
+        """
+        Return a WordsDataset comprising the words of the given concepts only.
+        The subset shares this dataset's alphabet and equilibrium counts. If
+        cog_sets is set, the subset also provides get_clusters.
+
+        Raise a DatasetError if there is an error reading the dataset file.
+        """
+        words, cog_classes = [], []
+        seen = set()
+
+        entries = self._read_words(cog_sets=cog_sets)
+        if not cog_sets:
+            entries = ((word, None) for word in entries)
+
+        for word, cog_class in entries:
+            key = (word.doculect, word.concept,)
+            if word.concept in concepts and key not in seen:
+                seen.add(key)
+                words.append(word)
+                cog_classes.append(cog_class)
+
+        return WordsDataset(words, self.get_alphabet(), self.get_equilibrium(),
+                cog_classes if cog_sets else None)
+
+
+    def _sort_by_concept(self, cog_sets=False, chunk_size=100000):
+        """
+        Generate the same entries as _read_words, but ordered by concept (and
+        by position in the file within each concept). This is an external merge
+        sort: runs of at most chunk_size entries are sorted in memory and
+        written into temporary files which are then merged lazily.
+
+        Helper for the iter_concepts method.
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            run_paths = []
+            entries = enumerate(self._read_words(cog_sets=cog_sets))
+
+            while True:
+                chunk = list(itertools.islice(entries, chunk_size))
+                if not chunk:
+                    break
+
+                if cog_sets:
+                    rows = [[word.concept, index, word.doculect, word.asjp, cog_class]
+                            for index, (word, cog_class) in chunk]
+                else:
+                    rows = [[word.concept, index, word.doculect, word.asjp]
+                            for index, word in chunk]
+
+                path = os.path.join(temp_dir, str(len(run_paths)))
+                with open(path, 'w', encoding='utf-8', newline='') as f:
+                    csv.writer(f, dialect='excel-tab').writerows(
+                            sorted(rows, key=lambda row: (row[0], row[1])))
+
+                run_paths.append(path)
+
+            files = [open(path, encoding='utf-8', newline='') for path in run_paths]
+
+            try:
+                runs = [csv.reader(f, dialect='excel-tab') for f in files]
+                for row in heapq.merge(*runs, key=lambda row: (row[0], int(row[1]))):
+                    word = Word(row[2], row[0], row[3])
+                    yield (word, row[4]) if cog_sets else word
+            finally:
+                for f in files:
+                    f.close()
+
+
+    def iter_concepts(self, presorted=True, cog_sets=False, chunk_size=100000):
+        """
+        Generate (concept, WordsDataset) tuples, one per concept, without ever
+        holding more than a single concept's words in memory. The yielded
+        datasets share this dataset's alphabet and equilibrium counts, so that
+        the scores computed on them are the same as on the whole dataset.
+        In-doculect synonyms are excluded.
+
+        If presorted is set, the file is expected to list the words of each
+        concept in one contiguous block; a DatasetError is raised if a concept
+        re-appears after another one. Otherwise, the entries are first sorted
+        by concept using temporary files (see _sort_by_concept).
+
+        If cog_sets is set, the yielded datasets also provide get_clusters.
+        Raise a DatasetError if there is an error reading the dataset file.
+        """
+        alphabet = self.get_alphabet()
+        equilibrium = self.get_equilibrium()
+
+        if presorted:
+            entries = self._read_words(cog_sets=cog_sets)
+        else:
+            entries = self._sort_by_concept(cog_sets, chunk_size)
+
+        if not cog_sets:
+            entries = ((word, None) for word in entries)
+
+        done = set()
+
+        for concept, group in itertools.groupby(entries, lambda entry: entry[0].concept):
+            if concept in done:
+                raise DatasetError(
+                    'Concept is not in a contiguous block: {}'.format(concept))
+            done.add(concept)
+
+            words, cog_classes = [], []
+            seen = set()
+
+            for word, cog_class in group:
+                if word.doculect not in seen:
+                    seen.add(word.doculect)
+                    words.append(word)
+                    cog_classes.append(cog_class)
+
+            yield concept, WordsDataset(words, alphabet, equilibrium,
+                    cog_classes if cog_sets else None)
+
+
+    @profiled('pairs')
     def get_asjp_pairs(self, cutoff=1.0, as_int_tuples=False):
         """
         Return the list of the pairs of transcriptions of words from different
@@ -276,6 +435,7 @@ class Dataset:
         return pairs
 
 
+    @profiled('read')
     def get_clusters(self):
         """
         Return a {concept: cog_sets} dict where the values are frozen sets of
@@ -301,6 +461,103 @@ class Dataset:
 
 
 
+class WordsDataset:
+    """
+    Provides the Dataset interface over a list of Word tuples that is already
+    in memory, e.g. a single concept's block of a streamed dataset. The words
+    are expected to exclude in-doculect synonyms.
+
+    Usage:
+
+        dataset = WordsDataset(words)
+        for concept, words in dataset.get_concepts().items():
+            print(concept)
+    """
+
+    def __init__(self, words, alphabet=None, equilibrium=None, cog_classes=None):
+        """
+        Set the instance's props. The alphabet and the equilibrium counts are
+        inferred from the words unless these are given; the latter is useful
+        when the words are a subset of a larger dataset.
+
+        If given, cog_classes should be a list of the words' cognate classes,
+        in the same order as the words.
+        """
+        self.words = list(words)
+        self.cog_classes = None if cog_classes is None else list(cog_classes)
+
+        self.alphabet = alphabet
+        self.equilibrium = equilibrium
+
+
+    def get_equilibrium(self):
+        """
+        Return un-normalized equilibrium counts
+        """
+        if self.equilibrium is None:
+            self.equilibrium = defaultdict(float)
+
+            for word in self.words:
+                for char in word.asjp:
+                    self.equilibrium[char] += 1.0
+
+        return self.equilibrium
+
+
+    def get_alphabet(self):
+        """
+        Return a sorted list of all characters found throughout transcriptions
+        in the dataset.
+        """
+        if self.alphabet is None:
+            self.alphabet = sorted(set(itertools.chain.from_iterable(
+                                word.asjp for word in self.words)))
+
+        return self.alphabet
+
+
+    def get_words(self):
+        """
+        Return the [] of Word named tuples comprising the dataset.
+        """
+        return list(self.words)
+
+
+    def get_concepts(self):
+        """
+        Return a {concept: words} dict mapping each concept in the dataset to a
+        [] of Word tuples that belong to that concept.
+        """
+        d = defaultdict(list)
+
+        for word in self.words:
+            d[word.concept].append(word)
+
+        return d
+
+
+    def get_clusters(self):
+        """
+        Return a {concept: cog_sets} dict where the values are frozen sets of
+        frozen sets of Word tuples, comprising the set of cognate sets for that
+        concept. Raise a DatasetError if no cognate classes were provided.
+        """
+        if self.cog_classes is None:
+            raise DatasetError('Could not find the column for cog_class')
+
+        d = defaultdict(set)  # {(concept, cog_class): set of words}
+        clusters = defaultdict(list)  # {concept: [frozenset of words, ..]}
+
+        for word, cog_class in zip(self.words, self.cog_classes):
+            d[(word.concept, cog_class)].add(word)
+
+        for (concept, cog_class), cog_set in d.items():
+            clusters[concept].append(frozenset(cog_set))
+
+        return {key: frozenset(value) for key, value in clusters.items()}
+
+
+
 class PairsDataset:
     """
     Handles the reading of datasets stored in the training_data dir. These are
@@ -325,6 +582,42 @@ class PairsDataset:
 
         self.path = path
         self.alphabet = None
+        self.rows = None
+        self.int_rows = None
+
+
+    @profiled('read')
+    def preload(self, encode=False):
+        """
+        Read the word pairs into memory, so that the file is not read again
+        each time the pairs are asked for, e.g. when training several models
+        on the same data. If encode is set, also keep the pairs as tuples of
+        the letters' indices in the alphabet, see get_asjp_pairs. Raise a
+        DatasetError if there is a problem reading the file. Return the
+        instance itself.
+        """
+        self.rows = list(self._read_pairs())
+        self.get_alphabet()
+
+        if encode:
+            self.int_rows = list(self._encode_rows(self.rows))
+
+        return self
+
+
+    def _encode_rows(self, rows):
+        """
+        Generate the (int tuple, int tuple, edit distance) entries of the given
+        (asjp, asjp, edit distance) entries, the int tuples comprising the
+        indices of the transcriptions' letters in self.alphabet.
+
+        Helper for the preload and get_asjp_pairs methods.
+        """
+        indices = {char: index for index, char in enumerate(self.get_alphabet())}
+
+        for asjp1, asjp2, edit_distance in rows:
+            yield (tuple([indices[char] for char in asjp1]),
+                    tuple([indices[char] for char in asjp2]), edit_distance)
 
 
     def _read_pairs(self):
@@ -332,6 +625,10 @@ class PairsDataset:
         Generate the (asjp, asjp, edit distance) entries from the dataset.
         Raise a DatasetError if there is a problem reading the file.
         """
+        if self.rows is not None:
+            yield from self.rows
+            return
+
         try:
             with open(self.path, encoding='utf-8') as f:
                 reader = csv.reader(f, delimiter='\t')
@@ -346,6 +643,7 @@ class PairsDataset:
             raise DatasetError('Could not read file: {}'.format(self.path))
 
 
+    @profiled('read')
     def get_alphabet(self):
         """
         Return a sorted list of all characters found throughout transcriptions
@@ -365,6 +663,7 @@ class PairsDataset:
         return self.alphabet
 
 
+    @profiled('pairs')
     def get_asjp_pairs(self, cutoff=1.0, as_int_tuples=False):
         """
         Return the list of the pairs of ASJP transcriptions from the dataset.
@@ -375,28 +674,124 @@ class PairsDataset:
 
         Raise a DatasetError if there is an error reading the dataset file.
         """
-        pairs = []
+        rows = (row for row in self._read_pairs() if not row[2] > cutoff)
 
         if as_int_tuples:
-            alphabet = self.get_alphabet()
+            if self.int_rows is not None:
+                rows = (row for row in self.int_rows if not row[2] > cutoff)
+            else:
+                rows = self._encode_rows(rows)
 
-        for asjp1, asjp2, edit_distance in self._read_pairs():
-            if edit_distance > cutoff:
-                continue
+        return [(asjp1, asjp2) for asjp1, asjp2, _ in rows]
 
-            if as_int_tuples:
-                pair = (
-                    tuple([alphabet.index(char) for char in asjp1]),
-                    tuple([alphabet.index(char) for char in asjp2]))
-            else:
-                pair = (asjp1, asjp2)
 
-            pairs.append(pair)
 
-        return pairs
+class ClusterWriter:
+    """
+    Writes cognate set clusters to a csv file with columns: concept, doculect,
+    transcription, cog_class, one batch of concepts at a time. The cog_class
+    column comprises automatically generated id strings of the type
+    concept:number.
 
+    Usage:
 
+        with ClusterWriter(path) as writer:
+            for clusters in batches:
+                writer.write(clusters)
+    """
 
+    def __init__(self, path=None, dialect='excel-tab'):
+        """
+        Open the file and write the header. If path is None, use stdout. Raise
+        a DatasetError if the file cannot be opened.
+        """
+        self.path = path
+
+        if path:
+            try:
+                self.f = open(path, 'w', encoding='utf-8', newline='')
+            except OSError as err:
+                raise DatasetError('Could not open file: {}'.format(path))
+        else:
+            self.f = sys.stdout
+
+        self.writer = csv.writer(self.f, dialect=dialect)
+        self.writer.writerow(['concept', 'doculect', 'transcription', 'cog_class'])
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    @profiled('writing')
+    def write(self, clusters):
+        """
+        Write the rows for a dict mapping concepts to frozen sets of frozen
+        sets of Word named tuples.
+        """
+        for concept, cog_sets in sorted(clusters.items()):
+            for index, cog_set in enumerate(cog_sets):
+                for word in sorted(cog_set):
+                    self.writer.writerow([
+                        word.concept, word.doculect, word.asjp,
+                        '{}:{!s}'.format(concept, index)])
+
+
+    def close(self):
+        """
+        Close the file, unless writing to stdout.
+        """
+        if self.path:
+            self.f.close()
+
+
+
+def assign_shards(concept_sizes, num_shards):
+    """
+    Split the concepts into num_shards sets so that the numbers of word pairs
+    (rather than of concepts) in the shards are as even as possible. The
+    first arg should be a {concept: number of words} dict.
+
+    The concepts are assigned greedily, largest first, to the shard with the
+    fewest pairs so far; ties are broken by concept and by shard index, so
+    that the output only depends on the input.
+    """
+    shards = [set() for _ in range(num_shards)]
+    loads = [0] * num_shards
+
+    for concept, size in sorted(concept_sizes.items(),
+            key=lambda item: (-item[1], item[0])):
+        index = min(range(num_shards), key=lambda i: (loads[i], i))
+        shards[index].add(concept)
+        loads[index] += size * (size - 1) // 2
+
+    return shards
+
+
+
+def merge_clusters(clusters_list):
+    """
+    Merge several {concept: cog_sets} dicts, e.g. as read from the outputs of
+    the shards of a run, into a single dict. Raise a DatasetError if a concept
+    appears in more than one of the dicts.
+    """
+    merged = {}
+
+    for clusters in clusters_list:
+        for concept, cog_sets in clusters.items():
+            if concept in merged:
+                raise DatasetError('Concept found in more than one shard: {}'.format(concept))
+            merged[concept] = cog_sets
+
+    return merged
+
+
+
+@profiled('writing')
 def write_clusters(clusters, path=None, dialect='excel-tab'):
     """
     Write cognate set clusters to a csv file with columns: concept, doculect,
@@ -409,23 +804,5 @@ def write_clusters(clusters, path=None, dialect='excel-tab'):
     If path is None, use stdout. Raise a DatasetError if the file/stdout cannot
     be written into.
     """
-    if path:
-        try:
-            f = open(path, 'w', encoding='utf-8', newline='')
-        except OSError as err:
-            raise DatasetError('Could not open file: {}'.format(path))
-    else:
-        f = sys.stdout
-
-    writer = csv.writer(f, dialect=dialect)
-    writer.writerow(['concept', 'doculect', 'transcription', 'cog_class'])
-
-    for concept, cog_sets in sorted(clusters.items()):
-        for index, cog_set in enumerate(cog_sets):
-            for word in sorted(cog_set):
-                writer.writerow([
-                    word.concept, word.doculect, word.asjp,
-                    '{}:{!s}'.format(concept, index)])
-
-    if path:
-        f.close()
+    with ClusterWriter(path, dialect) as writer:
+        writer.write(clusters)
@@ -1,5 +1,26 @@
 import numpy as np
 
+from online_cognacy_ident.profiling import profiled
+
+
+
+def _contingency(true_labels, labels):
+    """
+    Return the (true ids, predicted ids, cells, cell sizes, true sizes,
+    predicted sizes) tuple of the contingency table of the true and the
+    predicted labels: the items' row and column indices, their flattened cell
+    indices, and the sizes of the cells, the true and the predicted sets.
+
+    Helper for calc_b_cubed and calc_metrics.
+    """
+    _, true_ids = np.unique(true_labels, return_inverse=True)
+    pred_values, pred_ids = np.unique(labels, return_inverse=True)
+
+    cells = true_ids * len(pred_values) + pred_ids
+
+    return (true_ids, pred_ids, cells, np.bincount(cells),
+            np.bincount(true_ids), np.bincount(pred_ids))
+
 
 
 def calc_b_cubed(true_labels, labels):
@@ -7,27 +28,17 @@ def calc_b_cubed(true_labels, labels):
     Calculate the B-cubed (precision, recall, F-score) of a list of cognate set
     labels against the gold-standard version of the same list.
 
-    This function is a (just slightly) modified version of the b_cubed function
-    of PhyloStar's CogDetect library.
-    """
-    precision = [0.0]*len(true_labels)
-    recall = [0.0]*len(true_labels)
-
-    for i, l in enumerate(labels):
-        match = 0.0
-        prec_denom = 0.0
-        recall_denom = 0.0
-        for j, m in enumerate(labels):
-            if l == m:
-                prec_denom += 1.0
-                if true_labels[i] == true_labels[j]:
-                    match += 1.0
-                    recall_denom += 1.0
-            elif l != m:
-                if true_labels[i] == true_labels[j]:
-                    recall_denom += 1.0
-        precision[i] = match/prec_denom
-        recall[i] = match/recall_denom
+    The per-item precision and recall are read off the contingency table of
+    the true and the predicted labels, which takes linear time; the output is
+    the same as that of the b_cubed function of PhyloStar's CogDetect library,
+    which compares all pairs of items.
+    """
+    true_ids, pred_ids, cells, cell_sizes, true_sizes, pred_sizes = \
+            _contingency(true_labels, labels)
+
+    match = cell_sizes[cells].astype(float)
+    precision = match / pred_sizes[pred_ids]
+    recall = match / true_sizes[true_ids]
 
     avg_precision = np.average(precision)
     avg_recall = np.average(recall)
@@ -37,6 +48,155 @@ def calc_b_cubed(true_labels, labels):
 
 
 
+"""
+The names of the metrics output by calc_metrics, in the order they are shown.
+"""
+METRICS = ['b_cubed_precision', 'b_cubed_recall', 'b_cubed_f_score',
+        'pair_precision', 'pair_recall', 'pair_f_score', 'ari']
+
+
+
+def _count_pairs(counts):
+    """
+    Return the number of unordered pairs within groups of the given sizes.
+    Helper for calc_metrics.
+    """
+    return float(np.sum(counts * (counts - 1) // 2))
+
+
+
+def calc_metrics(true_labels, labels):
+    """
+    Calculate the evaluation metrics of a list of cognate set labels against
+    the gold-standard version of the same list. Return a {metric: value} dict
+    with the keys listed in METRICS.
+
+    All the metrics are derived from the contingency table of the true and the
+    predicted labels, which is only built once. The B-cubed scores are the same
+    as those of calc_b_cubed. The pairwise precision (recall) is the share of
+    the word pairs put in the same predicted (true) cognate set that are also
+    in the same true (predicted) one; it is 1.0 if there are no such pairs.
+    The adjusted Rand index is 1.0 if the two labellings are equally trivial,
+    i.e. both put all the words in one set or each word in its own.
+    """
+    true_ids, pred_ids, cells, cell_sizes, true_sizes, pred_sizes = \
+            _contingency(true_labels, labels)
+
+    # b-cubed
+    match = cell_sizes[cells].astype(float)
+    precision = np.average(match / pred_sizes[pred_ids])
+    recall = np.average(match / true_sizes[true_ids])
+
+    # pairwise
+    same_both = _count_pairs(cell_sizes)
+    same_true = _count_pairs(true_sizes)
+    same_pred = _count_pairs(pred_sizes)
+
+    pair_precision = same_both / same_pred if same_pred else 1.0
+    pair_recall = same_both / same_true if same_true else 1.0
+
+    if pair_precision + pair_recall:
+        pair_f_score = 2.0*pair_precision*pair_recall/(pair_precision+pair_recall)
+    else:
+        pair_f_score = 0.0
+
+    # adjusted rand index
+    num_pairs = _count_pairs(np.array([len(true_ids)]))
+    expected = same_true * same_pred / num_pairs if num_pairs else 0.0
+    maximum = (same_true + same_pred) / 2
+
+    if maximum == expected:
+        ari = 1.0
+    else:
+        ari = (same_both - expected) / (maximum - expected)
+
+    return {
+        'b_cubed_precision': precision,
+        'b_cubed_recall': recall,
+        'b_cubed_f_score': 2.0*precision*recall/(precision+recall),
+        'pair_precision': pair_precision,
+        'pair_recall': pair_recall,
+        'pair_f_score': pair_f_score,
+        'ari': ari}
+
+
+
+def get_labels(true_clusters, pred_clusters, concept):
+    """
+    Return the (true labels, predicted labels) lists of a concept's words,
+    ordered by doculect, given two {concept: frozenset of frozensets of Word}
+    dicts. Helper for evaluate.
+
+    It is assumed that both clusterings comprise the same data and that there
+    is at most one word per concept per doculect. An AssertionError is raised
+    if these assumptions do not hold true.
+    """
+    assert concept in pred_clusters, str(concept)
+
+    true_labels = {}
+    pred_labels = {}
+
+    for index, cog_set in enumerate(true_clusters[concept]):
+        for word in cog_set:
+            assert word.doculect not in true_labels, str(word)
+            true_labels[word.doculect] = index
+
+    for index, cog_set in enumerate(pred_clusters[concept]):
+        for word in cog_set:
+            assert word.doculect not in pred_labels, str(word)
+            pred_labels[word.doculect] = index
+
+    assert set(true_labels.keys()) == set(pred_labels.keys()), str(concept)
+
+    return [label for _, label in sorted(true_labels.items())], \
+            [label for _, label in sorted(pred_labels.items())]
+
+
+
+@profiled('evaluation')
+def evaluate(true_clusters, pred_clusters):
+    """
+    Evaluate a dataset's cognate sets against their gold-standard. Both args
+    should be dicts mapping concepts to frozen sets of frozen sets of Word
+    named tuples, the first being the gold-standard clustering.
+
+    Return a {concept: {metric: value}} dict with the per-concept output of
+    calc_metrics, in the order of the gold-standard's concepts. The same
+    assumptions as in calc_f_score apply.
+    """
+    return {concept: calc_metrics(*get_labels(true_clusters, pred_clusters, concept))
+            for concept in true_clusters.keys()}
+
+
+
+def summarise(concept_metrics):
+    """
+    Return the {metric: mean over concepts} dict of the output of evaluate.
+    """
+    return {metric: np.mean([metrics[metric]
+                for metrics in concept_metrics.values()])
+            for metric in METRICS}
+
+
+
+@profiled('evaluation')
+def calc_concept_f_scores(true_clusters, pred_clusters):
+    """
+    Calculate the B-cubed F-score of each concept of a dataset's cognate sets
+    against their gold-standard. Return a {concept: F-score} dict in the order
+    of the gold-standard's concepts. The args and the assumptions about these
+    are the same as in calc_f_score.
+    """
+    f_scores = {}
+
+    for concept in true_clusters.keys():
+        true_labels, pred_labels = get_labels(true_clusters, pred_clusters, concept)
+        f_scores[concept] = calc_b_cubed(true_labels, pred_labels)[-1]
+
+    return f_scores
+
+
+
 def calc_f_score(true_clusters, pred_clusters):
     """
     Calculate the B-cubed F-score of a dataset's cognate sets against their
@@ -51,31 +211,74 @@ def calc_f_score(true_clusters, pred_clusters):
     is at most one word per concept per doculect. An AssertionError is raised
     if these assumptions do not hold true.
     """
-    f_scores = []
+    return np.mean(list(calc_concept_f_scores(true_clusters, pred_clusters).values()))
 
-    for concept in true_clusters.keys():
-        assert concept in pred_clusters, str(concept)
 
-        true_labels = {}
-        pred_labels = {}
 
-        for index, cog_set in enumerate(true_clusters[concept]):
-            label = 'true:{}'.format(index)
-            for word in cog_set:
-                assert word.doculect not in true_labels, str(word)
-                true_labels[word.doculect] = label
+def resample_means(scores, num_samples=1000, seed=42):
+    """
+    Return an array with the means of num_samples bootstrap resamples of the
+    given per-concept scores. The resamples are drawn in chunks of about a
+    million indices, so that memory use does not grow with num_samples.
+
+    Raise a ValueError if there are no scores.
+    """
+    scores = np.asarray(scores, dtype=float)
+
+    if not len(scores):
+        raise ValueError('Cannot resample an empty set of scores')
+
+    rng = np.random.RandomState(seed)
+    chunk_size = max(1, 2**20 // len(scores))
+    means = []
+
+    for start in range(0, num_samples, chunk_size):
+        indices = rng.randint(0, len(scores),
+                size=(min(chunk_size, num_samples - start), len(scores)))
+        means.append(scores[indices].mean(axis=1))
+
+    return np.concatenate(means)
+
+
+
+def bootstrap(scores, num_samples=1000, confidence=0.95, seed=42):
+    """
+    Return the (low, high) percentile bootstrap confidence interval of the mean
+    of the given per-concept scores, e.g. the values of calc_concept_f_scores.
+    """
+    means = resample_means(scores, num_samples, seed)
+    low, high = np.percentile(means, [50 * (1 - confidence), 50 * (1 + confidence)])
+
+    return low, high
+
+
+
+def paired_bootstrap(scores_a, scores_b, num_samples=1000, confidence=0.95, seed=42):
+    """
+    Compare two systems' per-concept scores on the same concepts, listed in
+    the same order, by resampling the concepts along with both scores.
+
+    Return a (difference, low, high, p) tuple where difference is the mean of
+    scores_a minus that of scores_b, low and high are the bounds of its
+    confidence interval, and p is the share of resamples where the difference
+    is zero or has the opposite sign (a one-sided bootstrap p-value). Raise a
+    ValueError if the two lists are not of the same length.
+    """
+    scores_a = np.asarray(scores_a, dtype=float)
+    scores_b = np.asarray(scores_b, dtype=float)
 
-        for index, cog_set in enumerate(pred_clusters[concept]):
-            label = 'pred:{}'.format(index)
-            for word in cog_set:
-                assert word.doculect not in pred_labels, str(word)
-                pred_labels[word.doculect] = label
+    if scores_a.shape != scores_b.shape:
+        raise ValueError('Cannot pair scores of different lengths')
 
-        assert set(true_labels.keys()) == set(pred_labels.keys()), str(concept)
+    diffs = scores_a - scores_b
+    difference = np.mean(diffs)
 
-        true_labels = [label for _, label in sorted(true_labels.items())]
-        pred_labels = [label for _, label in sorted(pred_labels.items())]
+    means = resample_means(diffs, num_samples, seed)
+    low, high = np.percentile(means, [50 * (1 - confidence), 50 * (1 + confidence)])
 
-        f_scores.append(calc_b_cubed(true_labels, pred_labels)[-1])
+    if difference >= 0:
+        p = np.mean(means <= 0)
+    else:
+        p = np.mean(means >= 0)
 
-    return np.mean(f_scores)
+    return difference, low, high, p
@@ -0,0 +1,166 @@
+import collections
+
+import numpy as np
+
+
+
+def get_qgrams(asjp, q=2):
+    """
+    Return the set of q-grams of an ASJP transcription, padded with # on both
+    sides so that the initial and final sounds make q-grams of their own.
+    """
+    padded = '#' * (q - 1) + asjp + '#' * (q - 1)
+    return set(padded[i:i+q] for i in range(len(padded) - q + 1))
+
+
+
+class QGramIndex:
+    """
+    Inverted index mapping the q-grams of a list of ASJP transcriptions to the
+    positions of the transcriptions that contain them. It is used to find the
+    few transcriptions that are likely to be similar to a given one, so that
+    only these need to be aligned.
+
+    Usage:
+
+        index = QGramIndex(['mano', 'manu', 'pes'])
+        for position in index.get_candidates('mani', 2):
+            print(position)
+    """
+
+    def __init__(self, transcriptions, q=2):
+        """
+        Build the index. The transcriptions' positions in the given sequence
+        are what the get_candidates method returns.
+        """
+        self.q = q
+        self.transcriptions = list(transcriptions)
+
+        postings = collections.defaultdict(list)
+
+        for position, asjp in enumerate(self.transcriptions):
+            for qgram in get_qgrams(asjp, q):
+                postings[qgram].append(position)
+
+        self.postings = {qgram: np.array(positions)
+                for qgram, positions in postings.items()}
+
+        self.sizes = np.array([len(get_qgrams(asjp, q))
+                for asjp in self.transcriptions], dtype=float)
+
+
+    def get_similarities(self, asjp):
+        """
+        Return an array with the Dice coefficients between the q-gram set of
+        the given transcription and those of the indexed transcriptions.
+        """
+        qgrams = get_qgrams(asjp, self.q)
+        shared = np.zeros(len(self.transcriptions))
+
+        for qgram in qgrams:
+            if qgram in self.postings:
+                shared[self.postings[qgram]] += 1
+
+        return 2 * shared / (self.sizes + len(qgrams))
+
+
+    def get_candidates(self, asjp, limit=None, exclude=None):
+        """
+        Return the positions of the indexed transcriptions sharing at least
+        one q-gram with the given one, most similar first; ties are broken by
+        position. If limit is set, return at most that many positions. The
+        position given as exclude, if any, is left out.
+        """
+        similarities = self.get_similarities(asjp)
+
+        if exclude is not None:
+            similarities[exclude] = 0
+
+        positions = np.flatnonzero(similarities)
+        positions = positions[np.argsort(-similarities[positions], kind='mergesort')]
+
+        if limit is not None:
+            positions = positions[:limit]
+
+        return positions.tolist()
+
+
+
+"""
+The Mersenne prime modulo which the q-gram ids are hashed by get_minhashes.
+"""
+MINHASH_PRIME = 2**31 - 1
+
+
+
+def get_minhashes(transcriptions, num_hashes, q=2, seed=42, chunk_size=4096):
+    """
+    Return the (number of transcriptions, num_hashes) array of the MinHash
+    signatures of the transcriptions' q-gram sets: the probability that two
+    transcriptions agree on a given column is the Jaccard index of their
+    q-gram sets. The hash funcs are seeded with the given seed and the
+    transcriptions are hashed chunk_size at a time to bound memory use.
+    """
+    rng = np.random.RandomState(seed)
+    a = rng.randint(1, MINHASH_PRIME, size=num_hashes).astype(np.int64)
+    b = rng.randint(0, MINHASH_PRIME, size=num_hashes).astype(np.int64)
+
+    vocab = {}  # {qgram: id}
+    qgram_ids = [[vocab.setdefault(qgram, len(vocab))
+                for qgram in sorted(get_qgrams(asjp, q))]
+            for asjp in transcriptions]
+
+    signatures = np.zeros((len(qgram_ids), num_hashes), dtype=np.int64)
+
+    for start in range(0, len(qgram_ids), chunk_size):
+        chunk = qgram_ids[start:start+chunk_size]
+
+        ids = np.array([qgram_id for ids in chunk for qgram_id in ids], dtype=np.int64)
+        offsets = np.cumsum([0] + [len(ids) for ids in chunk[:-1]])
+
+        hashes = (ids[:, np.newaxis] * a + b) % MINHASH_PRIME
+        signatures[start:start+len(chunk)] = np.minimum.reduceat(hashes, offsets, axis=0)
+
+    return signatures
+
+
+
+def get_lsh_pairs(transcriptions, num_bands=32, band_size=4, q=2, max_bucket=200, seed=42):
+    """
+    Return the (number of pairs, 2) array of the (i, j), i < j, position
+    pairs of the transcriptions that are likely to be similar, as found by
+    locality-sensitive hashing of their q-gram sets: the MinHash signatures
+    are cut into num_bands bands of band_size hashes each, and two
+    transcriptions make a pair if they agree on all the hashes of any band.
+    Pairs of transcriptions with a q-gram Jaccard index of s are thus found
+    with a probability of 1 - (1 - s^band_size)^num_bands; the pairs are in
+    lexicographic order.
+
+    Buckets of more than max_bucket transcriptions, i.e. band signatures that
+    very many transcriptions share, are skipped, as these would make a large
+    number of mostly dissimilar pairs. The transcriptions should be distinct.
+    """
+    signatures = get_minhashes(transcriptions, num_bands * band_size, q, seed)
+    size = len(signatures)
+
+    keys = []
+
+    for band in range(num_bands):
+        columns = signatures[:, band*band_size:(band+1)*band_size]
+        _, buckets = np.unique(columns, axis=0, return_inverse=True)
+        buckets = buckets.ravel()
+
+        order = np.argsort(buckets, kind='mergesort')
+        bounds = np.flatnonzero(np.diff(buckets[order])) + 1
+
+        for members in np.split(order, bounds):
+            if 2 <= len(members) <= max_bucket:
+                rows, cols = np.triu_indices(len(members), 1)
+                keys.append(members[rows] * size + members[cols])
+
+    if not keys:
+        return np.zeros((0, 2), dtype=np.int64)
+
+    keys = np.unique(np.concatenate(keys))
+
+    return np.stack([keys // size, keys % size], axis=1)
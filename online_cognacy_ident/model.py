@@ -1,4 +1,27 @@
+import collections
+import itertools
+import json
+import os
 import pickle
+import struct
+import time
+import zipfile
+
+import numpy as np
+
+from online_cognacy_ident.phmm import PHMMScorer
+from online_cognacy_ident.pmi import PMIScorer
+
+
+
+"""
+The identifier and the version of the model file format. The version should be
+incremented whenever the layout changes in a way older code cannot read.
+"""
+MODEL_FORMAT = 'online_cognacy_ident.model'
+MODEL_VERSION = 1
+
+CHECKPOINT_FORMAT = 'online_cognacy_ident.checkpoint'
 
 
 
@@ -10,42 +33,130 @@ class ModelError(ValueError):
 
 
 
-def save_model(path, algorithm, params):
+def _encode_pmi(pmi):
     """
-    Write a trained model to a pickle file. The algorithm should be either pmi,
-    in which case the param should be the PMI dict, or phmm, in which case the
-    param should be an [em, gx, gy, trans] sequence.
+    Return the {name: array} dict storing a PMI dict as the sorted array of its
+    keys and the array of their values.
+
+    Helper for save_model and save_checkpoint.
     """
-    if algorithm == 'pmi':
-        data = {
-            'algorithm': 'pmi',
-            'pmi': params}
-    else:
-        data = {
-            'algorithm': 'phmm',
-            'em': params[0],
-            'gx': params[1],
-            'gy': params[2],
-            'trans': params[3]}
+    keys = sorted(pmi.keys())
+
+    return {
+        'pmi_keys': np.array(keys, dtype=str).reshape((len(keys), 2)),
+        'pmi_values': np.array([pmi[key] for key in keys], dtype=float)}
+
+
+
+def _decode_pmi(arrays):
+    """
+    Return the PMI defaultdict stored by _encode_pmi in the given arrays.
+
+    Helper for load_model and load_checkpoint.
+    """
+    assert arrays['pmi_keys'].shape == (len(arrays['pmi_values']), 2)
+
+    pmi = collections.defaultdict(float)
+    for key, value in zip(arrays['pmi_keys'].tolist(), arrays['pmi_values'].tolist()):
+        pmi[tuple(key)] = value
+
+    return pmi
+
+
+
+def save_model(path, algorithm, params, hyperparams=None):
+    """
+    Write a trained model to an uncompressed npz file holding the model's
+    arrays and a JSON header with the format version, the algorithm, the
+    alphabet and the hyperparameters. Raise a ModelError if the file cannot be
+    written.
+
+    The algorithm should be either pmi, in which case the params should be the
+    PMI dict, or phmm, in which case the params should be an [em, gx, gy,
+    trans, alphabet] sequence, alphabet being the sorted list of the training
+    data's characters that em, gx and gy are indexed by; it can be omitted or
+    None if unknown. The hyperparams, if given, should be a dict that can be
+    serialised as JSON.
+    """
+    header = {
+        'format': MODEL_FORMAT,
+        'version': MODEL_VERSION,
+        'algorithm': algorithm,
+        'hyperparams': hyperparams or {}}
 
     try:
         with open(path, 'wb') as f:
-            pickle.dump(data, f, protocol=3)
+            if algorithm == 'pmi':
+                header['alphabet'] = sorted(
+                        set(itertools.chain.from_iterable(params.keys())) - {''})
+                arrays = _encode_pmi(params)
+            else:
+                header['alphabet'] = list(params[4]) \
+                        if len(params) > 4 and params[4] is not None else None
+                arrays = {key: np.asarray(param, dtype=float)
+                        for key, param in zip(['em', 'gx', 'gy', 'trans'], params)}
+
+            np.savez(f, header=np.array(json.dumps(header)), **arrays)
     except OSError:
         raise ModelError('Could not write model file: {}'.format(path))
 
 
 
-def load_model(path):
+def _read_arrays(path, mmap_mode=None):
     """
-    Load a saved model and return the model's algorithm and params.
+    Return the {name: array} dict of the arrays in an npz file. If mmap_mode
+    is set, the non-empty arrays that are stored uncompressed are memory-mapped
+    rather than read into memory (np.load ignores mmap_mode for npz files).
+
+    Helper for load_model and load_checkpoint.
+    """
+    arrays = {}
+
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as f:
+        for info in archive.infolist():
+            name = info.filename[:-4] if info.filename.endswith('.npy') else info.filename
+
+            if mmap_mode is not None and info.compress_type == zipfile.ZIP_STORED:
+                # the member's data follows its 30-byte local file header,
+                # the file name, the extra field, and the .npy header
+                f.seek(info.header_offset)
+                name_len, extra_len = struct.unpack('<HH', f.read(30)[26:30])
+                f.seek(info.header_offset + 30 + name_len + extra_len)
+
+                version = np.lib.format.read_magic(f)
+                if version == (1, 0):
+                    shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+                elif version == (2, 0):
+                    shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+                else:
+                    shape = ()
+
+                if shape and np.prod(shape) and not dtype.hasobject:
+                    arrays[name] = np.memmap(path, dtype=dtype, mode=mmap_mode,
+                            offset=f.tell(), shape=shape, order='F' if fortran else 'C')
+                    continue
+
+            with archive.open(info) as member:
+                arrays[name] = np.lib.format.read_array(member, allow_pickle=False)
+
+    return arrays
+
+
+
+def _load_pickle(path):
+    """
+    Load a model saved as a pickle file by older versions of this programme
+    and return its algorithm and params. As unpickling can run arbitrary code,
+    this should only be used for trusted files.
+
+    Helper for load_model.
     """
     try:
         with open(path, 'rb') as f:
             data = pickle.load(f)
     except OSError:
         raise ModelError('Could not open model file: {}'.format(path))
-    except pickle.PickleError:
+    except (pickle.PickleError, EOFError, AttributeError, ImportError):
         raise ModelError('Could not read model file: {}'.format(path))
 
     try:
@@ -54,10 +165,219 @@ def load_model(path):
             assert 'pmi' in data
         else:
             for key in ['em', 'gx', 'gy', 'trans']: assert key in data
-    except AssertionError:
+    except (AssertionError, TypeError):
         raise ModelError('Could not read model file: {}'.format(path))
 
     if data['algorithm'] == 'pmi':
         return 'pmi', data['pmi']
     else:
-        return 'phmm', [data['em'], data['gx'], data['gy'], data['trans']]
+        return 'phmm', [data['em'], data['gx'], data['gy'], data['trans'], None]
+
+
+
+def load_model_header(path):
+    """
+    Return the JSON header of a saved model as a dict with the format, version,
+    algorithm, alphabet and hyperparams keys. Raise a ModelError if the file
+    cannot be opened or is not a model file of a supported version.
+    """
+    try:
+        with open(path, 'rb') as f:
+            is_zip = zipfile.is_zipfile(f)
+    except OSError:
+        raise ModelError('Could not open model file: {}'.format(path))
+
+    try:
+        assert is_zip
+        with zipfile.ZipFile(path) as archive, archive.open('header.npy') as f:
+            header = json.loads(str(np.lib.format.read_array(f, allow_pickle=False)))
+
+        assert header['format'] == MODEL_FORMAT
+        assert 1 <= header['version'] <= MODEL_VERSION
+        assert header['algorithm'] in ['pmi', 'phmm']
+    except (AssertionError, KeyError, TypeError, ValueError, zipfile.BadZipFile):
+        raise ModelError('Could not read model file: {}'.format(path))
+
+    return header
+
+
+
+def load_model(path, mmap_mode=None, allow_pickle=False):
+    """
+    Load a saved model and return the model's algorithm and params, the latter
+    being in the format expected by save_model; the phmm alphabet is None for
+    models that do not store it. Raise a ModelError if the file cannot be
+    opened or read.
+
+    If mmap_mode is set (e.g. to r), the phmm arrays are memory-mapped rather
+    than read into memory. Models saved as pickle files by older versions of
+    this programme are only loaded if allow_pickle is True.
+    """
+    try:
+        with open(path, 'rb') as f:
+            is_pickle = f.read(1) == b'\x80'
+    except OSError:
+        raise ModelError('Could not open model file: {}'.format(path))
+
+    if is_pickle:
+        if allow_pickle:
+            return _load_pickle(path)
+
+        raise ModelError((
+            'Could not read model file: {} '
+            '(it is an old pickle model; use --allow-pickle to load it)').format(path))
+
+    header = load_model_header(path)
+
+    try:
+        arrays = _read_arrays(path, mmap_mode)
+
+        if header['algorithm'] == 'pmi':
+            return 'pmi', _decode_pmi(arrays)
+        else:
+            return 'phmm', [arrays['em'], arrays['gx'], arrays['gy'],
+                    arrays['trans'], header['alphabet']]
+    except (AssertionError, KeyError, TypeError, ValueError,
+            struct.error, zipfile.BadZipFile):
+        raise ModelError('Could not read model file: {}'.format(path))
+
+
+
+def save_checkpoint(path, algorithm, state, hyperparams=None):
+    """
+    Write a training state, as passed to the checkpoint callable of train_pmi
+    or train_phmm, to an uncompressed npz file with a JSON header. The file is
+    first written under a temporary name and then renamed, so that a crash
+    while writing does not destroy the previous checkpoint. Raise a ModelError
+    if the file cannot be written.
+    """
+    header = {
+        'format': CHECKPOINT_FORMAT,
+        'version': MODEL_VERSION,
+        'algorithm': algorithm,
+        'hyperparams': hyperparams or {},
+        'state': {}}
+    arrays = {}
+
+    for key, value in state.items():
+        if key == 'pmi':
+            arrays.update(_encode_pmi(value))
+        elif key in ['order', 'pruned']:
+            arrays[key] = np.array(value, dtype=np.int64)
+        elif key == 'check':
+            arrays.update({'check_{}'.format(i): array for i, array in enumerate(value)})
+        elif key == 'rng' and algorithm == 'phmm':
+            arrays['rng_keys'] = value[1]
+            header['state']['rng'] = [value[0], None] + [float(item) for item in value[2:]]
+        elif isinstance(value, np.ndarray):
+            arrays[key] = value
+        else:
+            header['state'][key] = value
+
+    temp_path = path + '.tmp'
+
+    try:
+        with open(temp_path, 'wb') as f:
+            np.savez(f, header=np.array(json.dumps(header)), **arrays)
+        os.replace(temp_path, path)
+    except OSError:
+        raise ModelError('Could not write checkpoint file: {}'.format(path))
+
+
+
+def load_checkpoint(path):
+    """
+    Load a checkpoint written by save_checkpoint and return its (algorithm,
+    state, hyperparams) tuple, the state being ready to be passed to the
+    train_pmi or train_phmm func. Raise a ModelError if the file cannot be
+    opened or read.
+    """
+    try:
+        arrays = _read_arrays(path)
+    except OSError:
+        raise ModelError('Could not open checkpoint file: {}'.format(path))
+    except (ValueError, struct.error, zipfile.BadZipFile):
+        raise ModelError('Could not read checkpoint file: {}'.format(path))
+
+    try:
+        header = json.loads(str(arrays.pop('header')))
+        assert header['format'] == CHECKPOINT_FORMAT
+        assert 1 <= header['version'] <= MODEL_VERSION
+        assert header['algorithm'] in ['pmi', 'phmm']
+
+        state = header['state']
+
+        if header['algorithm'] == 'pmi':
+            state['pmi'] = _decode_pmi(arrays)
+            if 'rng' in state:
+                state['rng'] = (state['rng'][0], tuple(state['rng'][1]), state['rng'][2])
+        else:
+            for key in ['em', 'gx', 'gy', 'trans']:
+                state[key] = arrays[key]
+            if 'rng' in state:
+                name, _, pos, has_gauss, cached_gaussian = state['rng']
+                state['rng'] = (name, arrays['rng_keys'], int(pos), int(has_gauss), cached_gaussian)
+            if 'check_0' in arrays:
+                state['check'] = [arrays['check_{}'.format(i)] for i in range(4)]
+
+        for key in ['order', 'pruned']:
+            if key in arrays:
+                state[key] = arrays[key].tolist()
+    except (AssertionError, KeyError, IndexError, TypeError, ValueError):
+        raise ModelError('Could not read checkpoint file: {}'.format(path))
+
+    return header['algorithm'], state, header['hyperparams']
+
+
+
+class Checkpointer:
+    """
+    Callable to pass as the checkpoint arg of the train_pmi and train_phmm
+    funcs. It saves the training state every so many batches and/or every so
+    many seconds, whichever comes first.
+
+    Usage:
+
+        checkpointer = Checkpointer(path, 'pmi', every=100)
+        pmi = train_pmi(dataset, checkpoint=checkpointer)
+    """
+
+    def __init__(self, path, algorithm, every=None, interval=None, hyperparams=None):
+        """
+        Set the checkpoint file path, the algorithm, the number of batches
+        and/or the number of seconds between checkpoints, and the
+        hyperparameters to store along with the training state.
+        """
+        self.path = path
+        self.algorithm = algorithm
+        self.every = every
+        self.interval = interval
+        self.hyperparams = hyperparams
+
+        self.num_batches = 0
+        self.last_time = time.time()
+
+
+    def __call__(self, get_state):
+        self.num_batches += 1
+
+        due_batches = self.every and self.num_batches % self.every == 0
+        due_time = self.interval and time.time() - self.last_time >= self.interval
+
+        if due_batches or due_time:
+            save_checkpoint(self.path, self.algorithm, get_state(), self.hyperparams)
+            self.last_time = time.time()
+
+
+
+def get_scorer(algorithm, params, dataset):
+    """
+    Return a callable mapping pairs of ASJP transcriptions to scores in the
+    range [0; 1] under a loaded model; its similarity attribute tells whether
+    higher scores are more similar (phmm) or less (pmi). The dataset is needed
+    by the phmm algorithm for its alphabet and equilibrium probabilities.
+    """
+    if algorithm == 'phmm':
+        return PHMMScorer(dataset, *params)
+    else:
+        return PMIScorer(params)
@@ -1 +1 @@
-from .wrapper import train_phmm, apply_phmm
+from .wrapper import train_phmm, apply_phmm, PHMMScorer
@@ -1,25 +1,14 @@
-import collections
-import itertools
+import hashlib
+import json
+import time
 
 import numpy as np
 
+from online_cognacy_ident.callbacks import CallbackList
 from online_cognacy_ident.phmm.model import PairHiddenMarkov
 from online_cognacy_ident.pmi import sigmoid
-
-
-
-def chunks(some_list, n):
-    """
-    Yield successive size-sized chunks from some_list.
-    :param some_list: list to be chunked
-    :type some_list: list
-    :param n: size of the chunks
-    :type n: int
-    :return: Generator returning chunks of size n
-    :rtype: list
-    """
-    for i in range(0, len(some_list), n):
-        yield some_list[i:i + n]
+from online_cognacy_ident.profiling import profiled, record
+from online_cognacy_ident.scores import score_dataset
 
 
 
@@ -70,7 +59,9 @@ def model_ll(wordpairs, em, gx, gy, tr):
 
 
 
-def train_phmm(dataset, initial_cutoff=0.5, alpha=0.75, batch_size=256, rt=0.0001, at=0.001, con_check=False):
+@profiled('training')
+def train_phmm(dataset, initial_cutoff=0.5, alpha=0.75, batch_size=256, rt=0.0001, at=0.001, con_check=False,
+               state=None, checkpoint=None, return_state=False, callbacks=None):
     """
     Train a PHMM model using the EM algorithm with the specified parameters.
 
@@ -78,6 +69,19 @@ def train_phmm(dataset, initial_cutoff=0.5, alpha=0.75, batch_size=256, rt=0.000
     word pairs that are potential cognates, i.e. having edit distance above the
     given threshold/cutoff.
 
+    If checkpoint is given, it is called after each batch with a function that
+    returns the current training state as a dict; it is up to the checkpoint
+    callable whether to call it. Passing such a state dict as the state arg
+    resumes the training from where it was taken, with the same results as an
+    uninterrupted run. A state with only the em, gx, gy, trans, alphabet and
+    num_updates keys warm-starts the training from these parameters, which are
+    re-indexed by the dataset's alphabet if this differs.
+
+    The callbacks arg can be a list of callbacks.Callback instances, the hooks
+    of which are called after each batch, epoch and convergence check. The
+    delta of the latter is the change of the log-likelihood or, if con_check
+    is set, the largest change of a parameter during the epoch.
+
     :param con_check: Check convergence thorugh change in model likelihood if set to False. Use similarity in parameters
      otherwise. If set to True, convergence tends to be slower.
     :type con_check: bool
@@ -93,7 +97,15 @@ def train_phmm(dataset, initial_cutoff=0.5, alpha=0.75, batch_size=256, rt=0.000
     :type alpha: float
     :param initial_cutoff: initial Levenshtein distance cutoff
     :type initial_cutoff: float
-    :return: trained parameters, emission matrix, gap x, gap y, Transition
+    :param state: training state to resume or warm-start from
+    :type state: dict
+    :param checkpoint: called after each batch with a function returning the training state
+    :type checkpoint: callable
+    :param return_state: whether to also return the final training state
+    :type return_state: bool
+    :param callbacks: hooks called after each batch, epoch and convergence check
+    :type callbacks: list
+    :return: trained parameters, emission matrix, gap x, gap y, Transition (and the training state if return_state)
     :rtype: (np.core.ndarray, np.core.ndarray, np.core.ndarray, np.core.ndarray)
     """
     alphabet = dataset.get_alphabet()
@@ -121,21 +133,56 @@ def train_phmm(dataset, initial_cutoff=0.5, alpha=0.75, batch_size=256, rt=0.000
     # delta, epsilon, lambda, taum, tauxy
     trans_input = np.array([0.3, 0.3, 0.3, 0.1, 0.1])
 
+    callbacks = CallbackList(callbacks)
+    callbacks.start()
+
     n_o_batches = 0.0
     converged = False
     run = 0
     ll = 0
+
+    # the shuffled positions of the word pairs and the next batch's start within these
+    order = list(range(len(wordpairs)))
+    position = 0
+
+    if state is not None:
+        em_input, gx_input, gy_input = state['em'], state['gx'], state['gy']
+        if state.get('alphabet') is not None and list(state['alphabet']) != alphabet:
+            em_input, gx_input, gy_input = remap_params(
+                    em_input, gx_input, gy_input, state['alphabet'], alphabet)
+            em_input, gx_input, gy_input = \
+                    em_input / np.sum(em_input), gx_input / np.sum(gx_input), gy_input / np.sum(gy_input)
+
+        if np.shape(em_input) != (len(alphabet), len(alphabet)):
+            raise ValueError('The training state does not match the dataset')
+
+        em_input, gx_input, gy_input = np.array(em_input), np.array(gx_input), np.array(gy_input)
+        trans_input = np.array(state['trans'])
+        n_o_batches = state['num_updates']
+
+        if state.get('order') is not None:
+            if state['num_pairs'] != len(wordpairs):
+                raise ValueError('The training state does not match the dataset')
+
+            order, position = list(state['order']), state['position']
+            run, ll = state['run'], state['ll']
+            em_check, gx_check, gy_check, trans_check = state['check']
+            np.random.set_state(state['rng'])
+
     while converged is False:
+        epoch_start = time.perf_counter()
 
-        np.random.shuffle(wordpairs)
-        word_pairs = chunks(wordpairs, batch_size)
+        if position == 0:
+            np.random.shuffle(order)
 
-        em_check = em_input
-        gx_check = gx_input
-        gy_check = gy_input
-        trans_check = trans_input
+            em_check = em_input
+            gx_check = gx_input
+            gy_check = gy_input
+            trans_check = trans_input
 
-        for chunk in word_pairs:
+        for start in range(position, len(order), batch_size):
+            batch_start = time.perf_counter()
+            chunk = [wordpairs[i] for i in order[start:start + batch_size]]
 
             model = PairHiddenMarkov(em_input, gx_input, gy_input, trans_input)
             new_em, new_gx, new_gy, new_trans = model.baum_welch_train(list_of_seq=chunk,
@@ -149,6 +196,33 @@ def train_phmm(dataset, initial_cutoff=0.5, alpha=0.75, batch_size=256, rt=0.000
             trans_input = merge(trans_input, new_trans, n_o_batches, alpha)
 
             n_o_batches += 1
+            record('batch', time.perf_counter() - batch_start)
+
+            if callbacks:
+                callbacks.on_batch_end(callbacks.get_info(
+                    epoch=run, batch=int(n_o_batches), batch_pairs=len(chunk),
+                    epoch_pairs=len(order), pruned=None))
+
+            if checkpoint is not None:
+                checkpoint(lambda: {
+                    'em': em_input, 'gx': gx_input, 'gy': gy_input, 'trans': trans_input,
+                    'alphabet': list(alphabet),
+                    'num_updates': n_o_batches,
+                    'num_pairs': len(wordpairs),
+                    'run': run, 'll': ll,
+                    'position': start + batch_size,
+                    'order': list(order),
+                    'check': [em_check, gx_check, gy_check, trans_check],
+                    'rng': np.random.get_state()})
+
+        if callbacks:
+            callbacks.on_epoch_end(callbacks.get_info(
+                epoch=run, batch=int(n_o_batches), epoch_pairs=len(order),
+                pruned=None, epoch_sec=time.perf_counter() - epoch_start))
+
+        position = 0
+        shuffled_pairs = [wordpairs[i] for i in order]
+        delta = None
 
         if con_check:
 
@@ -156,26 +230,148 @@ def train_phmm(dataset, initial_cutoff=0.5, alpha=0.75, batch_size=256, rt=0.000
                        np.allclose(gy_check, gy_input, rtol=rt, atol=at), np.allclose(trans_check, trans_input, rtol=rt, atol=at)]
             if False not in results:
                 converged = True
+
+            if callbacks:
+                delta = max([float(np.max(np.abs(new - old))) for new, old in [
+                    (em_input, em_check), (gx_input, gx_check),
+                    (gy_input, gy_check), (trans_input, trans_check)]])
         else:
 
             if run > 0:
                 llold = ll
-                ll = model_ll(wordpairs, em_input, gx_input, gy_input, trans_input)
+                ll = model_ll(shuffled_pairs, em_input, gx_input, gy_input, trans_input)
+                delta = float(np.abs(llold-ll))
                 if np.abs(llold-ll) < at:
                     converged = True
             else:
-                ll = model_ll(wordpairs, em_input, gx_input, gy_input, trans_input)
+                ll = model_ll(shuffled_pairs, em_input, gx_input, gy_input, trans_input)
+
+        if callbacks:
+            callbacks.on_convergence_check(callbacks.get_info(
+                epoch=run, ll=None if con_check else float(ll),
+                delta=delta, converged=converged))
 
         run += 1
+        record('epoch', time.perf_counter() - epoch_start)
+
+    if callbacks:
+        callbacks.on_train_end(callbacks.get_info(batch=int(n_o_batches)))
+
+    if return_state:
+        return em_input, gx_input, gy_input, trans_input, {
+            'em': em_input, 'gx': gx_input, 'gy': gy_input, 'trans': trans_input,
+            'alphabet': list(alphabet), 'num_updates': n_o_batches}
+
     return em_input, gx_input, gy_input, trans_input
 
 
 
-def apply_phmm(dataset, em, gx, gy, trans):
+def remap_params(em, gx, gy, alphabet, new_alphabet):
+    """
+    Return the (em, gx, gy) tables of a model trained on the given alphabet,
+    re-indexed by the characters of new_alphabet, e.g. the alphabet of the
+    dataset the model is applied on. Characters that the model was not
+    trained on are given the lowest probabilities found in the respective
+    table, as these are the closest to the pseudo counts of unseen sounds.
+    """
+    positions = {char: i for i, char in enumerate(alphabet)}
+    known = np.array([char in positions for char in new_alphabet], dtype=bool)
+    index = np.array([positions.get(char, 0) for char in new_alphabet], dtype=int)
+
+    em = np.asarray(em)
+    new_em = em[np.ix_(index, index)]
+    new_em[~known, :] = em.min()
+    new_em[:, ~known] = em.min()
+
+    new_gx = np.where(known, np.asarray(gx)[index], np.min(gx))
+    new_gy = np.where(known, np.asarray(gy)[index], np.min(gy))
+
+    return new_em, new_gx, new_gy
+
+
+
+class PHMMScorer:
+    """
+    Callable returning the PHMM score of two ASJP transcriptions, the sigmoid
+    of the ratio of the Viterbi and the random model's scores. Unlike the PMI
+    distances, these are similarities in the range (0.5; 1], 1 for identical
+    transcriptions; they are output, cached and clustered as they are, as in
+    the original implementation, and search.WordIndex uses 1 - score. The
+    order of the transcriptions matters as the model's gap probabilities need
+    not be symmetric.
+
+    Usage:
+
+        scorer = PHMMScorer(dataset, em, gx, gy, trans, alphabet)
+        score = scorer('mano', 'manu')
+    """
+
+    symmetric = False  # gx and gy, and so the scores, need not be
+    similarity = True  # higher scores are more similar
+
+    def __init__(self, dataset, em, gx, gy, trans, alphabet=None):
+        """
+        The dataset provides the alphabet and the equilibrium probabilities of
+        the random model; the other args are the trained parameters as
+        returned by the train_phmm func, and the alphabet of the training data.
+
+        If the latter is given, the parameters are re-indexed by the dataset's
+        alphabet once, here. Otherwise (as with models saved by older versions
+        of this programme) the parameters are assumed to be indexed by it.
+        """
+        self.alphabet = {char: i for i, char in enumerate(dataset.get_alphabet())}
+
+        if alphabet is not None:
+            em, gx, gy = remap_params(em, gx, gy, alphabet, dataset.get_alphabet())
+
+        self.model = PairHiddenMarkov(em, gx, gy, trans)
+        self.params = [em, gx, gy, trans]
+
+        equi = dataset.get_equilibrium()
+        self.eq = np.zeros(len(self.alphabet))
+        for k, v in self.alphabet.items():
+            self.eq[v] = equi[k]
+        self.eq /= sum(self.eq)
+
+        self.fingerprint = None
+
+
+    def get_fingerprint(self):
+        """
+        Return the hex SHA-256 digest of the parameters, as indexed by the
+        dataset's alphabet, and of the dataset's equilibrium probabilities,
+        identifying the scores of this scorer in a cache.ScoreCache. The
+        latter make part of the scores, so that the same model gives another
+        fingerprint on a dataset with other sound frequencies.
+        """
+        if self.fingerprint is None:
+            digest = hashlib.sha256(json.dumps(['phmm', sorted(
+                    self.alphabet.items(), key=lambda item: item[1])]).encode('utf-8'))
+
+            for array in self.params + [self.eq]:
+                digest.update(np.ascontiguousarray(array, dtype=float).tobytes())
+
+            self.fingerprint = digest.hexdigest()
+
+        return self.fingerprint
+
+
+    def __call__(self, asjp1, asjp2):
+        s1 = [self.alphabet[i] for i in asjp1]
+        s2 = [self.alphabet[i] for i in asjp2]
+        v_score = self.model.viterbi(s1, s2)[1]
+        r_score = self.model.random_model(s1, s2, self.eq)
+        return sigmoid(v_score / r_score)
+
+
+
+@profiled('scoring')
+def apply_phmm(dataset, em, gx, gy, trans, alphabet=None, cache=None):
     """
     Run the PHMM cognacy identification algorithm on a Dataset instance. Return
-    a {(word, word): distance} dict mapping the dataset's synonymous word pairs
-    to distance scores, the latter being in the range [0; 1].
+    a Scores instance holding the scores of the dataset's synonymous word
+    pairs, the latter being similarities in the range (0.5; 1] (see
+    PHMMScorer); this can also be used as a {(word, word): score} dict.
 
     :param dataset: dataset containing training data
     :type dataset: online_cognacy_ident.dataset.Dataset
@@ -187,28 +383,13 @@ def apply_phmm(dataset, em, gx, gy, trans):
     :type gy: np.core.ndarray
     :param trans: transition probabilities
     :type trans: np.core.ndarray
-    :param equilibrium: equilibrium probabilities for random model
-    :type equilibrium: np.core.ndarray
-    :return: dictionary of alignment scores
-    :rtype: dict
+    :param alphabet: the characters of the training data, in the order of em, gx and gy
+    :type alphabet: list
+    :param cache: score cache to look the scores up in and add them to
+    :type cache: online_cognacy_ident.cache.ScoreCache
+    :return: alignment scores
+    :rtype: online_cognacy_ident.scores.Scores
     """
-    alphabet = {char: i for i, char in enumerate(dataset.get_alphabet())}
-
-    score_dict = collections.defaultdict()
-    model = PairHiddenMarkov(em, gx, gy, trans)
-    equi = dataset.get_equilibrium()
-    eq = np.zeros(len(alphabet))
-    for k, v in alphabet.items():
-        eq[v] = equi[k]
-    eq /= sum(eq)
-
-    for concept, words in dataset.get_concepts().items():
-        for word1, word2 in itertools.combinations(words, 2):
-            s1 = [alphabet[i] for i in word1.asjp]
-            s2 = [alphabet[i] for i in word2.asjp]
-            v_score = model.viterbi(s1, s2)[1]
-            r_score = model.random_model(s1, s2, eq)
-            key = (word1, word2) if word1 < word2 else (word2, word1)
-            score_dict[key] = sigmoid(v_score / r_score)
-
-    return score_dict
+    scorer = PHMMScorer(dataset, em, gx, gy, trans, alphabet)
+
+    return score_dataset(dataset, scorer, cache)
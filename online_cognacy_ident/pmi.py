@@ -1,10 +1,16 @@
 import collections
+import hashlib
 import itertools
+import json
 import random
+import time
 
 import numpy as np
 
 from online_cognacy_ident.align import needleman_wunsch
+from online_cognacy_ident.callbacks import CallbackList
+from online_cognacy_ident.profiling import profiled, record
+from online_cognacy_ident.scores import score_dataset
 
 
 
@@ -72,7 +78,10 @@ def calc_pmi(alignment_dict, char_list, scores, initialize=False):
 
 
 
-def train_pmi(dataset, initial_cutoff=0.5, alpha=0.75, margin=1.0, max_iter=15, batch_size=256):
+@profiled('training')
+def train_pmi(dataset, initial_cutoff=0.5, alpha=0.75, margin=1.0, max_iter=15,
+        batch_size=256, state=None, checkpoint=None, return_state=False,
+        callbacks=None):
     """
     Train a dict mapping pairs of ASJP sounds/chars to their PMI scores on word
     pairs using the EM algorithm with the specified parameters.
@@ -81,29 +90,71 @@ def train_pmi(dataset, initial_cutoff=0.5, alpha=0.75, margin=1.0, max_iter=15,
     word pairs that are potential cognates, i.e. having edit distance above the
     given threshold/cutoff.
 
+    If checkpoint is given, it is called after each batch with a function that
+    returns the current training state as a dict; it is up to the checkpoint
+    callable whether to call it (and e.g. save the state with save_checkpoint).
+    Passing such a state dict as the state arg resumes the training from where
+    it was taken, with the same results as an uninterrupted run. A state with
+    only the pmi and num_updates keys warm-starts the training from these. If
+    return_state is set, return a (pmi dict, state) tuple, the latter being
+    suitable for warm-starting.
+
+    The callbacks arg can be a list of callbacks.Callback instances, the hooks
+    of which are called after each batch and epoch. The training always runs
+    for max_iter epochs; the delta of the convergence check is the largest
+    change of a PMI score during the epoch.
+
     This function is mostly sourced from PhyloStar's OnlinePMI repository.
     """
     word_pairs = dataset.get_asjp_pairs(initial_cutoff)
     alphabet = dataset.get_alphabet()
 
+    callbacks = CallbackList(callbacks)
+    callbacks.start()
+
     pmidict = collections.defaultdict(float)
     num_updates = 0
 
-    for curr_iter in range(max_iter):
-        random.shuffle(word_pairs)
-        pruned_word_pairs = []
+    # the word pairs of the current iteration, given as positions in word_pairs,
+    # and the next batch's start within these
+    order = list(range(len(word_pairs)))
+    pruned = []
+    first_iter, position = 0, 0
+
+    if state is not None:
+        pmidict.update(state['pmi'])
+        num_updates = state['num_updates']
+
+        if state.get('order') is not None:
+            if state['num_pairs'] != len(word_pairs):
+                raise ValueError('The training state does not match the dataset')
+
+            order, pruned = list(state['order']), list(state['pruned'])
+            first_iter, position = state['iteration'], state['position']
+            random.setstate(state['rng'])
+
+    for curr_iter in range(first_iter, max_iter):
+        epoch_start = time.perf_counter()
 
-        for index in range(0, len(word_pairs), batch_size):
+        if position == 0:
+            random.shuffle(order)
+
+        if callbacks:
+            epoch_pmi = dict(pmidict)
+
+        for index in range(position, len(order), batch_size):
+            batch_start = time.perf_counter()
             eta = np.power(num_updates+2, -alpha)
             algn_list, scores = [], []
 
-            for word1, word2 in word_pairs[index:index+batch_size]:
+            for pair_index in order[index:index+batch_size]:
+                word1, word2 = word_pairs[pair_index]
                 score, alg = needleman_wunsch(word1, word2, pmidict)
 
                 if score > margin:
                     algn_list.append(alg)
                     scores.append(1.0 - sigmoid(score))
-                    pruned_word_pairs.append((word1, word2))
+                    pruned.append(pair_index)
 
             mb_pmi_dict = calc_pmi(algn_list, alphabet, scores, initialize=True)
             for key, value in mb_pmi_dict.items():
@@ -111,30 +162,100 @@ def train_pmi(dataset, initial_cutoff=0.5, alpha=0.75, margin=1.0, max_iter=15,
                 pmidict[key] = (eta*value) + (1.0-eta) * pmidict_val
 
             num_updates += 1
-
-        word_pairs = list(pruned_word_pairs)
-        # print('iteration {!s} (total updates: {!s})'.format(curr_iter, num_updates))
+            record('batch', time.perf_counter() - batch_start)
+
+            if callbacks:
+                callbacks.on_batch_end(callbacks.get_info(
+                    epoch=curr_iter, batch=num_updates,
+                    batch_pairs=len(order[index:index+batch_size]),
+                    epoch_pairs=len(order), pruned=len(pruned)))
+
+            if checkpoint is not None:
+                checkpoint(lambda: {
+                    'pmi': dict(pmidict),
+                    'num_updates': num_updates,
+                    'num_pairs': len(word_pairs),
+                    'iteration': curr_iter,
+                    'position': index + batch_size,
+                    'order': list(order),
+                    'pruned': list(pruned),
+                    'rng': random.getstate()})
+
+        if callbacks:
+            callbacks.on_epoch_end(callbacks.get_info(
+                epoch=curr_iter, batch=num_updates, epoch_pairs=len(order),
+                pruned=len(pruned), epoch_sec=time.perf_counter() - epoch_start))
+
+            callbacks.on_convergence_check(callbacks.get_info(
+                epoch=curr_iter, ll=None, converged=curr_iter == max_iter - 1,
+                delta=max([abs(value - epoch_pmi.get(key, 0.0))
+                    for key, value in pmidict.items()], default=0.0)))
+
+        order, pruned = pruned, []
+        position = 0
+        record('epoch', time.perf_counter() - epoch_start)
+
+    if callbacks:
+        callbacks.on_train_end(callbacks.get_info(batch=num_updates))
+
+    if return_state:
+        return pmidict, {'pmi': dict(pmidict), 'num_updates': num_updates}
 
     return pmidict
 
 
 
-def apply_pmi(dataset, pmi):
+class PMIScorer:
     """
-    Run the PMI cognacy identification algorithm on a dataset.Dataset instance.
-    Return a {(word, word): distance} dict mapping the dataset's word pairs to
-    distance scores, the latter being in the range [0; 1].
+    Callable returning the PMI distance between two ASJP transcriptions, the
+    latter being in the range [0; 1].
 
-    The second argument should be a matrix as returned by the train_pmi func.
+    Usage:
+
+        scorer = PMIScorer(pmi)
+        distance = scorer('mano', 'manu')
     """
-    scores = {}
 
-    for concept, words in dataset.get_concepts().items():
-        for word1, word2 in itertools.combinations(words, 2):
-            score, _ = needleman_wunsch(word1.asjp, word2.asjp, pmi)
-            score = 1 - sigmoid(score)
+    symmetric = True  # the PMI matrix is, and so are the alignment scores
+    similarity = False  # lower scores are more similar
 
-            key = (word1, word2) if word1 < word2 else (word2, word1)
-            scores[key] = score
+    def __init__(self, pmi):
+        """
+        The arg should be a matrix as returned by the train_pmi func.
+        """
+        self.pmi = pmi
+        self.fingerprint = None
 
-    return scores
+
+    def get_fingerprint(self):
+        """
+        Return the hex SHA-256 digest of the PMI matrix, identifying the scores
+        of this scorer in a cache.ScoreCache.
+        """
+        if self.fingerprint is None:
+            items = sorted([[a, b, float(value)] for (a, b), value in self.pmi.items()])
+            self.fingerprint = hashlib.sha256(
+                    json.dumps(['pmi', items]).encode('utf-8')).hexdigest()
+
+        return self.fingerprint
+
+
+    def __call__(self, asjp1, asjp2):
+        score, _ = needleman_wunsch(asjp1, asjp2, self.pmi)
+        return 1 - sigmoid(score)
+
+
+
+@profiled('scoring')
+def apply_pmi(dataset, pmi, cache=None):
+    """
+    Run the PMI cognacy identification algorithm on a dataset.Dataset instance.
+    Return a Scores instance holding the distance scores of the dataset's
+    synonymous word pairs, the latter being in the range [0; 1]; this can also
+    be used as a {(word, word): distance} dict.
+
+    The second argument should be a matrix as returned by the train_pmi func.
+    If a cache.ScoreCache is given, the scores are looked up in and added to
+    it.
+    """
+    return score_dataset(dataset, PMIScorer(pmi), cache)
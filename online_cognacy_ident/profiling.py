@@ -0,0 +1,270 @@
+import contextlib
+import cProfile
+import functools
+import time
+import tracemalloc
+
+import numpy as np
+
+
+
+_profiler = None  # the active Profiler instance, if any
+
+"""
+Whether peak memory can be traced per stage; tracemalloc.reset_peak, which
+this relies on, is only available as of Python 3.9.
+"""
+CAN_TRACE_MEMORY = hasattr(tracemalloc, 'reset_peak')
+
+
+
+class _NullStage:
+    """
+    No-op context manager returned by the stage func if there is no active
+    profiler.
+    """
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+
+_null_stage = _NullStage()
+
+
+
+class Profiler:
+    """
+    Records the wall-clock time, the number of calls and, if trace_memory is
+    set, the peak memory of the stages of the code marked with the stage func
+    or the profiled decorator, as well as series of timings recorded with the
+    record func, e.g. those of the training epochs and batches. Only one
+    profiler can be active at a time.
+
+    The time of a stage includes that of the stages nested in it; its self
+    time does not. The peak memory of a stage is the most memory allocated on
+    top of what was allocated when the stage started, as traced by
+    tracemalloc, which also slows the code down.
+
+    Usage:
+
+        profiler = Profiler()
+        profiler.start()
+        with stage('scoring'):
+            scores = apply_pmi(dataset, pmi)
+        profiler.stop()
+        print(profiler.format_table())
+    """
+
+    def __init__(self, trace_memory=False, cprofile_path=None):
+        """
+        Init an inactive profiler. If cprofile_path is set, the code between
+        the start and stop calls is also run under cProfile and its stats are
+        dumped to that path. Raise a ValueError if trace_memory is set but
+        CAN_TRACE_MEMORY is not.
+        """
+        if trace_memory and not CAN_TRACE_MEMORY:
+            raise ValueError('Tracing peak memory requires Python 3.9 or later')
+
+        self.trace_memory = trace_memory
+        self.cprofile_path = cprofile_path
+
+        self.stages = {}  # {name: {calls, sec, self_sec, peak_mb}}, in order of first entry
+        self.series = {}  # {name: [seconds, ..]}
+        self.stack = []  # [[name, start time, children's sec, start mem, peak mem], ..]
+
+        self.start_time = None
+        self.total_sec = None
+        self.cprofile = None
+
+
+    def start(self):
+        """
+        Make this the active profiler.
+        """
+        global _profiler
+        _profiler = self
+
+        if self.trace_memory:
+            tracemalloc.start()
+
+        if self.cprofile_path:
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+        self.start_time = time.perf_counter()
+
+
+    def stop(self):
+        """
+        Deactivate the profiler and dump the cProfile stats, if these are
+        asked for. Raise an OSError if the latter cannot be written.
+        """
+        global _profiler
+        _profiler = None
+
+        self.total_sec = time.perf_counter() - self.start_time
+
+        if self.trace_memory:
+            tracemalloc.stop()
+
+        if self.cprofile is not None:
+            self.cprofile.disable()
+            self.cprofile.dump_stats(self.cprofile_path)
+
+
+    def enter(self, name):
+        """
+        Mark the start of a stage.
+
+        Helper for the stage func.
+        """
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            for frame in self.stack:
+                frame[4] = max(frame[4], peak)
+            tracemalloc.reset_peak()
+        else:
+            current = 0
+
+        self.stages.setdefault(name, {
+            'calls': 0, 'sec': 0.0, 'self_sec': 0.0,
+            'peak_mb': 0.0 if self.trace_memory else None})
+
+        self.stack.append([name, time.perf_counter(), 0.0, current, current])
+
+
+    def exit(self):
+        """
+        Mark the end of the innermost stage and update its entry in stages.
+        The time of a stage nested in another of the same name, e.g. a dataset
+        read that triggers another, is only counted once.
+
+        Helper for the stage func.
+        """
+        name, start_time, children_sec, start_mem, peak_mem = self.stack.pop()
+        elapsed = time.perf_counter() - start_time
+
+        if self.trace_memory:
+            peak_mem = max(peak_mem, tracemalloc.get_traced_memory()[1])
+            if self.stack:
+                self.stack[-1][4] = max(self.stack[-1][4], peak_mem)
+
+        if self.stack:
+            self.stack[-1][2] += elapsed
+
+        entry = self.stages[name]
+        entry['calls'] += 1
+        entry['self_sec'] += elapsed - children_sec
+
+        if name not in [frame[0] for frame in self.stack]:
+            entry['sec'] += elapsed
+
+        if self.trace_memory:
+            entry['peak_mb'] = max(entry['peak_mb'], (peak_mem - start_mem) / 2**20)
+
+
+    def get_report(self):
+        """
+        Return a JSON-serialisable dict with the total time, the stages' and
+        the series' entries; the latter comprise the recorded timings as well
+        as their count, total, mean, median, 95th percentile and maximum.
+        """
+        series = {}
+
+        for name, values in self.series.items():
+            series[name] = {
+                'count': len(values),
+                'total_sec': float(np.sum(values)),
+                'mean_sec': float(np.mean(values)),
+                'p50_sec': float(np.percentile(values, 50)),
+                'p95_sec': float(np.percentile(values, 95)),
+                'max_sec': float(np.max(values)),
+                'values': list(values)}
+
+        return {'total_sec': self.total_sec, 'stages': self.stages, 'series': series}
+
+
+    def format_table(self):
+        """
+        Return the report as a human-readable table of stages followed by a
+        table of series, without the individual timings.
+        """
+        report = self.get_report()
+
+        lines = ['{:<12}{:>8}{:>10}{:>10}{:>10}'.format(
+                    'stage', 'calls', 'sec', 'self sec', 'peak MB')]
+
+        for name, entry in report['stages'].items():
+            lines.append('{:<12}{:>8}{:>10.3f}{:>10.3f}{:>10}'.format(
+                    name, entry['calls'], entry['sec'], entry['self_sec'],
+                    '-' if entry['peak_mb'] is None else '{:.1f}'.format(entry['peak_mb'])))
+
+        lines.append('{:<12}{:>8}{:>10.3f}'.format('total', '', report['total_sec']))
+
+        if report['series']:
+            lines.append('')
+            lines.append('{:<12}{:>8}{:>10}{:>10}{:>10}{:>10}'.format(
+                    'series', 'count', 'mean sec', 'p50 sec', 'p95 sec', 'max sec'))
+
+            for name, entry in report['series'].items():
+                lines.append('{:<12}{:>8}{:>10.4f}{:>10.4f}{:>10.4f}{:>10.4f}'.format(
+                        name, entry['count'], entry['mean_sec'], entry['p50_sec'],
+                        entry['p95_sec'], entry['max_sec']))
+
+        return '\n'.join(lines)
+
+
+
+@contextlib.contextmanager
+def _stage(profiler, name):
+    """
+    Context manager marking a stage for the given profiler.
+
+    Helper for the stage func.
+    """
+    profiler.enter(name)
+    try:
+        yield
+    finally:
+        profiler.exit()
+
+
+
+def stage(name):
+    """
+    Return a context manager marking a stage of the code for the active
+    profiler; if there is none, this is a no-op.
+    """
+    if _profiler is None:
+        return _null_stage
+
+    return _stage(_profiler, name)
+
+
+
+def profiled(name):
+    """
+    Decorator marking each call of a func as a stage of the given name, see
+    the stage func. It should not be used with generator funcs.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+
+def record(name, seconds):
+    """
+    Add a timing to the named series of the active profiler, if any.
+    """
+    if _profiler is not None:
+        _profiler.series.setdefault(name, []).append(seconds)
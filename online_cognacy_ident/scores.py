@@ -0,0 +1,407 @@
+import collections.abc
+import hashlib
+import itertools
+import json
+import zipfile
+
+import numpy as np
+
+from online_cognacy_ident.cache import CachedScorer
+from online_cognacy_ident.dataset import Word
+from online_cognacy_ident.profiling import profiled
+
+
+
+class ScoresError(ValueError):
+    """
+    Raised when something goes wrong with saving or loading scores.
+    """
+    pass
+
+
+
+def condensed_index(i, j, size):
+    """
+    Return the position of the (i, j) pair, i < j, in the condensed distance
+    matrix of size items, i.e. in the itertools.combinations order.
+    """
+    return size * i - i * (i + 1) // 2 + (j - i - 1)
+
+
+
+class Scores(collections.abc.Mapping):
+    """
+    Holds the distance scores of a dataset's synonymous word pairs as one
+    condensed array per concept, the pairs being in the itertools.combinations
+    order of the concept's words.
+
+    It is also a read-only {(word1, word2): distance} mapping where the keys
+    are sorted Word tuples, so that it can be used in place of the dicts that
+    the apply_* funcs used to return.
+
+    Usage:
+
+        scores = Scores()
+        scores.add(concept, words, condensed)
+        words, condensed = scores.get_condensed(concept)
+    """
+
+    def __init__(self):
+        """
+        Init an empty container.
+        """
+        self.words = {}  # {concept: [Word, ..]}
+        self.arrays = {}  # {concept: condensed array}
+        self.indices = {}  # {concept: {Word: position}}, filled lazily
+
+        self.num_scored = None  # scorer calls it took, as set by score_dataset
+
+
+    def add(self, concept, words, condensed):
+        """
+        Add a concept's [] of words and the condensed array of their distances.
+        Raise a ValueError if the array is not of the right size.
+        """
+        condensed = np.asarray(condensed, dtype=float)
+
+        if len(condensed) != len(words) * (len(words) - 1) // 2:
+            raise ValueError('Wrong number of scores for concept: {}'.format(concept))
+
+        self.words[concept] = list(words)
+        self.arrays[concept] = condensed
+        self.indices.pop(concept, None)
+
+
+    def get_concepts(self):
+        """
+        Return the [] of concepts, in the order in which they were added.
+        """
+        return list(self.words.keys())
+
+
+    def get_condensed(self, concept):
+        """
+        Return the (words, condensed array) tuple of a concept. Raise a
+        KeyError if the concept is not there.
+        """
+        return self.words[concept], self.arrays[concept]
+
+
+    def get_index(self, concept):
+        """
+        Return the {Word: position} dict of a concept's words, i.e. their
+        positions in the concept's condensed array. Raise a KeyError if the
+        concept has no scores.
+        """
+        if concept not in self.indices:
+            self.indices[concept] = {
+                    word: i for i, word in enumerate(self.words[concept])}
+
+        return self.indices[concept]
+
+
+    def __getitem__(self, key):
+        word1, word2 = key
+
+        try:
+            index = self.get_index(word1.concept)
+            i, j = index[word1], index[word2]
+        except (AttributeError, KeyError):
+            raise KeyError(key)
+
+        if i == j:
+            raise KeyError(key)
+        elif i > j:
+            i, j = j, i
+
+        size = len(self.words[word1.concept])
+        return self.arrays[word1.concept][condensed_index(i, j, size)]
+
+
+    def __iter__(self):
+        for concept, words in self.words.items():
+            for word1, word2 in itertools.combinations(words, 2):
+                yield (word1, word2) if word1 < word2 else (word2, word1)
+
+
+    def __len__(self):
+        return sum([len(array) for array in self.arrays.values()])
+
+
+    @classmethod
+    def from_dict(cls, dataset, scores):
+        """
+        Create a Scores instance from a dataset and a {(word1, word2): distance}
+        dict where the keys are sorted Word tuples. Raise a KeyError if a pair
+        of the dataset's synonymous words is missing.
+        """
+        container = cls()
+
+        for concept, words in dataset.get_concepts().items():
+            container.add(concept, words, [
+                scores[(word1, word2) if word1 < word2 else (word2, word1)]
+                for word1, word2 in itertools.combinations(words, 2)])
+
+        return container
+
+
+
+def get_condensed(scores, concept, words):
+    """
+    Return the condensed array of distances between the given words of a
+    concept. If scores is a Scores instance that holds these very words, its
+    array is returned as is; otherwise, e.g. if scores is a dict, each pair is
+    looked up separately.
+    """
+    if isinstance(scores, Scores) and scores.words.get(concept) == words:
+        return scores.arrays[concept]
+
+    return np.array([
+        scores[(word1, word2) if word1 < word2 else (word2, word1)]
+        for word1, word2 in itertools.combinations(words, 2)], dtype=float)
+
+
+
+def score_pairs(words, rows, cols, scorer):
+    """
+    Return the array of the scorer's distances between the words at the given
+    row and column positions and the number of scorer calls it took. Each
+    distinct pair of transcriptions is only scored once; unless the scorer is
+    symmetric, the order of each pair is kept, so that asymmetric scorers
+    (phmm) give the same distances as if each pair had been scored.
+
+    Helper for the score_concept and update_scores funcs.
+    """
+    if len(rows) == 0:
+        return np.zeros(0), 0
+
+    forms = {}  # {asjp: index}
+    indices = np.array([forms.setdefault(word.asjp, len(forms)) for word in words], dtype=int)
+
+    firsts, seconds = indices[rows], indices[cols]
+
+    if getattr(scorer, 'symmetric', False):
+        firsts, seconds = np.minimum(firsts, seconds), np.maximum(firsts, seconds)
+
+    keys = np.unique(firsts * len(forms) + seconds)
+    unique = list(forms)
+
+    pairs = [(unique[key // len(forms)], unique[key % len(forms)]) for key in keys.tolist()]
+
+    if hasattr(scorer, 'prefetch'):
+        scorer.prefetch(pairs)
+
+    distances = np.array([scorer(asjp1, asjp2) for asjp1, asjp2 in pairs], dtype=float)
+
+    return distances[np.searchsorted(keys, firsts * len(forms) + seconds)], len(pairs)
+
+
+
+def score_concept(words, scorer):
+    """
+    Return the condensed array of the scorer's distances between the given
+    words and the number of scorer calls it took. Words sharing a
+    transcription, as is common with dialects, are only scored once per
+    distinct pair of transcriptions; pairs of words with the same
+    transcription are only scored once per transcription. See score_pairs.
+
+    Helper for the score_dataset func.
+    """
+    rows, cols = np.triu_indices(len(words), 1)
+
+    return score_pairs(words, rows, cols, scorer)
+
+
+
+def score_dataset(dataset, scorer, cache=None):
+    """
+    Return a Scores instance holding the scorer's distances between the
+    dataset's synonymous word pairs, with its num_scored attribute set to the
+    number of distinct transcription pairs that were scored; see the
+    score_concept func. The scorer should be a callable as returned by
+    model.get_scorer.
+
+    If a cache.ScoreCache is given, the distances are looked up in it first
+    and the ones that are not there are added to it; the cached scores of
+    each concept are read at once before the concept is scored.
+
+    Helper for the apply_pmi and apply_phmm funcs.
+    """
+    if cache is not None:
+        scorer = CachedScorer(scorer, cache)
+
+    scores = Scores()
+    scores.num_scored = 0
+
+    for concept, words in dataset.get_concepts().items():
+        condensed, num_scored = score_concept(words, scorer)
+        scores.add(concept, words, condensed)
+        scores.num_scored += num_scored
+
+    if cache is not None:
+        cache.flush()
+
+    return scores
+
+
+
+@profiled('scoring')
+def update_scores(prev_scores, dataset, scorer, cache=None):
+    """
+    Return a Scores instance for the dataset that re-uses the distances of the
+    word pairs found in prev_scores and only calls the scorer for the pairs
+    that involve a word not found there, e.g. one of newly added doculects.
+    The scorer should be a callable as returned by model.get_scorer. As in
+    score_dataset, the new pairs are scored once per distinct transcription
+    pair, looked up in and added to the cache if one is given, and the
+    num_scored attribute of the returned instance is set.
+
+    Note that the re-used distances are taken as they are, even if adding the
+    new words would have changed them (as with the phmm algorithm, where the
+    dataset's sound frequencies make part of the score).
+    """
+    if cache is not None:
+        scorer = CachedScorer(scorer, cache)
+
+    scores = Scores()
+    scores.num_scored = 0
+
+    for concept, words in dataset.get_concepts().items():
+        rows, cols = np.triu_indices(len(words), 1)
+        condensed = np.zeros(len(rows))
+
+        if concept in prev_scores.words:
+            prev_index = prev_scores.get_index(concept)
+            prev_size = len(prev_scores.words[concept])
+            positions = np.array([prev_index.get(word, -1) for word in words], dtype=int)
+        else:
+            positions = np.full(len(words), -1, dtype=int)
+
+        prev_rows, prev_cols = positions[rows], positions[cols]
+        is_old = (prev_rows >= 0) & (prev_cols >= 0)
+
+        if is_old.any():
+            i = np.minimum(prev_rows[is_old], prev_cols[is_old])
+            j = np.maximum(prev_rows[is_old], prev_cols[is_old])
+            condensed[is_old] = prev_scores.arrays[concept][condensed_index(i, j, prev_size)]
+
+        condensed[~is_old], num_scored = score_pairs(
+                words, rows[~is_old], cols[~is_old], scorer)
+
+        scores.add(concept, words, condensed)
+        scores.num_scored += num_scored
+
+    if cache is not None:
+        cache.flush()
+
+    return scores
+
+
+
+def get_file_hash(path):
+    """
+    Return the hex SHA-256 digest of a file's contents, e.g. of a model file.
+    Raise a ScoresError if the file cannot be read.
+    """
+    digest = hashlib.sha256()
+
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(2**20), b''):
+                digest.update(chunk)
+    except OSError:
+        raise ScoresError('Could not open file: {}'.format(path))
+
+    return digest.hexdigest()
+
+
+
+def get_dataset_hash(dataset):
+    """
+    Return the hex SHA-256 digest of a dataset's words, grouped by concept, as
+    these are what the scores depend on: the same file read with and without
+    IPA conversion hashes differently, while cognate classes, column order and
+    the csv dialect do not matter. For phmm the words also determine the sound
+    frequencies, so the whole dataset (rather than a shard of it) should be
+    hashed.
+    """
+    digest = hashlib.sha256()
+
+    for concept, words in dataset.get_concepts().items():
+        digest.update(json.dumps([concept, [list(word) for word in words]],
+                ensure_ascii=False).encode('utf-8'))
+
+    return digest.hexdigest()
+
+
+
+def save_scores(path, scores, meta=None):
+    """
+    Write a Scores instance to an uncompressed npz file holding one array per
+    concept and a JSON header listing the concepts and their words, along
+    with the given meta dict, e.g. the hashes of the model and the dataset the
+    scores were computed with. Raise a ScoresError if the file cannot be
+    written.
+    """
+    header = {'concepts': [
+        [concept, [list(word) for word in scores.words[concept]]]
+        for concept in scores.get_concepts()], 'meta': meta or {}}
+
+    arrays = {'concept_{}'.format(index): scores.arrays[concept]
+            for index, concept in enumerate(scores.get_concepts())}
+
+    try:
+        with open(path, 'wb') as f:
+            np.savez(f, header=np.array(json.dumps(header)), **arrays)
+    except OSError:
+        raise ScoresError('Could not write scores file: {}'.format(path))
+
+
+
+def load_scores_header(path):
+    """
+    Return the JSON header of a file written by save_scores as a dict with the
+    concepts and meta keys, without reading the scores themselves; the meta
+    dict is empty for files that do not have one. Raise a ScoresError if the
+    file cannot be opened or read.
+    """
+    try:
+        with open(path, 'rb') as f:
+            is_zip = zipfile.is_zipfile(f)
+    except OSError:
+        raise ScoresError('Could not open scores file: {}'.format(path))
+
+    try:
+        assert is_zip
+        with zipfile.ZipFile(path) as archive, archive.open('header.npy') as f:
+            header = json.loads(str(np.lib.format.read_array(f, allow_pickle=False)))
+
+        assert isinstance(header['concepts'], list)
+    except (AssertionError, KeyError, TypeError, ValueError, zipfile.BadZipFile):
+        raise ScoresError('Could not read scores file: {}'.format(path))
+
+    header.setdefault('meta', {})
+
+    return header
+
+
+
+def load_scores(path):
+    """
+    Load a Scores instance written by save_scores. Raise a ScoresError if the
+    file cannot be opened or read.
+    """
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            header = json.loads(str(data['header']))
+
+            scores = Scores()
+            for index, (concept, words) in enumerate(header['concepts']):
+                scores.add(concept, [Word._make(word) for word in words],
+                        data['concept_{}'.format(index)])
+    except OSError:
+        raise ScoresError('Could not open scores file: {}'.format(path))
+    except (KeyError, TypeError, ValueError, zipfile.BadZipFile):
+        raise ScoresError('Could not read scores file: {}'.format(path))
+
+    return scores
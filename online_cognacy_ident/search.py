@@ -0,0 +1,193 @@
+import itertools
+
+import numpy as np
+
+from online_cognacy_ident.index import QGramIndex, get_lsh_pairs
+from online_cognacy_ident.model import get_scorer
+
+
+
+"""
+The default number of candidate transcriptions that a query rescores with the
+model, i.e. the trade-off between the latency of a query and the chance that
+one of the k most similar words is not among the candidates.
+"""
+NUM_CANDIDATES = 100
+
+
+
+class QueryError(ValueError):
+    """
+    Raised when a query cannot be answered, e.g. if its transcription contains
+    a sound that the model does not know.
+    """
+    pass
+
+
+
+class WordIndex:
+    """
+    Answers queries for the words of a dataset that are most similar to a
+    given transcription under a model, without aligning the transcription
+    with all the words: the candidates are the distinct transcriptions that
+    share most q-grams with it, as found by a QGramIndex, and only these are
+    scored with the model.
+
+    The words of all concepts are indexed; a query can be restricted to one
+    concept. Words sharing a transcription share its distance. The index can
+    also look for similar words of different concepts, which the apply_*
+    funcs never compare, e.g. cognates with shifted meanings.
+
+    Both for queries and for cross-concept pairs, lower distances are always
+    more similar. The pmi scores are such distances already; the phmm scores
+    are similarities, as the similarity attribute of the scorers says, so the
+    index uses 1 - score as the distance of a phmm model, in [0; 0.5).
+
+    Usage:
+
+        index = WordIndex(dataset, *load_model(path))
+        for word, distance in index.query('mano', k=5):
+            print(word.doculect, word.concept, word.asjp, distance)
+    """
+
+    def __init__(self, dataset, algorithm, params, q=2):
+        """
+        Build the index over the dataset's words. The algorithm and params
+        should be as returned by load_model; for phmm, the dataset provides
+        the sound frequencies of the random model.
+        """
+        form_words = {}  # {asjp: [Word, ..]}
+        for word in dataset.get_words():
+            form_words.setdefault(word.asjp, []).append(word)
+
+        self.q = q
+        self.forms = list(form_words.keys())
+        self.words = list(form_words.values())
+
+        concept_positions = {}  # {concept: [position, ..]}
+        for position, words in enumerate(self.words):
+            for concept in set([word.concept for word in words]):
+                concept_positions.setdefault(concept, []).append(position)
+
+        self.concept_positions = {concept: np.array(positions)
+                for concept, positions in concept_positions.items()}
+
+        self.index = QGramIndex(self.forms, q)
+        self.scorer = get_scorer(algorithm, params, dataset)
+
+
+    def get_distance(self, asjp1, asjp2):
+        """
+        Return the distance between the two ASJP transcriptions under the
+        model, lower being more similar; see the class docstring. Raise a
+        QueryError if a transcription contains a sound unknown to the model.
+        """
+        try:
+            score = float(self.scorer(asjp1, asjp2))
+        except KeyError as err:
+            raise QueryError('Unknown sound in transcription: {}'.format(err.args[0]))
+
+        return 1 - score if self.scorer.similarity else score
+
+
+    def get_candidates(self, asjp, num_candidates=NUM_CANDIDATES, concept=None):
+        """
+        Return the positions of the num_candidates distinct transcriptions
+        sharing most q-grams with the given one, most similar first; ties are
+        broken by position. If a concept is given, only transcriptions of its
+        words are considered, so that all of them are candidates unless the
+        concept has more than num_candidates. If num_candidates is None, all
+        transcriptions are.
+        """
+        similarities = self.index.get_similarities(asjp)
+
+        if concept is None:
+            positions = np.arange(len(self.forms))
+        else:
+            positions = self.concept_positions.get(concept, np.zeros(0, dtype=int))
+
+        if num_candidates is not None and num_candidates < len(positions):
+            cutoff = -np.partition(-similarities[positions], num_candidates - 1)[num_candidates - 1]
+            positions = positions[similarities[positions] >= cutoff]
+
+        positions = positions[np.argsort(-similarities[positions], kind='mergesort')]
+
+        return positions[:num_candidates].tolist()
+
+
+    def query(self, asjp, k=10, num_candidates=NUM_CANDIDATES, concept=None):
+        """
+        Return the [] of (Word, distance) tuples of the k words most similar
+        to the given ASJP transcription, least distant first (see
+        get_distance), among the words of the num_candidates candidate
+        transcriptions; see get_candidates. Ties are broken by order in the
+        dataset. Raise a QueryError if the transcription cannot be scored.
+        """
+        distances = []
+
+        for position in self.get_candidates(asjp, num_candidates, concept):
+            distance = self.get_distance(asjp, self.forms[position])
+            distances.append((distance, position))
+
+        results = []
+
+        for distance, position in sorted(distances):
+            for word in self.words[position]:
+                if concept is None or word.concept == concept:
+                    results.append((word, distance))
+
+            if len(results) >= k:
+                break
+
+        return results[:k]
+
+
+    def get_cross_concept_candidates(self, num_bands=32, band_size=4, max_bucket=200):
+        """
+        Return the [] of (i, j), i <= j, position pairs of the distinct
+        transcriptions that are likely to be similar, as found by the
+        get_lsh_pairs func with the given args, and the words of which include
+        a pair of different concepts. A transcription makes a pair with itself
+        if it is shared by words of different concepts.
+        """
+        concepts = [set([word.concept for word in words]) for words in self.words]
+
+        candidates = [(i, i) for i in range(len(self.forms)) if len(concepts[i]) > 1]
+
+        for i, j in get_lsh_pairs(self.forms, num_bands, band_size,
+                self.q, max_bucket).tolist():
+            if len(concepts[i]) > 1 or concepts[i] != concepts[j]:
+                candidates.append((i, j))
+
+        return sorted(candidates)
+
+
+    def find_cross_concept_pairs(self, candidates, threshold=0.5):
+        """
+        Score the (i, j) candidates, as returned by get_cross_concept_candidates,
+        with the model and return the [] of (Word, Word, distance) tuples of
+        the pairs of words of different concepts whose transcriptions are
+        within the threshold distance, least distant first; see get_distance.
+        The first word of each pair has the i-th transcription, as the phmm
+        scores depend on the order. Raise a QueryError if a transcription cannot be scored.
+        """
+        results = []  # [(distance, i, j), ..]
+
+        for i, j in candidates:
+            distance = self.get_distance(self.forms[i], self.forms[j])
+
+            if distance <= threshold:
+                results.append((distance, i, j))
+
+        pairs = []
+
+        for distance, i, j in sorted(results):
+            if i == j:
+                word_pairs = itertools.combinations(self.words[i], 2)
+            else:
+                word_pairs = itertools.product(self.words[i], self.words[j])
+
+            pairs.extend([(word1, word2, distance) for word1, word2 in word_pairs
+                    if word1.concept != word2.concept])
+
+        return pairs
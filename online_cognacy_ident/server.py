@@ -0,0 +1,438 @@
+import collections
+import errno
+import http.client
+import http.server
+import json
+import os
+import socket
+import socketserver
+import stat
+import threading
+import time
+
+import numpy as np
+
+from online_cognacy_ident.clustering import cluster
+from online_cognacy_ident.dataset import Word, WordsDataset, clean_transcription
+from online_cognacy_ident.model import get_scorer
+from online_cognacy_ident.phmm import apply_phmm
+from online_cognacy_ident.pmi import apply_pmi
+
+
+
+"""
+The number of most recent requests per endpoint that the latency percentiles
+reported by the metrics endpoint are calculated on.
+"""
+LATENCY_WINDOW = 1000
+
+
+"""
+The clustering methods that requests can ask for. Spinglass can abort the
+whole process on disconnected graphs and edge betweenness is too slow for a
+server, so these are left out.
+"""
+SERVER_METHODS = ['infomap', 'labelprop', 'multilevel', 'components',
+        'upgma', 'labelprop-np', 'auto']
+
+
+
+class RequestError(ValueError):
+    """
+    Raised when a request to the scoring server cannot be served because of
+    the request itself, e.g. if it names an unknown model.
+    """
+    pass
+
+
+
+class ScoringService:
+    """
+    Holds a number of loaded models and serves the requests of the scoring
+    server, keeping latency and throughput metrics along the way. The models
+    are never reloaded and each request only builds a small dataset of the
+    words it contains.
+
+    Usage:
+
+        service = ScoringService({'pmi': load_model(path)})
+        response = service.handle('/cluster', {'model': 'pmi', 'words': words})
+    """
+
+    def __init__(self, models, threshold=0.5, method='infomap'):
+        """
+        The models arg should be a {name: (algorithm, params)} dict, the
+        values being as returned by load_model. The threshold and the method
+        are the clustering defaults for requests that do not specify them;
+        the method should be one of SERVER_METHODS.
+        """
+        self.models = dict(models)
+        self.threshold = threshold
+        self.method = method
+
+        self.start_time = time.time()
+        self.lock = threading.Lock()
+        self.counts = collections.Counter()  # {endpoint: num of requests}
+        self.errors = collections.Counter()  # {endpoint: num of failed requests}
+        self.items = collections.Counter()  # {endpoint: num of pairs/words}
+        self.total_times = collections.Counter()  # {endpoint: seconds}
+        self.latencies = collections.defaultdict(
+                lambda: collections.deque(maxlen=LATENCY_WINDOW))
+
+
+    def handle(self, endpoint, request=None):
+        """
+        Serve a request to the given endpoint and return the response as a
+        JSON-serialisable dict. The request should be the already decoded
+        JSON body of POST requests and None for GET requests. Raise a KeyError
+        if the endpoint does not exist or a RequestError if the request is
+        invalid.
+        """
+        handlers = {
+            '/models': self.get_models,
+            '/metrics': self.get_metrics,
+            '/distances': self.get_distances,
+            '/cluster': self.get_clusters}
+
+        handler = handlers[endpoint]
+        start_time = time.perf_counter()
+
+        try:
+            if request is None:
+                response, num_items = handler(), 0
+            else:
+                response, num_items = handler(request)
+        except (RequestError, KeyError, TypeError, ValueError) as err:
+            self.record(endpoint, time.perf_counter() - start_time, 0, failed=True)
+            if isinstance(err, RequestError):
+                raise
+            raise RequestError('Invalid request: {!s}'.format(err))
+
+        self.record(endpoint, time.perf_counter() - start_time, num_items)
+
+        return response
+
+
+    def record(self, endpoint, latency, num_items, failed=False):
+        """
+        Update the metrics with a served request.
+        """
+        with self.lock:
+            self.counts[endpoint] += 1
+            self.items[endpoint] += num_items
+            self.total_times[endpoint] += latency
+            self.latencies[endpoint].append(latency)
+            if failed:
+                self.errors[endpoint] += 1
+
+
+    def get_model(self, request):
+        """
+        Return the (algorithm, params) tuple of the model named in a request.
+        The model can be omitted if only one is loaded.
+        """
+        name = request.get('model')
+
+        if name is None and len(self.models) == 1:
+            name = list(self.models.keys())[0]
+
+        if name not in self.models:
+            raise RequestError('Unknown model: {}'.format(name))
+
+        return self.models[name]
+
+
+    def clean(self, trans, request):
+        """
+        Return the cleaned ASJP form of a transcription of a request, converting
+        it from IPA if the request's ipa key is set. Raise a RequestError if
+        the transcription is not a string.
+        """
+        if not isinstance(trans, str):
+            raise RequestError('Transcriptions should be strings')
+
+        return clean_transcription(trans, request.get('ipa', False))
+
+
+    def get_models(self):
+        """
+        Return the {models: {name: algorithm}} response.
+        """
+        return {'models': {name: algorithm
+                for name, (algorithm, _) in self.models.items()}}
+
+
+    def get_metrics(self):
+        """
+        Return the response with the uptime and, for each endpoint, the number
+        of requests, failed requests and processed pairs/words, the throughput
+        in requests per second of uptime, and the mean, median, 95th percentile
+        and maximum latencies in milliseconds over the most recent requests.
+        """
+        with self.lock:
+            uptime = time.time() - self.start_time
+            endpoints = {}
+
+            for endpoint, count in self.counts.items():
+                latencies = np.array(self.latencies[endpoint]) * 1000
+                endpoints[endpoint] = {
+                    'requests': count,
+                    'errors': self.errors[endpoint],
+                    'items': self.items[endpoint],
+                    'requests_per_sec': count / uptime,
+                    'total_sec': self.total_times[endpoint],
+                    'latency_ms': {
+                        'mean': float(np.mean(latencies)),
+                        'p50': float(np.percentile(latencies, 50)),
+                        'p95': float(np.percentile(latencies, 95)),
+                        'max': float(np.max(latencies))}}
+
+        return {'uptime_sec': uptime, 'endpoints': endpoints}
+
+
+    def get_distances(self, request):
+        """
+        Return the {distances: [], similarity: bool} response to a {model,
+        pairs, ipa} request, pairs being a [] of [transcription, transcription]
+        lists. The scores are the model's raw ones and similarity tells whether
+        higher ones are more similar, as with phmm, or less, as with pmi; see
+        the scorers' similarity attribute. The phmm model's random model uses
+        the sound frequencies of the request's transcriptions.
+        """
+        algorithm, params = self.get_model(request)
+
+        if not isinstance(request['pairs'], list) or any([
+                not isinstance(pair, list) or len(pair) != 2 for pair in request['pairs']]):
+            raise RequestError('Pairs should consist of two transcriptions')
+
+        pairs = [[self.clean(trans, request) for trans in pair]
+                for pair in request['pairs']]
+
+        dataset = WordsDataset([Word(None, None, trans) for pair in pairs for trans in pair])
+        scorer = get_scorer(algorithm, params, dataset)
+
+        return {'distances': [float(scorer(*pair)) for pair in pairs],
+                'similarity': scorer.similarity}, len(pairs)
+
+
+    def get_clusters(self, request):
+        """
+        Return the {clusters: {concept: [[[doculect, transcription], ..], ..]}}
+        response to a {model, words, threshold, method, ipa} request, words
+        being a [] of [doculect, concept, transcription] lists; the last three
+        keys are optional. As when reading a dataset file, only the first word
+        of a concept in a doculect is kept. The cognate sets and their words
+        are sorted.
+        """
+        algorithm, params = self.get_model(request)
+
+        threshold = float(request.get('threshold', self.threshold))
+        method = request.get('method', self.method)
+        if method not in SERVER_METHODS:
+            raise RequestError('Unsupported clustering method: {}'.format(method))
+
+        words, seen = [], set()
+        for doculect, concept, trans in request['words']:
+            if (doculect, concept) not in seen:
+                seen.add((doculect, concept))
+                words.append(Word(doculect, concept, self.clean(trans, request)))
+
+        dataset = WordsDataset(words)
+
+        if algorithm == 'phmm':
+            scores = apply_phmm(dataset, *params)
+        else:
+            scores = apply_pmi(dataset, params)
+
+        clusters = cluster(dataset, scores, threshold=threshold, method=method)
+
+        return {'clusters': {concept: sorted([
+                    sorted([[word.doculect, word.asjp] for word in cog_set])
+                    for cog_set in cog_sets])
+                for concept, cog_sets in clusters.items()}}, len(words)
+
+
+
+class RequestHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Translates the HTTP requests to the scoring server into calls to its
+    ScoringService instance and the latter's return values into JSON
+    responses. GET is used for /models and /metrics, POST with a JSON body
+    for /distances and /cluster.
+    """
+
+    def send_json(self, status, data):
+        """
+        Send a JSON response with the given status code.
+        """
+        body = json.dumps(data).encode('utf-8')
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def serve(self, request):
+        """
+        Serve a request through the server's service and send the response.
+        """
+        try:
+            self.send_json(200, self.server.service.handle(self.path, request))
+        except KeyError:
+            self.send_json(404, {'error': 'Unknown endpoint: {}'.format(self.path)})
+        except RequestError as err:
+            self.send_json(400, {'error': str(err)})
+
+
+    def do_GET(self):
+        if self.path in ['/distances', '/cluster']:
+            self.send_json(405, {'error': 'Use POST for {}'.format(self.path)})
+        else:
+            self.serve(None)
+
+
+    def do_POST(self):
+        if self.path in ['/models', '/metrics']:
+            self.send_json(405, {'error': 'Use GET for {}'.format(self.path)})
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length).decode('utf-8'))
+            assert isinstance(request, dict)
+        except (AssertionError, UnicodeDecodeError, ValueError):
+            self.send_json(400, {'error': 'The request body should be a JSON object'})
+            return
+
+        self.serve(request)
+
+
+    def address_string(self):
+        return self.client_address[0] if self.client_address else 'unix'
+
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+
+class TCPServer(http.server.HTTPServer):
+    """
+    Scoring server listening on a TCP address, e.g. on localhost.
+    """
+
+    def __init__(self, address, service, verbose=False):
+        self.service = service
+        self.verbose = verbose
+        super().__init__(address, RequestHandler)
+
+
+
+class UnixServer(socketserver.UnixStreamServer):
+    """
+    Scoring server listening on a Unix socket. A stale socket file left by a
+    previous server is removed; any other file at the path is left alone and
+    a FileExistsError is raised instead.
+    """
+
+    def __init__(self, path, service, verbose=False):
+        self.service = service
+        self.verbose = verbose
+
+        if os.path.exists(path):
+            if not stat.S_ISSOCK(os.stat(path).st_mode):
+                raise FileExistsError(errno.EEXIST, 'File exists and is not a socket', path)
+            os.remove(path)
+
+        super().__init__(path, RequestHandler)
+
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """
+    HTTPConnection over a Unix socket.
+    """
+
+    def __init__(self, path, timeout=60):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = path
+
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+
+class Client:
+    """
+    Minimal client of the scoring server, e.g. for testing it. Raise a
+    RequestError if the server responds with an error.
+
+    Usage:
+
+        client = Client(port=8000)
+        distances = client.distances('pmi', [['mano', 'manu']])
+    """
+
+    def __init__(self, host='127.0.0.1', port=8000, socket_path=None, timeout=60):
+        """
+        Set the server's address: either a host and a port or the path of a
+        Unix socket.
+        """
+        self.host = host
+        self.port = port
+        self.socket_path = socket_path
+        self.timeout = timeout
+
+
+    def request(self, method, endpoint, data=None):
+        """
+        Send a request and return the decoded JSON response.
+        """
+        if self.socket_path:
+            conn = UnixHTTPConnection(self.socket_path, self.timeout)
+        else:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+        try:
+            body = None if data is None else json.dumps(data).encode('utf-8')
+            headers = {} if data is None else {'Content-Type': 'application/json'}
+            conn.request(method, endpoint, body, headers)
+
+            response = conn.getresponse()
+            result = json.loads(response.read().decode('utf-8'))
+        finally:
+            conn.close()
+
+        if response.status != 200:
+            raise RequestError(result.get('error', response.reason))
+
+        return result
+
+
+    def models(self):
+        return self.request('GET', '/models')['models']
+
+
+    def metrics(self):
+        return self.request('GET', '/metrics')
+
+
+    def distances(self, model, pairs, ipa=False):
+        return self.request('POST', '/distances', {
+            'model': model, 'pairs': pairs, 'ipa': ipa})['distances']
+
+
+    def cluster(self, model, words, threshold=None, method=None, ipa=False):
+        data = {'model': model, 'words': words, 'ipa': ipa}
+        if threshold is not None:
+            data['threshold'] = threshold
+        if method is not None:
+            data['method'] = method
+
+        return self.request('POST', '/cluster', data)['clusters']
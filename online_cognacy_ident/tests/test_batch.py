@@ -0,0 +1,111 @@
+import json
+import os.path
+import tempfile
+
+from unittest import TestCase
+
+from online_cognacy_ident.batch import (
+        BatchError, JOB_DEFAULTS, RESULT_COLUMNS,
+        expand_jobs, read_dataset, read_spec, run_batch)
+from online_cognacy_ident.clustering import cluster
+from online_cognacy_ident.dataset import Dataset
+from online_cognacy_ident.evaluation import calc_f_score
+from online_cognacy_ident.model import load_model
+from online_cognacy_ident.pmi import apply_pmi
+from online_cognacy_ident.tests.test_model import get_small_pairs_dataset
+
+
+
+class BatchTestCase(TestCase):
+
+    def test_expand_jobs(self):
+        jobs = expand_jobs({
+            'defaults': {'training': 'training_data/pairs.txt',
+                'output': 'output/{algorithm}/{name}.tsv'},
+            'matrix': {'dataset': ['datasets/huon.tsv', 'datasets/bai.tsv'],
+                'algorithm': ['pmi', 'phmm']},
+            'jobs': [{'dataset': 'datasets/kadai.tsv', 'model': 'kadai.pmi'}]})
+
+        self.assertEqual(len(jobs), 5)
+        self.assertTrue(all([set(job.keys()) == set(JOB_DEFAULTS.keys()) for job in jobs]))
+
+        self.assertEqual([(job['name'], job['algorithm']) for job in jobs], [
+            ('huon', 'pmi'), ('huon', 'phmm'), ('bai', 'pmi'), ('bai', 'phmm'),
+            ('kadai', 'pmi')])
+
+        self.assertEqual(jobs[1]['model'], 'models/phmm/pairs_m=256,α=0.75.phmm')
+        self.assertEqual(jobs[1]['output'], 'output/phmm/huon.tsv')
+        self.assertEqual(jobs[4]['model'], 'kadai.pmi')
+
+    def test_expand_jobs_with_bad_spec(self):
+        with self.assertRaises(BatchError) as cm:
+            expand_jobs({'jobs': [{'dataset': 'huon.tsv', 'beta': 1}]})
+        self.assertEqual(str(cm.exception), 'Unknown job key: beta')
+
+        with self.assertRaises(BatchError) as cm:
+            expand_jobs({'jobs': [{'dataset': 'huon.tsv', 'output': '{dataset_name}'}]})
+        self.assertEqual(str(cm.exception), 'Invalid path template: {dataset_name}')
+
+        with self.assertRaises(BatchError):
+            expand_jobs({'matrix': {'algorithm': ['pmi']}})
+
+    def test_read_spec(self):
+        spec = {'matrix': {'dataset': ['datasets/huon.tsv'], 'alpha': [0.5, 1]}}
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'batch.json')
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(spec, f)
+
+            self.assertEqual(read_spec(path), spec)
+
+            with self.assertRaises(BatchError) as cm:
+                read_spec(os.path.join(temp_dir, 'missing.json'))
+            self.assertTrue(str(cm.exception).startswith('Could not open batch file'))
+
+        self.assertEqual(len(expand_jobs(read_spec('scripts/reproduce.json'))), 34)
+
+    def test_read_dataset(self):
+        dataset = Dataset('datasets/kadai.tsv')
+        words = read_dataset('datasets/kadai.tsv', cog_sets=True)
+
+        self.assertEqual(words.get_words(), dataset.get_words())
+        self.assertEqual(words.get_alphabet(), dataset.get_alphabet())
+        self.assertEqual(words.get_equilibrium(), dataset.get_equilibrium())
+        self.assertEqual(words.get_clusters(), dataset.get_clusters())
+
+    def test_run_batch(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            training = get_small_pairs_dataset(temp_dir).path
+
+            jobs = expand_jobs({
+                'defaults': {'training': training, 'batch_size': 64,
+                    'model': os.path.join(temp_dir, '{algorithm}.model'),
+                    'output': os.path.join(temp_dir, '{algorithm}', '{name}.tsv')},
+                'matrix': {
+                    'dataset': ['datasets/kadai.tsv', 'datasets/kamasau.tsv'],
+                    'algorithm': ['pmi', 'phmm']}})
+
+            results = run_batch(jobs)
+
+            self.assertEqual(len(results), 4)
+            for job, result in zip(jobs, results):
+                self.assertEqual(list(result.keys()), RESULT_COLUMNS)
+                self.assertEqual(result['name'], job['name'])
+                self.assertGreater(result['train_sec'], 0)
+                self.assertTrue(os.path.exists(job['output']))
+
+            dataset = Dataset('datasets/kamasau.tsv')
+            _, pmi = load_model(jobs[2]['model'])
+            clusters = cluster(dataset, apply_pmi(dataset, pmi))
+            self.assertEqual(results[2]['f_score'],
+                    calc_f_score(dataset.get_clusters(), clusters))
+
+            results = run_batch(jobs, num_workers=2)
+            self.assertTrue(all([result['train_sec'] is None for result in results]))
+            self.assertEqual(results[2]['f_score'],
+                    calc_f_score(dataset.get_clusters(), clusters))
+
+        with self.assertRaises(BatchError) as cm:
+            run_batch(expand_jobs({'jobs': [{'dataset': 'datasets/kadai.tsv'}]}))
+        self.assertTrue(str(cm.exception).startswith('Could not find model file'))
@@ -0,0 +1,113 @@
+import os.path
+import random
+import tempfile
+
+from unittest import TestCase
+
+import numpy as np
+
+from online_cognacy_ident.cache import CacheError, CachedScorer, ScoreCache
+from online_cognacy_ident.dataset import Dataset, WordsDataset
+from online_cognacy_ident.phmm import apply_phmm, train_phmm
+from online_cognacy_ident.phmm.wrapper import PHMMScorer
+from online_cognacy_ident.pmi import PMIScorer, apply_pmi, train_pmi
+from online_cognacy_ident.tests.test_model import get_small_pairs_dataset
+
+
+
+class CacheTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            training = get_small_pairs_dataset(temp_dir)
+
+            random.seed(42)
+            cls.pmi = train_pmi(training, batch_size=50, max_iter=3)
+
+            np.random.seed(42)
+            cls.phmm = list(train_phmm(training, batch_size=64)) + [training.get_alphabet()]
+
+        cls.dataset = Dataset('datasets/kadai.tsv')
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'cache.db')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_bad_path(self):
+        with self.assertRaises(CacheError) as cm:
+            ScoreCache(self.temp_dir.name)
+
+        self.assertTrue(str(cm.exception).startswith('Could not open cache'))
+
+    def test_apply_pmi(self):
+        scores = apply_pmi(self.dataset, self.pmi)
+
+        with ScoreCache(self.path) as cache:
+            self.assertEqual(dict(apply_pmi(self.dataset, self.pmi, cache=cache)), dict(scores))
+            first = cache.get_stats()
+
+        with ScoreCache(self.path) as cache:
+            self.assertEqual(dict(apply_pmi(self.dataset, self.pmi, cache=cache)), dict(scores))
+            second = cache.get_stats()
+
+        self.assertEqual(first['lookups'], scores.num_scored)
+        self.assertEqual(first['misses'], first['writes'])
+        self.assertLess(first['size'], scores.num_scored)
+
+        self.assertEqual(second['hit_rate'], 1.0)
+        self.assertEqual(second['reads'], first['size'])
+        self.assertEqual(second['writes'], 0)
+
+    def test_apply_phmm(self):
+        scores = apply_phmm(self.dataset, *self.phmm)
+
+        for _ in range(2):
+            with ScoreCache(self.path) as cache:
+                cached = apply_phmm(self.dataset, *self.phmm, cache=cache)
+                self.assertEqual(dict(cached), dict(scores))
+
+        self.assertEqual(cache.stats['hits'], scores.num_scored)
+        self.assertEqual(cached.num_scored, scores.num_scored)
+
+    def test_key_normalisation(self):
+        with ScoreCache(self.path) as cache:
+            scorer = CachedScorer(PMIScorer(self.pmi), cache)
+            distance = scorer('mano', 'ruka')
+            self.assertEqual(scorer('ruka', 'mano'), distance)
+            self.assertEqual(cache.stats['hits'], 1)
+
+            scorer = CachedScorer(PHMMScorer(self.dataset, *self.phmm), cache)
+            scorer('mano', 'ruka')
+            scorer('ruka', 'mano')
+            self.assertEqual(cache.stats['hits'], 1)
+
+    def test_fingerprints(self):
+        self.assertEqual(PMIScorer(dict(self.pmi)).get_fingerprint(),
+                PMIScorer(self.pmi).get_fingerprint())
+
+        other = dict(self.pmi)
+        other[next(iter(other))] += 1
+        self.assertNotEqual(PMIScorer(other).get_fingerprint(),
+                PMIScorer(self.pmi).get_fingerprint())
+
+        words = list(self.dataset.get_words())
+        subset = WordsDataset(words[:len(words) // 2])
+        self.assertNotEqual(PHMMScorer(subset, *self.phmm).get_fingerprint(),
+                PHMMScorer(self.dataset, *self.phmm).get_fingerprint())
+
+    def test_eviction(self):
+        with ScoreCache(self.path, max_size=10, memory_size=5, write_every=4) as cache:
+            for index in range(20):
+                cache.put(1, 'a', str(index), index / 20)
+
+            cache.flush()
+            self.assertEqual(cache.get_stats()['size'], 10)
+            self.assertEqual(cache.stats['evicted'], 10)
+            self.assertEqual(len(cache.memory), 5)
+
+            self.assertIsNone(cache.get(1, 'a', '0'))
+            self.assertEqual(cache.get(1, 'a', '19'), 19 / 20)
@@ -0,0 +1,118 @@
+import io
+import json
+import os.path
+import random
+import tempfile
+
+from unittest import TestCase
+
+import numpy as np
+
+from online_cognacy_ident.callbacks import (
+        Callback, CallbackList, MetricsWriter, ProgressReporter)
+from online_cognacy_ident.phmm import train_phmm
+from online_cognacy_ident.pmi import train_pmi
+from online_cognacy_ident.tests.test_model import get_small_pairs_dataset
+
+
+
+class Recorder(Callback):
+
+    def __init__(self):
+        self.events = []
+
+    def on_batch_end(self, info):
+        self.events.append(('batch_end', info))
+
+    def on_epoch_end(self, info):
+        self.events.append(('epoch_end', info))
+
+    def on_convergence_check(self, info):
+        self.events.append(('convergence_check', info))
+
+    def on_train_end(self, info):
+        self.events.append(('train_end', info))
+
+    def get(self, event):
+        return [info for name, info in self.events if name == event]
+
+
+
+class CallbacksTestCase(TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.dataset = get_small_pairs_dataset(self.temp_dir.name)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_callback_list(self):
+        self.assertFalse(CallbackList())
+        self.assertTrue(CallbackList(Callback()))
+
+        callbacks = CallbackList([Callback()])
+        callbacks.start()
+        callbacks.get_info(batch_pairs=10)
+        info = callbacks.get_info(batch_pairs=5, epoch=0)
+
+        self.assertEqual(info['pairs'], 15)
+        self.assertEqual(info['epoch'], 0)
+        self.assertGreater(info['pairs_per_sec'], 0)
+
+    def test_train_pmi(self):
+        random.seed(42)
+        pmi = train_pmi(self.dataset, batch_size=50, max_iter=3)
+
+        recorder = Recorder()
+        random.seed(42)
+        self.assertEqual(dict(train_pmi(self.dataset, batch_size=50, max_iter=3,
+                callbacks=[recorder, ProgressReporter(io.StringIO())])), dict(pmi))
+
+        self.assertEqual(recorder.events[-1][0], 'train_end')
+        self.assertEqual(len(recorder.get('epoch_end')), 3)
+
+        checks = recorder.get('convergence_check')
+        self.assertEqual([info['converged'] for info in checks], [False, False, True])
+        self.assertTrue(all([info['delta'] > 0 for info in checks]))
+
+        batches = recorder.get('batch_end')
+        self.assertEqual(batches[0]['batch'], 1)
+        self.assertEqual(batches[-1]['batch'], len(batches))
+        self.assertEqual(batches[-1]['pairs'], sum([info['batch_pairs'] for info in batches]))
+        self.assertEqual(recorder.events[-1][1]['pairs'], batches[-1]['pairs'])
+
+    def test_train_phmm(self):
+        np.random.seed(42)
+        params = train_phmm(self.dataset, batch_size=64)
+
+        recorder = Recorder()
+        np.random.seed(42)
+        for expected, actual in zip(params, train_phmm(
+                self.dataset, batch_size=64, callbacks=[recorder])):
+            self.assertTrue(np.array_equal(expected, actual))
+
+        checks = recorder.get('convergence_check')
+        self.assertTrue(checks[-1]['converged'])
+        self.assertIsNone(checks[0]['delta'])
+        self.assertTrue(all([info['ll'] is not None for info in checks]))
+
+        batches = recorder.get('batch_end')
+        self.assertEqual(batches[0]['epoch_pairs'], len(self.dataset.get_asjp_pairs(0.5)))
+        self.assertTrue(all([info['pruned'] is None for info in batches]))
+
+    def test_metrics_writer(self):
+        path = os.path.join(self.temp_dir.name, 'metrics.jsonl')
+
+        with MetricsWriter(path, batch_every=2) as writer:
+            train_pmi(self.dataset, batch_size=50, max_iter=2, callbacks=[writer])
+
+        with open(path, encoding='utf-8') as f:
+            lines = [json.loads(line) for line in f]
+
+        events = [line['event'] for line in lines]
+        self.assertEqual(events.count('epoch_end'), 2)
+        self.assertEqual(events[-1], 'train_end')
+        self.assertTrue(all([line['batch'] % 2 == 0
+                for line in lines if line['event'] == 'batch_end']))
+        self.assertTrue(all(['time' in line for line in lines]))
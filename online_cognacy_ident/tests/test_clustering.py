@@ -0,0 +1,157 @@
+from unittest import TestCase
+
+import itertools
+import random
+
+import numpy as np
+
+from online_cognacy_ident.align import normalized_levenshtein
+from online_cognacy_ident.clustering import (
+        cluster, condensed_clustering, igraph_clustering, knn_cluster, sweep,
+        update_clusters,
+        components_clustering, upgma_clustering, labelprop_clustering)
+from online_cognacy_ident.dataset import Dataset, Word, WordsDataset
+from online_cognacy_ident.scores import Scores
+
+
+
+class ClusteringTestCase(TestCase):
+
+    def setUp(self):
+        self.matrix = np.array([
+            [0.0, 0.1, 0.2, 0.9, 0.8],
+            [0.1, 0.0, 0.3, 0.9, 0.9],
+            [0.2, 0.3, 0.0, 0.7, 0.9],
+            [0.9, 0.9, 0.7, 0.0, 0.2],
+            [0.8, 0.9, 0.9, 0.2, 0.0]])
+
+    def test_igraph_clustering(self):
+        for method in ['infomap', 'labelprop', 'multilevel', 'ebet']:
+            labels = igraph_clustering(self.matrix, 0.5, method)
+
+            self.assertEqual(set(labels.keys()), set(range(5)))
+            self.assertEqual(len({labels[0], labels[1], labels[2]}), 1)
+            self.assertEqual(labels[3], labels[4])
+            self.assertNotEqual(labels[0], labels[3])
+
+    def test_native_clustering(self):
+        rows, cols = np.triu_indices(5, k=1)
+        condensed = self.matrix[rows, cols]
+
+        for method in ['components', 'upgma', 'labelprop-np', 'auto']:
+            labels = condensed_clustering(condensed, 5, 0.5, method)
+
+            self.assertEqual(set(labels.keys()), set(range(5)))
+            self.assertEqual(len({labels[0], labels[1], labels[2]}), 1)
+            self.assertEqual(labels[3], labels[4])
+            self.assertNotEqual(labels[0], labels[3])
+
+    def test_components_clustering(self):
+        labels = components_clustering(6, [(4, 5), (1, 5), (0, 2)])
+        self.assertEqual(labels, {0: 0, 1: 1, 2: 0, 3: 3, 4: 1, 5: 1})
+
+        self.assertEqual(components_clustering(2, []), {0: 0, 1: 1})
+
+    def test_upgma_clustering(self):
+        # 0 and 1 merge first; the average distance of 2 to them is then 0.5
+        condensed = np.array([0.1, 0.4, 0.6])
+
+        self.assertEqual(upgma_clustering(condensed, 3, 0.5), {0: 0, 1: 0, 2: 0})
+        self.assertEqual(upgma_clustering(condensed, 3, 0.45), {0: 0, 1: 0, 2: 2})
+
+    def test_labelprop_clustering(self):
+        labels = labelprop_clustering(4, [(0, 1), (1, 2)], [0.1, 0.2])
+
+        self.assertEqual(len({labels[0], labels[1], labels[2]}), 1)
+        self.assertEqual(labels[3], 3)
+        self.assertEqual(labelprop_clustering(4, [(0, 1), (1, 2)], [0.1, 0.2]), labels)
+
+    def test_igraph_clustering_without_edges(self):
+        labels = igraph_clustering(self.matrix, 0.05)
+        self.assertEqual(len(set(labels.values())), 5)
+
+        labels = igraph_clustering(np.zeros((1, 1)), 0.5)
+        self.assertEqual(labels, {0: 0})
+
+    def test_knn_cluster(self):
+        words = [Word(lang, 'hand', asjp) for lang, asjp in [
+            ('a', 'mano'), ('b', 'manu'), ('c', 'mani'), ('d', 'ruka'),
+            ('e', 'ruke'), ('f', 'hant')]]
+        words += [Word('a', 'one', 'uno')]
+        dataset = WordsDataset(words)
+
+        scored = []
+        def scorer(asjp1, asjp2):
+            scored.append((asjp1, asjp2))
+            return normalized_levenshtein(asjp1, asjp2)
+
+        clusters = knn_cluster(dataset, scorer, k=1, threshold=0.3)
+
+        self.assertEqual(clusters, {'hand': frozenset([
+            frozenset(words[:3]), frozenset(words[3:5]), frozenset(words[5:6])])})
+        self.assertEqual(len(scored), len(set(scored)))
+        self.assertNotIn(('ruka', 'hant'), scored)
+
+    def get_kamasau_scores(self):
+        dataset = Dataset('datasets/kamasau.tsv')
+
+        scores = {}
+        for words in dataset.get_concepts().values():
+            for word1, word2 in itertools.combinations(words, 2):
+                key = (word1, word2) if word1 < word2 else (word2, word1)
+                scores[key] = normalized_levenshtein(word1.asjp, word2.asjp)
+
+        return dataset, scores
+
+    def test_cluster_with_jobs(self):
+        dataset, scores = self.get_kamasau_scores()
+
+        clusters = cluster(dataset, scores)
+        self.assertEqual(set(clusters.keys()), set(dataset.get_concepts().keys()))
+        self.assertEqual(cluster(dataset, scores, jobs=3), clusters)
+
+    def test_cluster_keeps_random_state(self):
+        dataset, scores = self.get_kamasau_scores()
+
+        random.seed(1)
+        expected = random.random()
+
+        random.seed(1)
+        cluster(dataset, scores)
+        self.assertEqual(random.random(), expected)
+
+    def test_sweep(self):
+        dataset, scores = self.get_kamasau_scores()
+
+        thresholds = [0.6, 0.2, 0.4]
+        methods = ['infomap', 'components', 'upgma', 'labelprop-np']
+        sweeps = sweep(dataset, scores, thresholds, methods)
+
+        self.assertEqual(len(sweeps), 12)
+
+        for method in methods:
+            for threshold in thresholds:
+                self.assertEqual(sweeps[(method, threshold)],
+                        cluster(dataset, scores, threshold, method))
+
+    def test_update_clusters(self):
+        words = [Word(lang, 'hand', asjp) for lang, asjp in [
+            ('a', 'mano'), ('b', 'manu'), ('c', 'ruka'), ('d', 'ruke'),
+            ('e', 'hant'), ('f', 'mani'), ('g', 'xyz')]]
+        dataset = WordsDataset(words)
+
+        scores = Scores()
+        scores.add('hand', words, [normalized_levenshtein(word1.asjp, word2.asjp)
+                for word1, word2 in itertools.combinations(words, 2)])
+
+        prev_clusters = {'hand': frozenset([
+            frozenset(words[:2]), frozenset(words[2:4]), frozenset(words[4:5])])}
+
+        clusters = update_clusters(scores, prev_clusters, threshold=0.4, recluster_ratio=0.5)
+        self.assertEqual(clusters, {'hand': frozenset([
+            frozenset(words[:2] + words[5:6]), frozenset(words[2:4]),
+            frozenset(words[4:5]), frozenset(words[6:])])})
+
+        clusters = update_clusters(scores, prev_clusters, threshold=0.4,
+                method='upgma', recluster_ratio=0.2)
+        self.assertEqual(clusters, cluster(dataset, scores, 0.4, 'upgma'))
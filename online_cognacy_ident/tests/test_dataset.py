@@ -11,7 +11,8 @@ from hypothesis.strategies import composite, integers, lists, sets, text
 from hypothesis import assume, given
 
 from online_cognacy_ident.dataset import (
-        Word, DatasetError, Dataset, PairsDataset, write_clusters)
+        Word, DatasetError, Dataset, WordsDataset, PairsDataset,
+        assign_shards, merge_clusters, write_clusters)
 
 
 
@@ -142,6 +143,66 @@ class DatasetTestCase(TestCase):
                 self.assertEqual(sorted(dataset_.get_words()), sorted(words))
                 self.assertEqual(dataset_.get_clusters(), clusters)
 
+    def test_iter_concepts_with_kamasau(self):
+        dataset = Dataset('datasets/kamasau.tsv')
+        concepts = dataset.get_concepts()
+        clusters = dataset.get_clusters()
+
+        for presorted in [True, False]:
+            blocks = list(dataset.iter_concepts(presorted, cog_sets=True, chunk_size=50))
+            self.assertEqual(len(blocks), len(concepts))
+
+            for concept, block in blocks:
+                self.assertEqual(block.get_words(), concepts[concept])
+                self.assertEqual(block.get_alphabet(), dataset.get_alphabet())
+                self.assertEqual(block.get_clusters(), {concept: clusters[concept]})
+
+    def test_iter_concepts_with_scattered_concepts(self):
+        dataset = Dataset('datasets/abvd.tsv', is_ipa=True)
+
+        with self.assertRaises(DatasetError) as cm:
+            list(dataset.iter_concepts())
+
+        self.assertTrue(str(cm.exception).startswith('Concept is not in a contiguous block'))
+
+        blocks = dataset.iter_concepts(presorted=False)
+        concept, block = next(blocks)
+        self.assertEqual(block.get_words(), dataset.get_concepts()[concept])
+
+    def test_get_subset_with_kamasau(self):
+        dataset = Dataset('datasets/kamasau.tsv')
+        concepts = dataset.get_concepts()
+        clusters = dataset.get_clusters()
+
+        subset = dataset.get_subset({'I', 'die'}, cog_sets=True)
+        self.assertEqual(subset.get_concepts(), {
+            'I': concepts['I'], 'die': concepts['die']})
+        self.assertEqual(subset.get_clusters(), {
+            'I': clusters['I'], 'die': clusters['die']})
+        self.assertEqual(subset.get_alphabet(), dataset.get_alphabet())
+
+    def test_assign_shards_with_kamasau(self):
+        sizes = Dataset('datasets/kamasau.tsv').get_concept_sizes()
+        self.assertEqual(sum(sizes.values()), 271)
+
+        shards = assign_shards(sizes, 3)
+        self.assertEqual(set.union(*shards), set(sizes.keys()))
+        self.assertEqual(sum([len(shard) for shard in shards]), len(sizes))
+        self.assertEqual(shards, assign_shards(dict(reversed(list(sizes.items()))), 3))
+
+        loads = [sum([sizes[c] * (sizes[c] - 1) // 2 for c in shard]) for shard in shards]
+        self.assertLessEqual(max(loads) - min(loads), max(sizes.values()) ** 2 // 2)
+
+    @given(clusters())
+    def test_merge_clusters(self, clusters):
+        items = sorted(clusters.items())
+        parts = [dict(items[:len(items)//2]), dict(items[len(items)//2:])]
+
+        self.assertEqual(merge_clusters(parts), clusters)
+
+        with self.assertRaises(DatasetError):
+            merge_clusters([clusters, clusters])
+
     @given(clusters())
     def test_get_words(self, clusters):
         words = [word for cog_sets in clusters.values()
@@ -169,6 +230,31 @@ class DatasetTestCase(TestCase):
 
 
 
+class WordsDatasetTestCase(TestCase):
+
+    def test_get_alphabet_and_concepts(self):
+        words = [Word('a', 'I', 'ne'), Word('b', 'I', 'ni'), Word('a', 'you', 'yu')]
+        dataset = WordsDataset(words)
+
+        self.assertEqual(dataset.get_alphabet(), ['e', 'i', 'n', 'u', 'y'])
+        self.assertEqual(dataset.get_equilibrium()['n'], 2.0)
+        self.assertEqual(dataset.get_concepts(), {'I': words[:2], 'you': words[2:]})
+
+        with self.assertRaises(DatasetError):
+            dataset.get_clusters()
+
+    @given(clusters())
+    def test_get_clusters(self, clusters):
+        words = [word for cog_sets in clusters.values()
+                for cog_set in cog_sets for word in cog_set]
+        cog_classes = [cog_set for cog_sets in clusters.values()
+                for cog_set in cog_sets for word in cog_set]
+
+        dataset = WordsDataset(words, cog_classes=cog_classes)
+        self.assertEqual(dataset.get_clusters(), clusters)
+
+
+
 class PairsDatasetTestCase(TestCase):
 
     MAYAN_DATASET = 'training_data/Mayan_asjp40_word_pairs.txt'
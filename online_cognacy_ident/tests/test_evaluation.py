@@ -1,15 +1,38 @@
 from string import ascii_lowercase
 from unittest import TestCase
 
-from hypothesis.strategies import lists, sampled_from
+import numpy as np
+
+from hypothesis.strategies import floats, lists, sampled_from
 from hypothesis import given
 
-from online_cognacy_ident.evaluation import calc_b_cubed, calc_f_score
+from online_cognacy_ident.evaluation import (
+        METRICS, bootstrap, calc_b_cubed, calc_concept_f_scores, calc_f_score,
+        calc_metrics, evaluate, paired_bootstrap, resample_means, summarise)
 
 from online_cognacy_ident.tests.test_dataset import clusters
 
 
 
+def pairwise_b_cubed(true_labels, labels):
+    """
+    Calculate the B-cubed scores by comparing all pairs of items, as the
+    b_cubed function of PhyloStar's CogDetect library does.
+    """
+    precision, recall = [], []
+
+    for i, label in enumerate(labels):
+        match = sum([1.0 for j, other in enumerate(labels)
+                if other == label and true_labels[j] == true_labels[i]])
+        precision.append(match / labels.count(label))
+        recall.append(match / true_labels.count(true_labels[i]))
+
+    avg_precision, avg_recall = np.average(precision), np.average(recall)
+    return avg_precision, avg_recall, \
+            2.0*avg_precision*avg_recall/(avg_precision+avg_recall)
+
+
+
 class EvaluationTestCase(TestCase):
 
     @given(lists(sampled_from(ascii_lowercase), min_size=1))
@@ -23,6 +46,87 @@ class EvaluationTestCase(TestCase):
         for item in res:
             self.assertTrue(0.0 <= item <= 1.0)
 
+    @given(lists(sampled_from('abcd'), min_size=1, max_size=20),
+            lists(sampled_from('wxyz'), min_size=20, max_size=20))
+    def test_calc_b_cubed_matches_pairwise(self, labels_a, labels_b):
+        labels_b = labels_b[:len(labels_a)]
+        self.assertEqual(calc_b_cubed(labels_a, labels_b),
+                pairwise_b_cubed(labels_a, labels_b))
+
     @given(clusters())
     def test_calc_f_score_on_identical_clusters(self, clusters):
         self.assertEqual(calc_f_score(clusters, clusters), 1.0)
+
+    @given(lists(sampled_from(ascii_lowercase), min_size=1))
+    def test_calc_metrics_on_identical_lists(self, labels):
+        metrics = calc_metrics(labels, labels)
+        self.assertEqual(set(metrics.keys()), set(METRICS))
+        for value in metrics.values():
+            self.assertEqual(value, 1.0)
+
+    @given(lists(sampled_from('abcd'), min_size=1, max_size=20),
+            lists(sampled_from('wxyz'), min_size=20, max_size=20))
+    def test_calc_metrics_b_cubed(self, labels_a, labels_b):
+        labels_b = labels_b[:len(labels_a)]
+        metrics = calc_metrics(labels_a, labels_b)
+        self.assertEqual(calc_b_cubed(labels_a, labels_b), (
+            metrics['b_cubed_precision'], metrics['b_cubed_recall'],
+            metrics['b_cubed_f_score']))
+
+    def test_calc_metrics_pairwise(self):
+        metrics = calc_metrics(['a', 'a', 'b', 'c'], ['x', 'x', 'y', 'y'])
+        self.assertEqual(metrics['pair_precision'], 0.5)
+        self.assertEqual(metrics['pair_recall'], 1.0)
+        self.assertAlmostEqual(metrics['pair_f_score'], 2/3)
+        self.assertAlmostEqual(metrics['ari'], 4/7)
+
+        metrics = calc_metrics(['a', 'b', 'c'], ['x', 'x', 'x'])
+        self.assertEqual(metrics['pair_precision'], 0.0)
+        self.assertEqual(metrics['pair_recall'], 1.0)
+        self.assertEqual(metrics['ari'], 0.0)
+
+    @given(clusters())
+    def test_evaluate_on_identical_clusters(self, clusters):
+        concept_metrics = evaluate(clusters, clusters)
+        self.assertEqual(set(concept_metrics.keys()), set(clusters.keys()))
+
+        metrics = summarise(concept_metrics)
+        self.assertEqual(metrics['b_cubed_f_score'], calc_f_score(clusters, clusters))
+        self.assertEqual(metrics['ari'], 1.0)
+
+    @given(clusters())
+    def test_calc_concept_f_scores(self, clusters):
+        f_scores = calc_concept_f_scores(clusters, clusters)
+        self.assertEqual(list(f_scores.keys()), list(clusters.keys()))
+        self.assertEqual(np.mean(list(f_scores.values())), calc_f_score(clusters, clusters))
+
+    @given(lists(floats(0, 1), min_size=1, max_size=50))
+    def test_bootstrap_is_in_range(self, scores):
+        low, high = bootstrap(scores, 200)
+        self.assertTrue(min(scores) - 1e-9 <= low <= high <= max(scores) + 1e-9)
+
+    def test_bootstrap(self):
+        self.assertEqual(bootstrap([0.5] * 10, 100), (0.5, 0.5))
+
+        scores = np.random.RandomState(0).random_sample(100)
+        low, high = bootstrap(scores, 2000)
+        self.assertTrue(low < np.mean(scores) < high)
+        self.assertEqual(bootstrap(scores, 2000), (low, high))
+        self.assertTrue(bootstrap(scores, 2000, confidence=0.5)[0] > low)
+
+        self.assertEqual(len(resample_means(scores, 12345)), 12345)
+        with self.assertRaises(ValueError):
+            resample_means([])
+
+    def test_paired_bootstrap(self):
+        scores = np.random.RandomState(0).random_sample(100)
+
+        self.assertEqual(paired_bootstrap(scores, scores, 100), (0, 0, 0, 1.0))
+
+        diff, low, high, p = paired_bootstrap(scores + 0.1, scores[::-1], 1000)
+        self.assertAlmostEqual(diff, 0.1)
+        self.assertTrue(low < diff < high)
+        self.assertTrue(0 <= p <= 1)
+
+        with self.assertRaises(ValueError):
+            paired_bootstrap(scores, scores[1:])
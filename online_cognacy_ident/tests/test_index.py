@@ -0,0 +1,56 @@
+import itertools
+
+from unittest import TestCase
+
+import numpy as np
+
+from online_cognacy_ident.index import (
+        get_qgrams, get_minhashes, get_lsh_pairs, QGramIndex)
+
+
+
+class IndexTestCase(TestCase):
+
+    def test_get_qgrams(self):
+        self.assertEqual(get_qgrams('mano'), {'#m', 'ma', 'an', 'no', 'o#'})
+        self.assertEqual(get_qgrams('aa', q=3), {'##a', '#aa', 'aa#', 'a##'})
+        self.assertEqual(get_qgrams(''), {'##'})
+
+    def test_get_candidates(self):
+        index = QGramIndex(['mano', 'manu', 'pes', 'mani', 'ruka'])
+
+        self.assertEqual(index.get_candidates('mano'), [0, 1, 3])
+        self.assertEqual(index.get_candidates('mano', exclude=0), [1, 3])
+        self.assertEqual(index.get_candidates('mano', limit=2), [0, 1])
+        self.assertEqual(index.get_candidates('xyz'), [])
+
+        similarities = index.get_similarities('pes')
+        self.assertEqual(similarities[2], 1.0)
+        self.assertEqual(similarities[4], 0.0)
+
+    def test_get_minhashes(self):
+        signatures = get_minhashes(['mano', 'mano', 'pes', 'manu'], 256, chunk_size=3)
+
+        self.assertEqual(signatures.shape, (4, 256))
+        self.assertTrue(np.array_equal(signatures[0], signatures[1]))
+        self.assertLess(np.mean(signatures[0] == signatures[2]), 0.1)
+        self.assertAlmostEqual(np.mean(signatures[0] == signatures[3]), 3 / 7, delta=0.15)
+
+        self.assertTrue(np.array_equal(signatures,
+                get_minhashes(['mano', 'mano', 'pes', 'manu'], 256)))
+
+    def test_get_lsh_pairs(self):
+        transcriptions = ['mano', 'manu', 'pes', 'mani', 'ruka', 'rukan']
+
+        pairs = get_lsh_pairs(transcriptions, num_bands=64, band_size=2)
+        self.assertEqual(pairs.shape[1], 2)
+        self.assertTrue(np.all(pairs[:, 0] < pairs[:, 1]))
+        self.assertIn([0, 1], pairs.tolist())
+        self.assertIn([4, 5], pairs.tolist())
+        self.assertNotIn([2, 4], pairs.tolist())
+
+        pairs = get_lsh_pairs(transcriptions, num_bands=1, band_size=1, max_bucket=100)
+        self.assertTrue(set(map(tuple, pairs.tolist())) <=
+                set(itertools.combinations(range(len(transcriptions)), 2)))
+
+        self.assertEqual(get_lsh_pairs(transcriptions, max_bucket=1).shape, (0, 2))
@@ -1,11 +1,39 @@
+import itertools
 import os.path
+import pickle
+import random
 import tempfile
 
 from unittest import TestCase
 
 import numpy as np
 
-from online_cognacy_ident.model import load_model, save_model, ModelError
+from online_cognacy_ident.dataset import PairsDataset, WordsDataset, Word
+from online_cognacy_ident.model import (
+        load_model, load_model_header, save_model, get_scorer, ModelError,
+        Checkpointer, load_checkpoint, save_checkpoint)
+from online_cognacy_ident.phmm import train_phmm
+from online_cognacy_ident.phmm.wrapper import remap_params
+from online_cognacy_ident.pmi import train_pmi
+
+
+
+def get_small_pairs_dataset(temp_dir, num_lines=200):
+    """
+    Return a PairsDataset of the first lines of the Mayan training data.
+    """
+    path = os.path.join(temp_dir, 'pairs.txt')
+
+    with open('training_data/Mayan_asjp40_word_pairs.txt', encoding='utf-8') as f:
+        with open(path, 'w', encoding='utf-8') as out:
+            out.writelines(itertools.islice(f, num_lines))
+
+    return PairsDataset(path)
+
+
+
+class Interrupt(Exception):
+    pass
 
 
 
@@ -58,3 +86,165 @@ class ModelTestCase(TestCase):
         for index, param in enumerate([em, gx, gy, trans]):
             self.assertTrue(type(model[1][index]) is np.ndarray)
             np.testing.assert_array_equal(model[1][index], param)
+
+        self.assertIsNone(model[1][4])
+
+    def test_save_and_load_model_phmm_with_alphabet(self):
+        em = np.array([[0.4, 0.1], [0.1, 0.4]])
+        gx = np.array([0.3, 0.7])
+        trans = np.array([0.3, 0.3, 0.3, 0.1, 0.1])
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'model')
+            save_model(path, 'phmm', [em, gx, gx, trans, ['a', 'b']], {'alpha': 0.75})
+
+            header = load_model_header(path)
+            self.assertEqual(header['version'], 1)
+            self.assertEqual(header['algorithm'], 'phmm')
+            self.assertEqual(header['alphabet'], ['a', 'b'])
+            self.assertEqual(header['hyperparams'], {'alpha': 0.75})
+
+            algorithm, params = load_model(path, mmap_mode='r')
+            self.assertEqual(algorithm, 'phmm')
+            self.assertTrue(isinstance(params[0], np.memmap))
+            np.testing.assert_array_equal(params[0], em)
+            np.testing.assert_array_equal(params[3], trans)
+            self.assertEqual(params[4], ['a', 'b'])
+            del params
+
+    def test_load_model_pickle(self):
+        data = {'algorithm': 'pmi', 'pmi': {('a', 'b'): 0.5}}
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'model')
+            with open(path, 'wb') as f:
+                pickle.dump(data, f, protocol=3)
+
+            with self.assertRaises(ModelError) as cm:
+                load_model(path)
+
+            self.assertTrue(str(cm.exception).startswith('Could not read model'))
+            self.assertIn('--allow-pickle', str(cm.exception))
+
+            self.assertEqual(load_model(path, allow_pickle=True), ('pmi', data['pmi']))
+
+    def test_remap_params(self):
+        em = np.array([[0.4, 0.1], [0.2, 0.3]])
+        gx = np.array([0.6, 0.4])
+        gy = np.array([0.1, 0.9])
+
+        new_em, new_gx, new_gy = remap_params(em, gx, gy, ['a', 'b'], ['b', 'c', 'a'])
+
+        np.testing.assert_array_equal(new_em, np.array([
+            [0.3, 0.1, 0.2], [0.1, 0.1, 0.1], [0.1, 0.1, 0.4]]))
+        np.testing.assert_array_equal(new_gx, np.array([0.4, 0.4, 0.6]))
+        np.testing.assert_array_equal(new_gy, np.array([0.9, 0.1, 0.1]))
+
+    def test_get_scorer_phmm_uses_model_alphabet(self):
+        em = np.array([[0.3, 0.05, 0.05], [0.05, 0.2, 0.05], [0.05, 0.05, 0.2]])
+        gx = np.array([0.5, 0.3, 0.2])
+        trans = np.array([0.3, 0.3, 0.3, 0.1, 0.1])
+        params = [em, gx, gx, trans, ['a', 'b', 'c']]
+
+        words = [Word('L1', 'c', 'bc'), Word('L2', 'c', 'cb')]
+        dataset = WordsDataset(words)
+        expected = get_scorer('phmm', [em[1:, 1:], gx[1:], gx[1:], trans], dataset)
+
+        self.assertEqual(get_scorer('phmm', params, dataset)('bc', 'cb'),
+                expected('bc', 'cb'))
+
+
+
+class CheckpointTestCase(TestCase):
+
+    def interrupt_at(self, num_batches, path, algorithm):
+        """
+        Return a checkpoint callable that saves the training state at the
+        given batch and then interrupts the training.
+        """
+        def checkpoint(get_state):
+            checkpoint.count += 1
+            if checkpoint.count == num_batches:
+                save_checkpoint(path, algorithm, get_state())
+                raise Interrupt
+
+        checkpoint.count = 0
+        return checkpoint
+
+    def test_load_checkpoint_with_bad_path(self):
+        with self.assertRaises(ModelError) as cm:
+            load_checkpoint('')
+
+        self.assertTrue(str(cm.exception).startswith('Could not open checkpoint'))
+
+    def test_load_checkpoint_with_bad_file(self):
+        with self.assertRaises(ModelError) as cm:
+            load_checkpoint(os.path.abspath(__file__))
+
+        self.assertTrue(str(cm.exception).startswith('Could not read checkpoint'))
+
+    def test_resume_pmi(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            dataset = get_small_pairs_dataset(temp_dir)
+            path = os.path.join(temp_dir, 'checkpoint')
+
+            random.seed(42)
+            expected = train_pmi(dataset, batch_size=16, max_iter=3)
+
+            random.seed(42)
+            with self.assertRaises(Interrupt):
+                train_pmi(dataset, batch_size=16, max_iter=3,
+                        checkpoint=self.interrupt_at(15, path, 'pmi'))
+
+            algorithm, state, _ = load_checkpoint(path)
+            self.assertEqual(algorithm, 'pmi')
+            self.assertEqual(state['num_updates'], 15)
+
+            random.seed(0)
+            self.assertEqual(train_pmi(dataset, batch_size=16, max_iter=3, state=state), expected)
+
+    def test_resume_phmm(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            dataset = get_small_pairs_dataset(temp_dir, 100)
+            path = os.path.join(temp_dir, 'checkpoint')
+
+            np.random.seed(42)
+            expected = train_phmm(dataset, batch_size=32)
+
+            np.random.seed(42)
+            with self.assertRaises(Interrupt):
+                train_phmm(dataset, batch_size=32,
+                        checkpoint=self.interrupt_at(6, path, 'phmm'))
+
+            algorithm, state, _ = load_checkpoint(path)
+            self.assertEqual(algorithm, 'phmm')
+            self.assertEqual(state['alphabet'], dataset.get_alphabet())
+
+            np.random.seed(0)
+            for result, param in zip(train_phmm(dataset, batch_size=32, state=state), expected):
+                np.testing.assert_array_equal(result, param)
+
+    def test_warm_start_pmi(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            dataset = get_small_pairs_dataset(temp_dir)
+            pmi, state = train_pmi(dataset, batch_size=16, max_iter=1, return_state=True)
+
+            num_batches = -(-len(dataset.get_asjp_pairs(0.5)) // 16)
+            self.assertEqual(state, {'pmi': dict(pmi), 'num_updates': num_batches})
+
+            pmi, state = train_pmi(dataset, batch_size=16, max_iter=1,
+                    state=state, return_state=True)
+            self.assertEqual(state['num_updates'], 2 * num_batches)
+
+    def test_checkpointer(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'checkpoint')
+            checkpointer = Checkpointer(path, 'pmi', every=3, hyperparams={'alpha': 0.75})
+
+            for num_updates in range(1, 6):
+                checkpointer(lambda: {'pmi': {('a', 'b'): 0.5}, 'num_updates': num_updates})
+
+            algorithm, state, hyperparams = load_checkpoint(path)
+
+        self.assertEqual(state, {'pmi': {('a', 'b'): 0.5}, 'num_updates': 3})
+        self.assertEqual(hyperparams, {'alpha': 0.75})
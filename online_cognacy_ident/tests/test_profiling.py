@@ -0,0 +1,116 @@
+import json
+import os.path
+import pstats
+import tempfile
+import time
+
+from unittest import TestCase, skipUnless
+
+from online_cognacy_ident.dataset import Dataset
+from online_cognacy_ident.profiling import (
+        CAN_TRACE_MEMORY, Profiler, profiled, record, stage)
+from online_cognacy_ident.tests.test_model import get_small_pairs_dataset
+from online_cognacy_ident.pmi import train_pmi
+
+
+
+@profiled('outer')
+def outer():
+    time.sleep(0.01)
+    inner()
+    return 42
+
+
+@profiled('inner')
+def inner():
+    time.sleep(0.02)
+
+
+
+class ProfilingTestCase(TestCase):
+
+    def test_inactive(self):
+        self.assertEqual(outer(), 42)
+
+        with stage('stage'):
+            record('series', 1.0)
+
+    def test_stages(self):
+        profiler = Profiler()
+        profiler.start()
+
+        outer()
+        outer()
+
+        with stage('outer'):
+            outer()
+
+        profiler.stop()
+
+        self.assertEqual(list(profiler.stages.keys()), ['outer', 'inner'])
+        self.assertEqual(profiler.stages['outer']['calls'], 4)
+        self.assertEqual(profiler.stages['inner']['calls'], 3)
+
+        outer_sec = profiler.stages['outer']['sec']
+        inner_sec = profiler.stages['inner']['sec']
+        self.assertGreater(inner_sec, 0.06)
+        self.assertLess(outer_sec, profiler.total_sec)
+        self.assertAlmostEqual(profiler.stages['outer']['self_sec'],
+                outer_sec - inner_sec, places=3)
+        self.assertIsNone(profiler.stages['outer']['peak_mb'])
+
+        json.dumps(profiler.get_report())
+        self.assertTrue(profiler.format_table().startswith('stage'))
+
+    @skipUnless(CAN_TRACE_MEMORY, 'needs tracemalloc.reset_peak')
+    def test_memory(self):
+        profiler = Profiler(trace_memory=True)
+        profiler.start()
+
+        with stage('outer'):
+            with stage('inner'):
+                data = bytearray(4 * 2**20)
+                del data
+            data = bytearray(2 * 2**20)
+            del data
+
+        profiler.stop()
+
+        self.assertGreaterEqual(profiler.stages['inner']['peak_mb'], 4)
+        self.assertLess(profiler.stages['inner']['peak_mb'], 5)
+        self.assertGreaterEqual(profiler.stages['outer']['peak_mb'], 4)
+
+    @skipUnless(not CAN_TRACE_MEMORY, 'needs a Python without tracemalloc.reset_peak')
+    def test_memory_unsupported(self):
+        with self.assertRaises(ValueError):
+            Profiler(trace_memory=True)
+
+    def test_training_series(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            dataset = get_small_pairs_dataset(temp_dir)
+
+            profiler = Profiler(cprofile_path=os.path.join(temp_dir, 'out.prof'))
+            profiler.start()
+            train_pmi(dataset, batch_size=50, max_iter=3)
+            profiler.stop()
+
+            pstats.Stats(profiler.cprofile_path)
+
+        report = profiler.get_report()
+
+        self.assertEqual(report['stages']['training']['calls'], 1)
+        self.assertEqual(report['series']['epoch']['count'], 3)
+        self.assertEqual(len(report['series']['epoch']['values']), 3)
+        self.assertGreaterEqual(report['series']['batch']['count'], 4)
+        self.assertLessEqual(report['series']['batch']['total_sec'],
+                report['series']['epoch']['total_sec'])
+
+    def test_dataset_stages(self):
+        profiler = Profiler()
+        profiler.start()
+        Dataset('datasets/japanese.tsv', is_ipa=True).get_concepts()
+        profiler.stop()
+
+        self.assertEqual(list(profiler.stages.keys()), ['read', 'ipa'])
+        self.assertEqual(profiler.stages['read']['calls'], 1)
+        self.assertGreater(profiler.stages['ipa']['calls'], 1000)
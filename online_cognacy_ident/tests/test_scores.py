@@ -0,0 +1,212 @@
+import itertools
+import os.path
+import tempfile
+
+from unittest import TestCase
+
+import numpy as np
+
+from online_cognacy_ident.dataset import Word, WordsDataset
+from online_cognacy_ident.scores import (
+        Scores, ScoresError, condensed_index, get_condensed,
+        update_scores, save_scores, load_scores, load_scores_header,
+        get_dataset_hash, get_file_hash, score_concept, score_dataset)
+
+
+
+class CountingScorer:
+
+    def __init__(self, symmetric):
+        self.symmetric = symmetric
+        self.calls = []
+
+    def __call__(self, asjp1, asjp2):
+        self.calls.append((asjp1, asjp2))
+        return len(asjp1) / 10 + (0 if asjp1 == asjp2 else 0.5) \
+                + (0 if self.symmetric or asjp1 < asjp2 else 0.01)
+
+
+
+class ScoresTestCase(TestCase):
+
+    def setUp(self):
+        self.words = [Word(lang, 'hand', asjp) for lang, asjp in [
+            ('d', 'mano'), ('a', 'manu'), ('c', 'ruka'), ('b', 'hant')]]
+        self.dataset = WordsDataset(self.words + [Word('a', 'one', 'uno')])
+
+        self.dict = {}
+        for index, (word1, word2) in enumerate(itertools.combinations(self.words, 2)):
+            key = (word1, word2) if word1 < word2 else (word2, word1)
+            self.dict[key] = index / 10
+
+    def test_condensed_index(self):
+        pairs = list(itertools.combinations(range(5), 2))
+
+        for position, (i, j) in enumerate(pairs):
+            self.assertEqual(condensed_index(i, j, 5), position)
+
+    def test_from_dict(self):
+        scores = Scores.from_dict(self.dataset, self.dict)
+
+        self.assertEqual(scores.get_concepts(), ['hand', 'one'])
+        self.assertEqual(len(scores), 6)
+        self.assertEqual(dict(scores), self.dict)
+
+        words, condensed = scores.get_condensed('hand')
+        self.assertEqual(words, self.words)
+        np.testing.assert_array_equal(condensed, np.arange(6) / 10)
+
+    def test_getitem(self):
+        scores = Scores.from_dict(self.dataset, self.dict)
+
+        self.assertEqual(scores[(self.words[0], self.words[2])], 0.1)
+        self.assertEqual(scores[(self.words[2], self.words[0])], 0.1)
+
+        for key in [(self.words[0], self.words[0]), (self.words[0], Word('x', 'hand', 'x'))]:
+            with self.assertRaises(KeyError):
+                scores[key]
+
+        self.assertNotIn((Word('a', 'one', 'uno'), self.words[0]), scores)
+
+    def test_get_index(self):
+        scores = Scores.from_dict(self.dataset, self.dict)
+
+        self.assertEqual(scores.get_index('hand'),
+                {word: i for i, word in enumerate(self.words)})
+
+        with self.assertRaises(KeyError):
+            scores.get_index('foot')
+
+    def test_add_with_wrong_size(self):
+        with self.assertRaises(ValueError):
+            Scores().add('hand', self.words, [0.1, 0.2])
+
+    def test_get_condensed(self):
+        scores = Scores.from_dict(self.dataset, self.dict)
+        reordered = list(reversed(self.words))
+
+        self.assertIs(get_condensed(scores, 'hand', self.words), scores.arrays['hand'])
+        np.testing.assert_array_equal(
+                get_condensed(scores, 'hand', reordered),
+                get_condensed(self.dict, 'hand', reordered))
+
+    def test_update_scores(self):
+        prev_scores = Scores.from_dict(WordsDataset(self.words[:3]), self.dict)
+
+        scored = []
+        def scorer(asjp1, asjp2):
+            scored.append((asjp1, asjp2))
+            return 1.0
+
+        scores = update_scores(prev_scores, self.dataset, scorer)
+
+        self.assertEqual(scored, [('mano', 'hant'), ('manu', 'hant'), ('ruka', 'hant')])
+        expected = dict(self.dict)
+        for key in self.dict:
+            if self.words[3] in key:
+                expected[key] = 1.0
+
+        self.assertEqual(dict(scores), expected)
+        self.assertEqual(scores.num_scored, 3)
+
+    def test_update_scores_dedup(self):
+        prev_scores = Scores.from_dict(WordsDataset(self.words[:3]), self.dict)
+        new_words = [Word('e', 'hand', 'hant'), Word('f', 'hand', 'mano')]
+        dataset = WordsDataset(self.words + new_words)
+
+        scorer = CountingScorer(symmetric=True)
+        scores = update_scores(prev_scores, dataset, scorer)
+
+        self.assertEqual(len(scorer.calls), len(set(scorer.calls)))
+        self.assertEqual(scores.num_scored, len(scorer.calls))
+        self.assertLess(scores.num_scored, len(scores) - len(prev_scores))
+
+        full = score_dataset(dataset, CountingScorer(symmetric=True))
+        for key in scores:
+            if key in prev_scores:
+                self.assertEqual(scores[key], prev_scores[key])
+            else:
+                self.assertEqual(scores[key], full[key])
+
+    def test_save_and_load_scores(self):
+        scores = Scores.from_dict(self.dataset, self.dict)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'scores')
+            save_scores(path, scores)
+            loaded = load_scores(path)
+
+        self.assertEqual(loaded.get_concepts(), scores.get_concepts())
+        self.assertEqual(loaded.words, scores.words)
+        self.assertEqual(dict(loaded), dict(scores))
+
+    def test_load_scores_with_bad_file(self):
+        with self.assertRaises(ScoresError) as cm:
+            load_scores('')
+
+        self.assertTrue(str(cm.exception).startswith('Could not open scores'))
+
+        with self.assertRaises(ScoresError) as cm:
+            load_scores(os.path.abspath(__file__))
+
+        self.assertTrue(str(cm.exception).startswith('Could not read scores'))
+
+    def test_load_scores_header(self):
+        scores = Scores.from_dict(self.dataset, self.dict)
+        meta = {'model_hash': get_file_hash(os.path.abspath(__file__)),
+                'dataset_hash': get_dataset_hash(self.dataset)}
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'scores')
+            save_scores(path, scores, meta)
+            header = load_scores_header(path)
+
+            save_scores(path, scores)
+            self.assertEqual(load_scores_header(path)['meta'], {})
+
+        self.assertEqual(header['meta'], meta)
+        self.assertEqual([concept for concept, _ in header['concepts']], ['hand', 'one'])
+
+        with self.assertRaises(ScoresError):
+            load_scores_header(os.path.abspath(__file__))
+
+    def test_get_dataset_hash(self):
+        dataset_hash = get_dataset_hash(self.dataset)
+
+        self.assertEqual(len(dataset_hash), 64)
+        self.assertEqual(get_dataset_hash(WordsDataset(self.words + [
+            Word('a', 'one', 'uno')])), dataset_hash)
+        self.assertNotEqual(get_dataset_hash(WordsDataset(self.words + [
+            Word('a', 'one', 'unu')])), dataset_hash)
+
+        with self.assertRaises(ScoresError):
+            get_file_hash('')
+
+    def test_score_concept(self):
+        words = [Word(lang, 'hand', asjp) for lang, asjp in [
+            ('a', 'mano'), ('b', 'manu'), ('c', 'mano'), ('d', 'manu'), ('e', 'mano')]]
+
+        for symmetric in [True, False]:
+            scorer = CountingScorer(symmetric)
+            expected = [scorer(word1.asjp, word2.asjp)
+                    for word1, word2 in itertools.combinations(words, 2)]
+
+            scorer = CountingScorer(symmetric)
+            condensed, num_scored = score_concept(words, scorer)
+
+            self.assertEqual(list(condensed), expected)
+            self.assertEqual(num_scored, len(scorer.calls))
+            self.assertEqual(len(set(scorer.calls)), len(scorer.calls))
+            self.assertEqual(num_scored, 3 if symmetric else 4)
+
+        condensed, num_scored = score_concept(words[:1], CountingScorer(True))
+        self.assertEqual((len(condensed), num_scored), (0, 0))
+
+    def test_score_dataset(self):
+        scores = score_dataset(self.dataset, CountingScorer(False))
+
+        self.assertEqual(scores.get_concepts(), ['hand', 'one'])
+        self.assertEqual(scores.num_scored, 6)
+        self.assertEqual(len(scores), 6)
+        self.assertEqual(scores[(self.words[0], self.words[1])], 0.9)
+        self.assertEqual(scores[(self.words[0], self.words[3])], 0.91)
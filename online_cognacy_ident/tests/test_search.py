@@ -0,0 +1,133 @@
+import random
+import tempfile
+
+from unittest import TestCase
+
+import numpy as np
+
+from online_cognacy_ident.dataset import Dataset
+from online_cognacy_ident.phmm import train_phmm
+from online_cognacy_ident.pmi import PMIScorer, train_pmi
+from online_cognacy_ident.search import QueryError, WordIndex
+from online_cognacy_ident.tests.test_model import get_small_pairs_dataset
+
+
+
+class SearchTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            training = get_small_pairs_dataset(temp_dir)
+
+            random.seed(42)
+            cls.pmi = train_pmi(training, batch_size=50, max_iter=3)
+
+            np.random.seed(42)
+            cls.phmm = list(train_phmm(training, batch_size=64)) + [training.get_alphabet()]
+
+        cls.dataset = Dataset('datasets/kadai.tsv')
+
+    def setUp(self):
+        self.index = WordIndex(self.dataset, 'pmi', self.pmi)
+
+    def test_index(self):
+        words = self.dataset.get_words()
+
+        self.assertEqual(len(self.index.forms), len(set([word.asjp for word in words])))
+        self.assertEqual(sum([len(words) for words in self.index.words]), len(words))
+        self.assertEqual(set(self.index.concept_positions.keys()),
+                set(self.dataset.get_concepts().keys()))
+
+    def test_get_candidates(self):
+        asjp = self.index.forms[0]
+
+        candidates = self.index.get_candidates(asjp, 10)
+        self.assertEqual(len(candidates), 10)
+        self.assertEqual(candidates[0], 0)
+
+        everything = self.index.get_candidates(asjp, None)
+        self.assertEqual(sorted(everything), list(range(len(self.index.forms))))
+        self.assertEqual(everything[:10], candidates)
+
+        concept = self.index.words[0][0].concept
+        self.assertEqual(sorted(self.index.get_candidates(asjp, None, concept)),
+                self.index.concept_positions[concept].tolist())
+
+    def test_query(self):
+        word = self.dataset.get_words()[0]
+        results = self.index.query(word.asjp, k=5)
+
+        self.assertEqual(len(results), 5)
+        self.assertIn(word, [result_word for result_word, _ in results])
+
+        distances = [distance for _, distance in results]
+        self.assertEqual(distances, sorted(distances))
+
+        scorer = PMIScorer(self.pmi)
+        for result_word, distance in results:
+            self.assertEqual(distance, scorer(word.asjp, result_word.asjp))
+
+        exhaustive = self.index.query(word.asjp, k=5, num_candidates=None)
+        self.assertLessEqual(exhaustive[-1][1], results[-1][1])
+
+    def test_query_concept(self):
+        word = self.dataset.get_words()[0]
+        results = self.index.query(word.asjp, k=1000, concept=word.concept)
+
+        self.assertEqual(sorted([result_word for result_word, _ in results]),
+                sorted(self.dataset.get_concepts()[word.concept]))
+
+    def test_query_phmm(self):
+        index = WordIndex(self.dataset, 'phmm', self.phmm)
+        word = self.dataset.get_words()[0]
+
+        results = index.query(word.asjp, k=3)
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0][0].asjp, word.asjp)
+
+        distances = [distance for _, distance in results]
+        self.assertEqual(distances, sorted(distances))
+        self.assertTrue(all([0 <= distance < 0.5 for distance in distances]))
+
+        exhaustive = index.query(word.asjp, k=1, num_candidates=None)
+        self.assertEqual(exhaustive[0][0].asjp, word.asjp)
+
+        with self.assertRaises(QueryError):
+            index.query('!!')
+
+    def test_cross_concept_pairs(self):
+        candidates = self.index.get_cross_concept_candidates()
+        self.assertTrue(all([i <= j for i, j in candidates]))
+
+        pairs = self.index.find_cross_concept_pairs(candidates, threshold=0.3)
+        self.assertTrue(len(pairs) > 0)
+
+        scorer = PMIScorer(self.pmi)
+        for word1, word2, distance in pairs:
+            self.assertNotEqual(word1.concept, word2.concept)
+            self.assertLessEqual(distance, 0.3)
+            self.assertEqual(distance, scorer(word1.asjp, word2.asjp))
+
+        distances = [distance for _, _, distance in pairs]
+        self.assertEqual(distances, sorted(distances))
+
+        shared = [i for i, words in enumerate(self.index.words)
+                if len(set([word.concept for word in words])) > 1]
+        self.assertTrue(all([(i, i) in candidates for i in shared]))
+
+    def test_cross_concept_pairs_phmm(self):
+        index = WordIndex(self.dataset, 'phmm', self.phmm)
+
+        shared = [i for i, words in enumerate(index.words)
+                if len(set([word.concept for word in words])) > 1]
+        self.assertTrue(len(shared) > 0)
+
+        i = shared[0]
+        threshold = index.get_distance(index.forms[i], index.forms[i])
+        self.assertLess(threshold, 0.5)
+
+        pairs = index.find_cross_concept_pairs(index.get_cross_concept_candidates(), threshold)
+        self.assertIn(index.forms[i], [word1.asjp for word1, word2, _ in pairs
+                if word1.asjp == word2.asjp])
+        self.assertTrue(all([distance <= threshold for _, _, distance in pairs]))
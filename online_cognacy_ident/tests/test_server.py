@@ -0,0 +1,138 @@
+import os.path
+import tempfile
+import threading
+
+from unittest import TestCase
+
+from online_cognacy_ident.dataset import Dataset
+from online_cognacy_ident.pmi import PMIScorer
+from online_cognacy_ident.server import (
+        Client, RequestError, ScoringService, TCPServer, UnixServer)
+
+
+
+class ServerTestCase(TestCase):
+
+    def setUp(self):
+        self.service = ScoringService({'pmi': ('pmi', {})}, method='upgma')
+        self.server = TCPServer(('127.0.0.1', 0), self.service)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+        self.client = Client(port=self.server.server_address[1])
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def test_models(self):
+        self.assertEqual(self.client.models(), {'pmi': 'pmi'})
+
+    def test_distances(self):
+        pairs = [['mano', 'manu'], ['mano', 'pes']]
+        scorer = PMIScorer({})
+
+        self.assertEqual(self.client.distances('pmi', pairs),
+                [scorer('mano', 'manu'), scorer('mano', 'pes')])
+
+        response = self.client.request('POST', '/distances', {'model': 'pmi', 'pairs': pairs})
+        self.assertIs(response['similarity'], False)
+
+    def test_cluster(self):
+        dataset = Dataset('datasets/kamasau.tsv')
+        words = dataset.get_concepts()['drink']
+
+        clusters = self.client.cluster('pmi', [
+            [word.doculect, word.concept, word.asjp] for word in words])
+
+        self.assertEqual(list(clusters.keys()), ['drink'])
+        self.assertEqual(sorted([item for cog_set in clusters['drink'] for item in cog_set]),
+                sorted([[word.doculect, word.asjp] for word in words]))
+
+    def test_cluster_keeps_first_synonym(self):
+        clusters = self.client.cluster(None, [
+            ['a', 'hand', 'mano'], ['a', 'hand', 'ruka'], ['b', 'hand', 'manu']],
+            threshold=0.5)
+
+        self.assertEqual(clusters, {'hand': [[['a', 'mano'], ['b', 'manu']]]})
+
+    def test_errors(self):
+        with self.assertRaises(RequestError) as cm:
+            self.client.distances('phmm', [['mano', 'manu']])
+        self.assertEqual(str(cm.exception), 'Unknown model: phmm')
+
+        with self.assertRaises(RequestError):
+            self.client.distances('pmi', [['mano']])
+
+        with self.assertRaises(RequestError):
+            self.client.distances('pmi', [['mano', 42]])
+
+        with self.assertRaises(RequestError):
+            self.client.cluster('pmi', [['a', 'hand']])
+
+        with self.assertRaises(RequestError):
+            self.client.cluster('pmi', [['a', 'hand', None]])
+
+        with self.assertRaises(RequestError):
+            self.client.request('GET', '/nowhere')
+
+        metrics = self.client.metrics()['endpoints']
+        self.assertEqual(metrics['/distances']['errors'], 3)
+        self.assertEqual(metrics['/cluster']['errors'], 2)
+
+    def test_unsupported_methods(self):
+        words = [['a', 'hand', 'mano'], ['b', 'hand', 'manu'],
+                ['c', 'hand', 'ruka'], ['d', 'hand', 'pes']]
+
+        for method in ['spinglass', 'ebet', 'nowhere']:
+            with self.assertRaises(RequestError):
+                self.client.cluster('pmi', words, method=method)
+
+        self.assertEqual(self.client.models(), {'pmi': 'pmi'})
+        self.assertEqual(len(self.client.cluster('pmi', words, method='infomap')), 1)
+
+    def test_metrics(self):
+        for _ in range(3):
+            self.client.distances('pmi', [['mano', 'manu']])
+
+        metrics = self.client.metrics()
+        self.assertTrue(metrics['uptime_sec'] > 0)
+
+        endpoint = metrics['endpoints']['/distances']
+        self.assertEqual(endpoint['requests'], 3)
+        self.assertEqual(endpoint['errors'], 0)
+        self.assertEqual(endpoint['items'], 3)
+        self.assertTrue(0 < endpoint['latency_ms']['p50'] <= endpoint['latency_ms']['max'])
+
+
+
+class UnixServerTestCase(TestCase):
+
+    def test_unix_socket(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'socket')
+
+            server = UnixServer(path, ScoringService({'pmi': ('pmi', {})}))
+            thread = threading.Thread(target=server.serve_forever)
+            thread.start()
+
+            try:
+                client = Client(socket_path=path)
+                self.assertEqual(client.models(), {'pmi': 'pmi'})
+                self.assertEqual(len(client.distances('pmi', [['mano', 'manu']])), 1)
+            finally:
+                server.shutdown()
+                server.server_close()
+                thread.join()
+
+    def test_keeps_other_files(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'model.npz')
+            with open(path, 'w') as f:
+                f.write('not a socket')
+
+            with self.assertRaises(FileExistsError):
+                UnixServer(path, ScoringService({'pmi': ('pmi', {})}))
+
+            self.assertTrue(os.path.exists(path))
@@ -0,0 +1,80 @@
+import random
+import tempfile
+
+from unittest import TestCase
+
+import numpy as np
+
+from online_cognacy_ident.batch import read_dataset
+from online_cognacy_ident.phmm import train_phmm
+from online_cognacy_ident.pmi import train_pmi
+from online_cognacy_ident.tests.test_model import get_small_pairs_dataset
+from online_cognacy_ident.tune import (
+        TUNE_COLUMNS, get_configs, get_model, train_config, tune)
+
+
+
+class TuneTestCase(TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.dataset = get_small_pairs_dataset(self.temp_dir.name)
+        self.eval_datasets = [read_dataset('datasets/kadai.tsv', cog_sets=True)]
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_get_configs(self):
+        configs = get_configs([0.5, 0.75], [64], [0.4, 0.5])
+
+        self.assertEqual(len(configs), 4)
+        self.assertEqual(configs[1], {'alpha': 0.5, 'batch_size': 64, 'initial_cutoff': 0.5})
+
+    def test_train_config_pmi(self):
+        config = {'alpha': 0.75, 'batch_size': 16, 'initial_cutoff': 0.5}
+
+        state, finished = train_config(self.dataset, 'pmi', config, max_updates=5)
+        self.assertFalse(finished)
+        self.assertEqual(state['num_updates'], 5)
+
+        random.seed(0)  # the state's rng is restored
+        state, finished = train_config(self.dataset, 'pmi', config, state)
+        self.assertTrue(finished)
+
+        random.seed(42)
+        pmi = train_pmi(self.dataset, alpha=0.75, batch_size=16)
+        self.assertEqual(dict(get_model('pmi', state)), dict(pmi))
+
+    def test_train_config_phmm(self):
+        config = {'alpha': 0.75, 'batch_size': 32, 'initial_cutoff': 0.5}
+
+        state, finished = train_config(self.dataset, 'phmm', config, max_updates=3)
+        self.assertFalse(finished)
+
+        state, finished = train_config(self.dataset, 'phmm', config, state)
+        self.assertTrue(finished)
+
+        np.random.seed(42)
+        params = train_phmm(self.dataset, alpha=0.75, batch_size=32)
+        for expected, actual in zip(params, get_model('phmm', state)):
+            self.assertTrue(np.array_equal(expected, actual))
+
+    def test_tune(self):
+        configs = get_configs([0.6, 0.9], [16, 64], [0.5])
+        results = tune('pmi', self.dataset, self.eval_datasets, configs)
+
+        self.assertEqual(len(results), 4)
+        self.assertTrue(all([result['status'] == 'done' for result in results]))
+        self.assertTrue(all([set(TUNE_COLUMNS) < set(result.keys()) for result in results]))
+
+        stopped = tune('pmi', self.dataset, self.eval_datasets, configs,
+                num_workers=2, eta=2, min_epochs=0.5)
+
+        done = [index for index, result in enumerate(stopped) if result['status'] == 'done']
+        self.assertEqual(len(done), 1)
+        self.assertEqual(stopped[done[0]]['f_score'], results[done[0]]['f_score'])
+        self.assertEqual(get_model('pmi', stopped[done[0]]['state']),
+                get_model('pmi', results[done[0]]['state']))
+
+        with self.assertRaises(ValueError):
+            tune('pmi', self.dataset, self.eval_datasets, configs, eta=2, min_epochs=0)
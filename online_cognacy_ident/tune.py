@@ -0,0 +1,250 @@
+import collections
+import itertools
+import math
+import multiprocessing
+import random
+import time
+
+import numpy as np
+
+from online_cognacy_ident.clustering import cluster
+from online_cognacy_ident.dataset import DatasetError
+from online_cognacy_ident.evaluation import calc_f_score
+from online_cognacy_ident.phmm import apply_phmm, train_phmm
+from online_cognacy_ident.pmi import apply_pmi, train_pmi
+
+
+
+"""
+The keys of the result dicts returned by the tune func, i.e. the columns of
+the tuning results table. Epochs is the number of word pairs trained on
+divided by the number of training pairs; status is either done or stopped.
+"""
+TUNE_COLUMNS = ['alpha', 'batch_size', 'initial_cutoff', 'epochs',
+        'status', 'f_score', 'train_sec']
+
+
+
+def get_configs(alphas, batch_sizes, initial_cutoffs):
+    """
+    Return the [] of {alpha, batch_size, initial_cutoff} dicts comprising the
+    grid of the given hyperparameter values.
+    """
+    return [{'alpha': alpha, 'batch_size': batch_size, 'initial_cutoff': cutoff}
+            for alpha, batch_size, cutoff in itertools.product(
+                alphas, batch_sizes, initial_cutoffs)]
+
+
+
+def get_model(algorithm, state):
+    """
+    Return the model params, as expected by save_model and get_scorer, of a
+    training state as returned by train_pmi or train_phmm.
+    """
+    if algorithm == 'phmm':
+        return [state['em'], state['gx'], state['gy'], state['trans'], state['alphabet']]
+
+    return collections.defaultdict(float, state['pmi'])
+
+
+
+def evaluate_model(algorithm, params, datasets, threshold=0.5, method='infomap'):
+    """
+    Apply a model on the given datasets, cluster the output and return the
+    mean of the datasets' F-scores. The datasets should provide get_clusters.
+    """
+    f_scores = []
+
+    for dataset in datasets:
+        if algorithm == 'phmm':
+            scores = apply_phmm(dataset, *params)
+        else:
+            scores = apply_pmi(dataset, params)
+
+        clusters = cluster(dataset, scores, threshold=threshold, method=method)
+        f_scores.append(calc_f_score(dataset.get_clusters(), clusters))
+
+    return float(np.mean(f_scores))
+
+
+
+class _Pause(Exception):
+    """
+    Raised by the checkpoint callable of train_config in order to stop the
+    training once the batch budget is used up.
+    """
+
+    def __init__(self, state):
+        super().__init__()
+        self.state = state
+
+
+
+def train_config(dataset, algorithm, config, state=None, max_updates=None,
+        random_seed=42):
+    """
+    Train a model with the {alpha, batch_size, initial_cutoff} config on the
+    dataset, starting from the given training state, if any, or else seeding
+    both the random module and NumPy's with random_seed. If max_updates is
+    set, stop the training once this many batches in total have been trained
+    on. Return a (state, finished) tuple; the training can be continued from
+    the state if finished is False, and gives the same results as if it had
+    not been stopped.
+    """
+    if state is None:
+        random.seed(random_seed)
+        np.random.seed(random_seed)
+
+    num_updates = state['num_updates'] if state is not None else 0
+
+    def checkpoint(get_state):
+        nonlocal num_updates
+        num_updates += 1
+        if max_updates is not None and num_updates >= max_updates:
+            raise _Pause(get_state())
+
+    train_func = train_phmm if algorithm == 'phmm' else train_pmi
+
+    try:
+        *_, state = train_func(dataset, initial_cutoff=config['initial_cutoff'],
+                alpha=config['alpha'], batch_size=config['batch_size'],
+                state=state, checkpoint=checkpoint, return_state=True)
+    except _Pause as pause:
+        return pause.state, False
+
+    return state, True
+
+
+
+_shared = None  # the {training, datasets} dict of the tuning worker processes
+
+
+
+def _init_worker(shared):
+    """
+    Store the training data and the evaluation datasets in the (worker)
+    process, so that these are only read and encoded once rather than once
+    per config.
+
+    Helper for the tune func.
+    """
+    global _shared
+    _shared = shared
+
+
+
+def _tune_task(task):
+    """
+    Continue training a config from a (algorithm, config, state, max_updates,
+    random_seed, threshold, method) task with the data stored by _init_worker
+    and evaluate the resulting model. Return a (state, finished, F-score,
+    training time, error message) tuple; the last one is None unless there is
+    an error, in which case the others are.
+
+    Helper for the tune func.
+    """
+    algorithm, config, state, max_updates, random_seed, threshold, method = task
+
+    start_time = time.perf_counter()
+
+    try:
+        state, finished = train_config(_shared['training'], algorithm, config,
+                state, max_updates, random_seed)
+    except (DatasetError, ValueError) as err:
+        return None, None, None, None, str(err)
+
+    train_time = time.perf_counter() - start_time
+
+    f_score = evaluate_model(algorithm, get_model(algorithm, state),
+            _shared['datasets'], threshold, method)
+
+    return state, finished, f_score, train_time, None
+
+
+
+def tune(algorithm, dataset, eval_datasets, configs, num_workers=1, eta=None,
+        min_epochs=1.0, random_seed=42, threshold=0.5, method='infomap'):
+    """
+    Train a model for each of the configs returned by get_configs on the
+    dataset and evaluate it on the eval datasets, in that many worker
+    processes. Return the [] of result dicts, with the keys of TUNE_COLUMNS
+    and the config's final training state as state, in the order of configs.
+
+    The dataset should be a PairsDataset. It is read and, for phmm, encoded
+    once and shared with the workers, as are the eval datasets; these should
+    provide get_clusters, e.g. as returned by batch.read_dataset.
+
+    If eta is set, successive halving is used to stop the configs that are
+    clearly worse than the others early: all configs are trained on min_epochs
+    worth of word pairs and evaluated, the best 1/eta of them are trained on
+    eta times as many pairs, and so on until one is left, which is trained
+    until convergence. The training of the configs that are carried on is
+    continued rather than restarted, so that their models are the same as if
+    they had been trained without stopping. Each round trains for at least
+    one batch. Raise a ValueError if min_epochs is not positive.
+    """
+    if min_epochs <= 0:
+        raise ValueError('min_epochs should be greater than 0')
+
+    dataset.preload(encode=algorithm == 'phmm')
+
+    num_pairs = {cutoff: len(dataset.get_asjp_pairs(cutoff))
+            for cutoff in set([config['initial_cutoff'] for config in configs])}
+
+    results = [dict(config, epochs=0.0, status='stopped', f_score=None,
+                train_sec=0.0, state=None) for config in configs]
+
+    shared = {'training': dataset, 'datasets': list(eval_datasets)}
+
+    if num_workers > 1 and len(configs) > 1:
+        pool = multiprocessing.Pool(min(num_workers, len(configs)), _init_worker, (shared,))
+        map_func = lambda tasks: pool.map(_tune_task, tasks, chunksize=1)
+    else:
+        pool = None
+        _init_worker(shared)
+        map_func = lambda tasks: [_tune_task(task) for task in tasks]
+
+    active = list(range(len(configs)))
+    epochs = min_epochs
+
+    try:
+        while active:
+            final = eta is None or len(active) <= 1
+
+            tasks = []
+            for index in active:
+                config = configs[index]
+                if final:
+                    max_updates = None
+                else:
+                    max_updates = max(1, math.ceil(epochs *
+                            num_pairs[config['initial_cutoff']] / config['batch_size']))
+
+                tasks.append((algorithm, config, results[index]['state'],
+                        max_updates, random_seed, threshold, method))
+
+            for index, (state, finished, f_score, train_time, error) in \
+                    zip(active, map_func(tasks)):
+                if error is not None:
+                    raise DatasetError(error)
+
+                result = results[index]
+                result.update(state=state, f_score=f_score, status='done' if finished else 'stopped')
+                result['train_sec'] += train_time
+                result['epochs'] = (state['num_updates'] * result['batch_size']
+                        / max(num_pairs[result['initial_cutoff']], 1))
+
+            if final:
+                break
+
+            ranked = sorted(active, key=lambda index: -results[index]['f_score'])
+            active = [index for index in ranked[:math.ceil(len(active) / eta)]
+                    if results[index]['status'] != 'done']
+            epochs *= eta
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        _init_worker(None)
+
+    return results
@@ -0,0 +1,5 @@
+from online_cognacy_ident.cli import QueryCli
+
+
+if __name__ == '__main__':
+    QueryCli().run()
@@ -0,0 +1,5 @@
+from online_cognacy_ident.cli import TuneCli
+
+
+if __name__ == '__main__':
+    TuneCli().run()